@@ -0,0 +1,271 @@
+"""Times every pipeline stage on scaled copies of the shipped inputs and checks them against a baseline.
+
+Each stage runs at 1x, 10x and 100x the shipped demand (2,830 trips) in its own subprocess, so the
+peak RSS reported is that stage's alone. Scaled inputs are built from the shipped Excel / XML files
+with a fixed seed: rows are replicated with suffixed ids and jittered departures or coordinates.
+
+    python benchmarks/bench_pipeline.py                      # all stages, compare with baseline.json
+    python benchmarks/bench_pipeline.py --stages pt_assignment --scales 1 10 --repeat 5
+    python benchmarks/bench_pipeline.py --save-baseline      # record the current numbers
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pipeline.tables import read_table
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+BASELINE_FILE = Path(__file__).resolve().parent / "baseline.json"
+SCALES = (1, 10, 100)
+SEED = 2830
+# Slack before a stage counts as a regression: relative to the baseline, and an absolute wall
+# time floor so millisecond stages do not fail on timer noise
+WALL_TOLERANCE = 0.25
+WALL_FLOOR_S = 0.05
+RSS_TOLERANCE = 0.20
+
+STEP_4 = REPO_ROOT / "synthetic_demand/Procedures/Step_4"
+STEP_5 = REPO_ROOT / "synthetic_demand/Procedures/Step_5"
+BUS_DIR = REPO_ROOT / "buses_sumo"
+SHUTTLE_DIR = REPO_ROOT / "shuttles_sumo "
+
+
+def load_script(path, name):
+    """Imports one of the numbered pipeline scripts (file names are not valid module names)."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def replicate(df, scale, id_col=None):
+    """`scale` copies of df one after another; copy r > 0 gets '_r{r}' appended to id_col."""
+    copies = []
+    for r in range(scale):
+        copy = df.copy()
+        if id_col is not None and r:
+            copy[id_col] = copy[id_col].astype(str) + f"_r{r}"
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def jitter(values, rng, spread, low=None):
+    """values plus uniform noise in [-spread, spread], optionally clipped from below."""
+    values = np.asarray(values, dtype=float)
+    jittered = values + rng.uniform(-spread, spread, size=values.shape)
+    return jittered if low is None else jittered.clip(min=low)
+
+
+# --- STAGES ---
+# setup(scale, rng, workdir) builds the scaled inputs (untimed) and returns (run, items):
+# run() is the timed stage, items the number of trips it handles
+
+def setup_step_4(scale, rng, workdir):
+    step_4 = load_script(STEP_4 / "4_Spatial Distribution.py", "step_4")
+    zones = read_table(STEP_4 / "Data_From_Step_3.xlsx")
+    # A city of `scale` copies of the study area: every zone repeated under a new name
+    zones = replicate(zones, scale, id_col=zones.columns[0])
+    path = workdir / "zones.parquet"
+    zones.to_parquet(path)
+    distributor = step_4.TripDistributor(path)
+    items = int(np.rint(np.nan_to_num(zones[zones.columns[1]].to_numpy(dtype=float))).sum())
+    return distributor.distribute, items
+
+
+def setup_step_5(scale, rng, workdir):
+    os.chdir(STEP_5)
+    step_5 = load_script(STEP_5 / "5_convert_excel_trips_to_persons_plans.py", "step_5")
+    homes_df, attractions = step_5.load_homes(), step_5.load_attractions()
+    # Zone rows repeated: same blocks and homes, `scale` times the trips
+    trip_tables = [(replicate(read_table(path), scale), dest_name, dest_key)
+                   for path, dest_name, dest_key in step_5.TRIP_TABLES]
+    # Keep the unnamed last row of the real Step 4 output, which expand_trips must skip
+    trip_tables = [(pd.concat([df, pd.DataFrame({'name': [np.nan]})], ignore_index=True), dest_name, dest_key)
+                   for df, dest_name, dest_key in trip_tables]
+    items = sum(len(step_5.expand_trips(df, homes_df)[0]) for df, _, _ in trip_tables)
+    return lambda: step_5.generate_plans(trip_tables, homes_df, attractions, np.random.default_rng(SEED)), items
+
+
+def setup_pt_assignment(scale, rng, workdir):
+    step_1 = load_script(BUS_DIR / "Data/Step_1/1_trip_assignment_complete_with_reverse_path.py", "step_1")
+    analyzer = step_1.PTAnalyzer(str(BUS_DIR / "network.net.xml"), str(BUS_DIR / "stops.add.xml"),
+                                 str(BUS_DIR / "buses.rou.xml"))
+    plans = replicate(read_table(BUS_DIR / "Data/Step_1/personal_planes_from_4_step_model.xlsx"), scale)
+    if scale > 1:
+        plans['home_departure_time'] = jitter(plans['home_departure_time'], rng, 300, low=0).astype(np.int64)
+    return lambda: analyzer.assign_plans(plans), 2 * len(plans)
+
+
+def setup_edge_snapping(scale, rng, workdir):
+    from pipeline.edge_snapping import EdgeSnapper
+    snapper = EdgeSnapper.from_net(str(SHUTTLE_DIR / "network.net.xml"))
+    od_df = replicate(read_table(SHUTTLE_DIR / "Data/od.parquet"), scale, id_col='id')
+    home = od_df[['origin_x', 'origin_y']].to_numpy(dtype=float)
+    shop = od_df[['destination_x', 'destination_y']].to_numpy(dtype=float)
+    if scale > 1:
+        home = jitter(home, rng, 50)
+
+    def run():
+        # Same calls as Data/1_Generate_trips_roundtrip.py
+        return snapper.snap_directional(home, shop, k=5), snapper.snap_directional(shop, home, k=5)
+    return run, 2 * len(od_df)
+
+
+def setup_person_xml(scale, rng, workdir):
+    step_2 = load_script(BUS_DIR / "Data/Step_2/3_Generate_perspn_xml_trips.py", "step_2")
+    results = BUS_DIR / "Data/Step_2/results_from_step_1"
+    legs = []
+    for name in ("Home_shopping_person_info", "Shopping_home_person_info"):
+        df = replicate(read_table(results / f"{name}.parquet"), scale, id_col='id')
+        if scale > 1:
+            df['departure_time'] = jitter(df['departure_time'], rng, 300, low=0).astype(np.int64)
+        legs.append(df)
+    output = workdir / "persons.rou.xml"
+    return lambda: step_2.write_persons(step_2.person_trips(*legs), output), len(legs[0]) + len(legs[1])
+
+
+def setup_kpi_parsers(scale, rng, workdir):
+    from pipeline.run_scenarios import OUTPUTS, collect_kpis
+    # tripinfo.xml with the shipped records repeated `scale` times (ids are not looked at)
+    lines = (BUS_DIR / "output/tripinfo.xml").read_text().splitlines(keepends=True)
+    first = next(i for i, line in enumerate(lines) if line.lstrip().startswith("<tripinfos"))
+    last = max(i for i, line in enumerate(lines) if line.lstrip().startswith("</tripinfos"))
+    with open(workdir / OUTPUTS["tripinfo-output"], "w") as f:
+        f.writelines(lines[:first + 1])
+        for _ in range(scale):
+            f.writelines(lines[first + 1:last])
+        f.writelines(lines[last:])
+    shutil.copy(BUS_DIR / "output/statistics.xml", workdir / OUTPUTS["statistic-output"])
+    items = scale * sum(line.count("<ride ") for line in lines[first + 1:last])
+    return lambda: collect_kpis(workdir), items
+
+
+STAGES = {
+    "step_4": setup_step_4,
+    "step_5": setup_step_5,
+    "pt_assignment": setup_pt_assignment,
+    "edge_snapping": setup_edge_snapping,
+    "person_xml": setup_person_xml,
+    "kpi_parsers": setup_kpi_parsers,
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def measure(stage, scale, repeat=3):
+    """Runs one stage at one scale in this process: best wall time of `repeat` runs, peak RSS, throughput."""
+    with tempfile.TemporaryDirectory() as workdir:
+        run, items = STAGES[stage](scale, np.random.default_rng([SEED, scale]), Path(workdir))
+        setup_rss = peak_rss_mb()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    wall = min(times)
+    return {"stage": stage, "scale": scale, "items": items, "wall_s": wall, "wall_median_s": float(np.median(times)),
+            "items_per_s": items / wall if wall > 0 else float("inf"),
+            "setup_rss_mb": setup_rss, "peak_rss_mb": peak_rss_mb()}
+
+
+def measure_isolated(stage, scale, repeat=3, timeout=None):
+    """measure() in a fresh interpreter, so earlier stages do not inflate the peak RSS."""
+    cmd = [sys.executable, __file__, "--child", stage, str(scale), "--repeat", str(repeat)]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"stage": stage, "scale": scale, "error": f"timeout after {timeout}s"}
+    if proc.returncode != 0:
+        return {"stage": stage, "scale": scale, "error": proc.stderr.strip().splitlines()[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, wall_tolerance=WALL_TOLERANCE, rss_tolerance=RSS_TOLERANCE):
+    """Adds baseline columns and a 'regression' flag (slower or bigger than the tolerances allow)."""
+    base = pd.DataFrame(baseline.get("results", []), columns=["stage", "scale", "wall_s", "peak_rss_mb"])
+    df = results.merge(base.rename(columns={"wall_s": "base_wall_s", "peak_rss_mb": "base_rss_mb"}),
+                       on=["stage", "scale"], how="left")
+    df["wall_ratio"] = df["wall_s"] / df["base_wall_s"]
+    df["rss_ratio"] = df["peak_rss_mb"] / df["base_rss_mb"]
+    slower = (df["wall_ratio"] > 1 + wall_tolerance) & (df["wall_s"] - df["base_wall_s"] > WALL_FLOOR_S)
+    df["regression"] = slower | (df["rss_ratio"] > 1 + rss_tolerance)
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--scales", nargs="+", type=int, default=list(SCALES))
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage; the fastest counts")
+    parser.add_argument("--timeout", type=float, default=None, help="time limit per stage and scale in seconds")
+    parser.add_argument("--baseline", default=str(BASELINE_FILE))
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--wall-tolerance", type=float, default=WALL_TOLERANCE,
+                        help="allowed relative slowdown (default: %(default)s)")
+    parser.add_argument("--rss-tolerance", type=float, default=RSS_TOLERANCE,
+                        help="allowed relative peak RSS growth (default: %(default)s)")
+    parser.add_argument("--out", default=None, help="also save the results table (.parquet/.csv)")
+    parser.add_argument("--child", nargs=2, metavar=("STAGE", "SCALE"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure(args.child[0], int(args.child[1]), args.repeat)))
+        return
+
+    rows = []
+    for stage in args.stages:
+        for scale in args.scales:
+            row = measure_isolated(stage, scale, args.repeat, args.timeout)
+            status = row.get("error") or f"{row['wall_s']:.3f} s, {row['peak_rss_mb']:.0f} MB"
+            print(f"{stage} x{scale}: {status}")
+            rows.append(row)
+    results = pd.DataFrame(rows)
+    failed = results["error"].notna() if "error" in results else pd.Series(False, index=results.index)
+    if args.out:
+        from pipeline.tables import write_table
+        write_table(results, args.out)
+
+    if args.save_baseline:
+        ok = results[~failed]
+        baseline = {"machine": {"python": platform.python_version(), "platform": platform.platform(),
+                                "processor": platform.processor() or platform.machine(), "cpus": os.cpu_count()},
+                    "results": ok[["stage", "scale", "items", "wall_s", "peak_rss_mb"]].to_dict("records")}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=1)
+        print(f"Baseline of {len(ok)} measurements saved to: {args.baseline}")
+        return 1 if failed.any() else 0
+
+    baseline = {}
+    if Path(args.baseline).exists():
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report = compare(results[~failed], baseline, args.wall_tolerance, args.rss_tolerance)
+    columns = ["stage", "scale", "items", "wall_s", "items_per_s", "peak_rss_mb", "wall_ratio", "rss_ratio", "regression"]
+    print()
+    print(report[columns].to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    regressions = report[report["regression"]]
+    for row in regressions.itertuples():
+        print(f"REGRESSION {row.stage} x{row.scale}: {row.wall_s:.3f} s (baseline {row.base_wall_s:.3f} s), "
+              f"{row.peak_rss_mb:.0f} MB (baseline {row.base_rss_mb:.0f} MB)")
+    return 1 if failed.any() or len(regressions) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
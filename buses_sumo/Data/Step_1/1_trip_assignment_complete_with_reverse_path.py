@@ -1,6 +1,8 @@
+import argparse
 import os
 import sys
 import math
+import numpy as np
 import pandas as pd
 import sumolib
 from pathlib import Path
@@ -13,140 +15,460 @@ if 'SUMO_HOME' in os.environ:
     sys.path.append(os.path.join(os.environ['SUMO_HOME'], 'tools'))
 else:
     sys.path.append('/usr/local/share/sumo/tools')
+sys.path.append(str(Path(__file__).resolve().parents[3]))
+from pipeline.catchment import CatchmentTable, catchment_path, load_catchments
+from pipeline.journey_cache import JourneyCache
+from pipeline.net_cache import CACHE_DIR_NAME, file_hash, load_network
+from pipeline.parallel_assign import assign_parallel
+from pipeline.raptor import Raptor
+from pipeline.tables import read_table, write_table
+from pipeline.walk_network import WalkNetwork
+
+WALK_METRICS = ('euclidean', 'network')
+# Columns of one planned leg in the Step 1 result files ('transfers' and 'rides' only with --max-transfers)
+ROUTE_FIELDS = ['bus_line_selected', 'bus_id_selected', 'start_stop_selected', 'start_walk_distance', 'start_walk_time',
+                'person_arrival_start_stop', 'bus_arrival_start_stop', 'last_stop_selected', 'bus_arrival_last_stop',
+                'end_walk_distance', 'end_walk_time', 'transfers', 'rides']
+
+def plan_locations(df):
+    """Catchment keys of every plan's home ('home:<house_id>') and destination ('dest:<name>'), or None."""
+    if 'house_id' not in df.columns or 'name_destination' not in df.columns:
+        return None, None
+    return ('home:' + df['house_id'].astype(str)).to_numpy(), ('dest:' + df['name_destination'].astype(str)).to_numpy()
 
 class PTAnalyzer:
-    def __init__(self, net_file, stops_file, buses_file):
+    def __init__(self, net_file, stops_file, buses_file, walk_metric='euclidean'):
         print(f"Loading files...")
-        net_abs = os.path.abspath(net_file)
-        net_uri = Path(net_abs).resolve().as_uri()
-        self.net = sumolib.net.readNet(net_uri)
-        self.bus_stops = list(sumolib.xml.parse(os.path.abspath(stops_file), 'busStop'))
+        self.net = load_network(os.path.abspath(net_file), os.path.abspath(stops_file))
+        # 'network': walks to the stops along the streets (pipeline/walk_network.py) instead of straight lines
+        if walk_metric not in WALK_METRICS:
+            raise ValueError(f"Unknown walk metric '{walk_metric}' (expected one of {', '.join(WALK_METRICS)})")
+        self.walk = WalkNetwork.from_net(os.path.abspath(net_file), os.path.abspath(stops_file)) if walk_metric == 'network' else None
+        self.walk_metric, self.files = walk_metric, (os.path.abspath(net_file), os.path.abspath(stops_file))
+        self.catchments = None
+        self.journeys = JourneyCache()
+        self.raptor = None
         self.bus_trips = list(sumolib.xml.parse(os.path.abspath(buses_file), 'trip'))
         self.stop_coords = self._map_stop_coordinates()
         self.WALK_SPEED = 1.1  
+        self.TRANSFER_WALK = 300  # longest walk between two stops when changing buses [m]
+        self._compile_timetable()
+        self._compile_stop_pairs()
+
+    # Arrays worker processes share with the parent (pipeline/parallel_assign.py)
+    SHARED_ARRAYS = ('stop_pos', 'stop_depart', 'stop_arrive', 'dep_trip', 'dep_time', 'dep_offsets',
+                     'pair_o', 'pair_d', 'pair_offsets', 'pair_dep', 'pair_best')
+    SHARED_CATCHMENT = ('xy', 'offsets', 'stop', 'walk')
+
+    def shared_state(self):
+        """(numpy arrays, small picklable state) from which from_shared rebuilds this analyzer in another process."""
+        arrays = {name: getattr(self, name) for name in self.SHARED_ARRAYS}
+        state = {name: getattr(self, name) for name in ('stop_ids', 'stop_coords', 'trip_ids', 'trip_lines', 'WALK_SPEED',
+                                                        'TRANSFER_WALK', 'walk_metric', 'files', 'raptor')}
+        if self.catchments is not None:
+            arrays.update({f"catchment_{name}": getattr(self.catchments, name) for name in self.SHARED_CATCHMENT})
+            state['catchments'] = (self.catchments.keys, self.catchments.max_walk)
+        return arrays, state
+
+    @classmethod
+    def from_shared(cls, arrays, state):
+        """Analyzer around arrays mapped from another process: no XML parsing, the walk network comes from .netcache."""
+        self = cls.__new__(cls)
+        state = dict(state)
+        catchments = state.pop('catchments', None)
+        self.__dict__.update(state)
+        self.__dict__.update({name: arrays[name] for name in self.SHARED_ARRAYS})
+        self.stop_index = {s_id: i for i, s_id in enumerate(self.stop_ids)}
+        self.walk = WalkNetwork.from_net(*self.files) if self.walk_metric == 'network' else None
+        self.journeys = JourneyCache()
+        self.catchments = None
+        if catchments is not None:
+            keys, max_walk = catchments
+            self.catchments = CatchmentTable(keys, *(arrays[f"catchment_{name}"] for name in self.SHARED_CATCHMENT), max_walk)
+        return self
 
     def _map_stop_coordinates(self):
-        coords = {}
-        for stop in self.bus_stops:
-            lane_id = stop.lane
-            edge_id = lane_id.rsplit('_', 1)[0]
-            lane_idx = int(lane_id.rsplit('_', 1)[1])
-            edge = self.net.getEdge(edge_id)
-            lane = edge.getLanes()[lane_idx]
-            mid_pos = (float(stop.startPos) + float(stop.endPos)) / 2
-            coords[stop.id] = sumolib.geomhelper.positionAtShapeOffset(lane.getShape(), mid_pos)
-        return coords
-
-    def find_best_route(self, origin_xy, dest_xy, person_depart, max_walk=600):
+        # Mid-point of every busStop on its lane, precomputed by the network cache
+        return {s_id: tuple(xy) for s_id, xy in zip(self.net.stop_id.tolist(), self.net.stop_xy.tolist())}
+
+    def _compile_timetable(self):
+        """Indexes buses.rou.xml once: dense trip x stop arrays plus per-stop departures sorted by time."""
+        self.stop_ids = list(self.stop_coords)
+        self.stop_index = {s_id: i for i, s_id in enumerate(self.stop_ids)}
+        self.trip_ids = [trip.id for trip in self.bus_trips]
+        self.trip_lines = [trip.type for trip in self.bus_trips]
+
+        n_trips, n_stops = len(self.bus_trips), len(self.stop_ids)
+        self.stop_pos = np.full((n_trips, n_stops), -1, dtype=np.int32)
+        self.stop_depart = np.full((n_trips, n_stops), np.nan)
+        self.stop_arrive = np.full((n_trips, n_stops), np.nan)
+        for t, trip in enumerate(self.bus_trips):
+            for pos, s in enumerate(trip.stop):
+                s_idx = self.stop_index[s.busStop]
+                if self.stop_pos[t, s_idx] < 0:
+                    self.stop_pos[t, s_idx] = pos
+                self.stop_depart[t, s_idx] = float(s.until)
+                self.stop_arrive[t, s_idx] = float(s.until) - float(s.duration)
+
+        # Per-stop departures sorted by time (CSR layout: stop s owns
+        # dep_time[dep_offsets[s]:dep_offsets[s + 1]]), ties kept in trip order
+        served_stop, served_trip = np.nonzero(self.stop_pos.T >= 0)
+        order = np.lexsort((served_trip, self.stop_depart[served_trip, served_stop], served_stop))
+        self.dep_trip = served_trip[order].astype(np.int32)
+        self.dep_time = self.stop_depart[self.dep_trip, served_stop[order]]
+        self.dep_offsets = np.searchsorted(served_stop[order], np.arange(n_stops + 1)).astype(np.int64)
+
+    def _compile_stop_pairs(self):
+        """Indexes every (board, exit) stop pair served in that order by some trip, for best_routes.
+
+        Pair g owns pair_dep[pair_offsets[g]:pair_offsets[g + 1]] (departures at the board stop,
+        sorted); pair_best holds the earliest-arriving trip among that departure and all later ones.
+        """
+        entries = []
+        for t in range(len(self.trip_ids)):
+            served = np.flatnonzero(self.stop_pos[t] >= 0)
+            before = self.stop_pos[t, served][:, None] < self.stop_pos[t, served][None, :]
+            o, d = np.nonzero(before)
+            entries.append(np.column_stack([np.full(len(o), t), served[o], served[d]]))
+        trip, o, d = np.concatenate(entries).T
+        dep, arr = self.stop_depart[trip, o], self.stop_arrive[trip, d]
+
+        order = np.lexsort((trip, dep, d, o))
+        trip, o, d, dep, arr = trip[order], o[order], d[order], dep[order], arr[order]
+        new_pair = np.r_[True, (o[1:] != o[:-1]) | (d[1:] != d[:-1])]
+        starts, group = np.flatnonzero(new_pair), np.cumsum(new_pair) - 1
+
+        # Suffix minimum of (arrival, trip) within each pair: earlier pairs get smaller keys,
+        # so a single reversed running minimum never leaks across pair boundaries
+        by_arrival = np.lexsort((trip, arr))
+        arrival_rank = np.empty(len(trip), dtype=np.int64)
+        arrival_rank[by_arrival] = np.arange(len(trip))
+        key = group * len(trip) + arrival_rank
+        suffix_min = np.minimum.accumulate(key[::-1])[::-1]
+
+        self.pair_o, self.pair_d = o[starts], d[starts]
+        self.pair_offsets = np.r_[starts, len(trip)]
+        self.pair_dep = dep
+        self.pair_best = trip[by_arrival[suffix_min % len(trip)]]
+
+    def stop_walks(self, points_xy):
+        """(n, stops) walk distances from points to every stop in stop_ids order (straight or along the network)."""
+        points_xy = np.atleast_2d(np.asarray(points_xy, dtype=float))
+        if self.walk is not None:
+            return self.walk.stop_distances(points_xy, self.stop_ids)
+        stop_xy = np.array([self.stop_coords[s_id] for s_id in self.stop_ids])
+        return np.sqrt((points_xy[:, 0, None] - stop_xy[:, 0])**2 + (points_xy[:, 1, None] - stop_xy[:, 1])**2)
+
+    def load_catchments(self, keys, points_xy, max_walk=600):
+        """Loads (or builds and caches) the catchment table of the given locations for assign_plans."""
+        points_xy = np.asarray(points_xy, dtype=float).reshape(-1, 2)
+        path = catchment_path(Path(self.files[0]).parent / CACHE_DIR_NAME, [file_hash(f) for f in self.files],
+                              self.walk_metric, max_walk, keys, points_xy)
+        self.catchments = load_catchments(path, keys, points_xy, self.stop_walks, max_walk)
+        return self.catchments
+
+    def catchment_walks(self, keys, points_xy, max_walk=600):
+        """stop_walks() read from the catchment table where possible (inf beyond its max_walk).
+
+        Points whose key is not in the table, or whose coordinates differ from it, are computed.
+        """
+        points_xy = np.atleast_2d(np.asarray(points_xy, dtype=float))
+        table = self.catchments
+        if table is None or max_walk > table.max_walk:
+            return self.stop_walks(points_xy)
+        rows = table.rows(keys, points_xy)
+        walks = np.empty((len(points_xy), len(self.stop_ids)))
+        hit = rows >= 0
+        if hit.any():
+            walks[hit] = table.dense(rows[hit], len(self.stop_ids))
+        if not hit.all():
+            walks[~hit] = self.stop_walks(points_xy[~hit])
+        return walks
+
+    def _journey_options(self, near_origin, d_idx, earliest):
+        """(trip, origin rank, exit rank, bus departure) of every trip leaving an origin stop at `earliest` or later."""
+        cand_trip, cand_o, cand_d = [], [], []
+        for o_rank, o_stop in enumerate(near_origin):
+            o_idx = self.stop_index[o_stop['id']]
+            lo, hi = self.dep_offsets[o_idx], self.dep_offsets[o_idx + 1]
+            first = lo + np.searchsorted(self.dep_time[lo:hi], earliest, side='left')
+            trips = self.dep_trip[first:hi]
+            k, d_rank = np.nonzero(self.stop_pos[trips][:, d_idx] > self.stop_pos[trips, o_idx][:, None])
+            cand_trip.append(trips[k])
+            cand_o.append(np.full(len(k), o_rank))
+            cand_d.append(d_rank)
+        t, o, d = np.concatenate(cand_trip), np.concatenate(cand_o), np.concatenate(cand_d)
+        o_idx = np.array([self.stop_index[s['id']] for s in near_origin])[o]
+        return t, o, d, self.stop_depart[t, o_idx]
+
+    def find_best_route(self, origin_xy, dest_xy, person_depart, max_walk=600, limit=None):
         near_origin, near_dest = [], []
-        for s_id, s_xy in self.stop_coords.items():
-            d_o, d_d = get_dist(origin_xy, s_xy), get_dist(dest_xy, s_xy)
+        if self.walk is not None:
+            walks = self.stop_walks([origin_xy, dest_xy]).tolist()
+        else:
+            walks = [[get_dist(origin_xy, s_xy) for s_xy in self.stop_coords.values()],
+                     [get_dist(dest_xy, s_xy) for s_xy in self.stop_coords.values()]]
+        for s_id, d_o, d_d in zip(self.stop_coords, walks[0], walks[1]):
             if d_o <= max_walk: near_origin.append({'id': s_id, 'dist': d_o})
             if d_d <= max_walk: near_dest.append({'id': s_id, 'dist': d_d})
+        if not near_origin or not near_dest:
+            return []
+
+        d_idx = np.array([self.stop_index[d['id']] for d in near_dest])
+        w1_dist = np.array([o['dist'] for o in near_origin])
+        w2_dist = np.array([d['dist'] for d in near_dest])
+        w1_s, w2_s = w1_dist / self.WALK_SPEED, w2_dist / self.WALK_SPEED
+        person_reaches_stop = person_depart + w1_s
+
+        # Candidate trips from the start of the departure bucket, memoized per (origin stops, destination
+        # stops, bucket) and shared by all nearby homes; cut to the buses catchable at the exact departure
+        key = self.journeys.key(tuple(s['id'] for s in near_origin), tuple(s['id'] for s in near_dest), person_depart)
+        options = self.journeys.get(key)
+        if options is None:
+            options = self._journey_options(near_origin, d_idx, self.journeys.bucket_start(person_depart))
+            self.journeys.put(key, options)
+        t, o, d, bus_depart_stop = options
+        catchable = bus_depart_stop >= person_reaches_stop[o]
+        t, o, d = t[catchable], o[catchable], d[catchable]
+        if not len(t):
+            return []
+
+        o_idx = np.array([self.stop_index[s['id']] for s in near_origin])[o]
+        bus_depart_stop = self.stop_depart[t, o_idx]
+        bus_arrival_dest = self.stop_arrive[t, d_idx[d]]
+        total_time_s = w1_s[o] + (bus_depart_stop - person_reaches_stop[o]) + (bus_arrival_dest - bus_depart_stop) + w2_s[d]
+        rank_score = total_time_s + (w1_dist[o] * 0.5)
+
+        # Same ordering as a trip-by-trip scan: rank, then trip, origin and exit stop order
+        order = np.lexsort((d, o, t, rank_score))[:limit]
+        return [{
+            'bus_id': self.trip_ids[t[i]], 'line': self.trip_lines[t[i]],
+            'board': near_origin[o[i]]['id'], 'exit': near_dest[d[i]]['id'],
+            'w1_dist': round(near_origin[o[i]]['dist'], 1), 'w1_s': int(w1_s[o[i]]),
+            'arrival_at_stop': int(person_reaches_stop[o[i]]),
+            'bus_depart_stop': int(bus_depart_stop[i]), 'bus_arrival_dest': int(bus_arrival_dest[i]),
+            'w2_dist': round(near_dest[d[i]]['dist'], 1), 'w2_s': int(w2_s[d[i]]), 'rank_score': float(rank_score[i])
+        } for i in order]
+
+    def best_routes(self, origins_xy, dests_xy, person_departs, max_walk=600, walks=None):
+        """Vectorized find_best_route(..., limit=1) for many persons at once.
+
+        `walks` optionally gives the precomputed (origin, destination) person x stop walk distances.
+        Returns a dict of arrays (one entry per person); 'trip' is -1 where no route exists.
+        """
+        origins_xy, dests_xy = np.asarray(origins_xy, dtype=float), np.asarray(dests_xy, dtype=float)
+        person_departs = np.asarray(person_departs, dtype=float)
+        n_persons, n_stops = len(origins_xy), len(self.stop_ids)
+
+        # Person x stop walk distances for both ends of the leg
+        w1_dist, w2_dist = walks if walks is not None else (self.stop_walks(origins_xy), self.stop_walks(dests_xy))
+        near_origin, near_dest = w1_dist <= max_walk, w2_dist <= max_walk
+        w1_s, w2_s = w1_dist / self.WALK_SPEED, w2_dist / self.WALK_SPEED
+        person_reaches_stop = person_departs[:, None] + w1_s
+
+        best_rank = np.full(n_persons, np.inf)
+        best_key = np.full(n_persons, np.iinfo(np.int64).max)
+        best_trip = np.full(n_persons, -1)
+        best_o = np.zeros(n_persons, dtype=int)
+        best_d = np.zeros(n_persons, dtype=int)
+        persons_at = {}
+        for g, (o, d) in enumerate(zip(self.pair_o, self.pair_d)):
+            if o not in persons_at:
+                persons_at[o] = np.flatnonzero(near_origin[:, o])
+            p = persons_at[o][near_dest[persons_at[o], d]]
+            if not len(p):
+                continue
+            lo, hi = self.pair_offsets[g], self.pair_offsets[g + 1]
+            first = lo + np.searchsorted(self.pair_dep[lo:hi], person_reaches_stop[p, o], side='left')
+            p, first = p[first < hi], first[first < hi]
+            t = self.pair_best[first]
+
+            bus_depart_stop, bus_arrival_dest = self.stop_depart[t, o], self.stop_arrive[t, d]
+            total_time_s = w1_s[p, o] + (bus_depart_stop - person_reaches_stop[p, o]) + (bus_arrival_dest - bus_depart_stop) + w2_s[p, d]
+            rank_score = total_time_s + (w1_dist[p, o] * 0.5)
+            # Ties resolve like find_best_route: trip order, then origin and exit stop order
+            key = (t * n_stops + o) * n_stops + d
+            better = (rank_score < best_rank[p]) | ((rank_score == best_rank[p]) & (key < best_key[p]))
+            p = p[better]
+            best_rank[p], best_key[p], best_trip[p] = rank_score[better], key[better], t[better]
+            best_o[p], best_d[p] = o, d
 
-        possible_options = []
-        for trip in self.bus_trips:
-            trip_schedule = {s.busStop: (float(s.until), float(s.duration)) for s in trip.stop}
-            trip_stop_ids = [s.busStop for s in trip.stop]
-            for o_stop in near_origin:
-                if o_stop['id'] in trip_schedule:
-                    bus_depart_stop = trip_schedule[o_stop['id']][0]
-                    w1_dist = o_stop['dist']
-                    w1_s = w1_dist / self.WALK_SPEED
-                    person_reaches_stop = person_depart + w1_s
-                    if person_reaches_stop > bus_depart_stop: continue 
-
-                    for d_stop in near_dest:
-                        if d_stop['id'] in trip_schedule:
-                            idx_o, idx_d = trip_stop_ids.index(o_stop['id']), trip_stop_ids.index(d_stop['id'])
-                            if idx_o < idx_d:
-                                bus_until_dest, bus_dur_dest = trip_schedule[d_stop['id']]
-                                bus_arrival_dest = bus_until_dest - bus_dur_dest
-                                w2_dist = d_stop['dist']
-                                w2_s = w2_dist / self.WALK_SPEED
-                                total_time_s = w1_s + (bus_depart_stop - person_reaches_stop) + (bus_arrival_dest - bus_depart_stop) + w2_s
-                                possible_options.append({
-                                    'bus_id': trip.id, 'line': trip.type, 'board': o_stop['id'], 'exit': d_stop['id'],
-                                    'w1_dist': round(w1_dist, 1), 'w1_s': int(w1_s), 'arrival_at_stop': int(person_reaches_stop),
-                                    'bus_depart_stop': int(bus_depart_stop), 'bus_arrival_dest': int(bus_arrival_dest),
-                                    'w2_dist': round(w2_dist, 1), 'w2_s': int(w2_s), 'rank_score': total_time_s + (w1_dist * 0.5)
-                                })
-        return sorted(possible_options, key=lambda x: x['rank_score'])
+        rows = np.arange(n_persons)
+        return {
+            'trip': best_trip, 'board': best_o, 'exit': best_d,
+            'w1_dist': w1_dist[rows, best_o], 'w1_s': w1_s[rows, best_o],
+            'arrival_at_stop': person_reaches_stop[rows, best_o],
+            'bus_depart_stop': self.stop_depart[best_trip, best_o],
+            'bus_arrival_dest': self.stop_arrive[best_trip, best_d],
+            'w2_dist': w2_dist[rows, best_d], 'w2_s': w2_s[rows, best_d], 'rank_score': best_rank,
+        }
+
+    def _compile_raptor(self):
+        """Transfer-aware router over the same timetable, with footpaths between stops up to TRANSFER_WALK."""
+        trips = [(trip.id, trip.type, [(s.busStop, float(s.until) - float(s.duration), float(s.until)) for s in trip.stop])
+                 for trip in self.bus_trips]
+        stop_walks = self.stop_walks([self.stop_coords[s_id] for s_id in self.stop_ids])
+        footpaths = {s_id: [(self.stop_ids[j], stop_walks[i, j]) for j in np.flatnonzero(stop_walks[i] <= self.TRANSFER_WALK)]
+                     for i, s_id in enumerate(self.stop_ids)}
+        self.raptor = Raptor(self.stop_ids, trips, footpaths, walk_speed=self.WALK_SPEED)
+        return self.raptor
+
+    def find_journeys(self, origin_xy, dest_xy, person_depart, max_walk=600, max_transfers=2, walks=None):
+        """Pareto set (arrival x transfers x walk) of bus journeys with up to max_transfers changes (RAPTOR).
+
+        `walks` optionally gives the precomputed (origin, destination) walk distances to every stop.
+        """
+        if self.raptor is None:
+            self._compile_raptor()
+        w1, w2 = walks if walks is not None else self.stop_walks([origin_xy, dest_xy])
+        access = {self.stop_ids[i]: w1[i] for i in np.flatnonzero(w1 <= max_walk)}
+        egress = {self.stop_ids[i]: w2[i] for i in np.flatnonzero(w2 <= max_walk)}
+        if not access or not egress:
+            return []
+        return self.raptor.query(access, egress, person_depart, max_transfers)
+
+    def _with_transfers(self, frame, origins_xy, dests_xy, walks, max_walk, max_transfers):
+        """Adds 'transfers' and 'rides' to _route_columns output; 'No Route' rows are re-planned with find_journeys.
+
+        Among the Pareto journeys the one with the best rank_score (as in find_best_route) is kept;
+        'rides' lists 'trip:board:exit' per bus ride, space separated.
+        """
+        frame = frame.assign(transfers=0, rides=[f"{bus}:{board}:{exit_}" if bus != 'No Route' else '' for bus, board, exit_ in zip(
+            frame['bus_id_selected'], frame['start_stop_selected'], frame['last_stop_selected'])])
+        w1_all, w2_all = walks
+        for row in np.flatnonzero((frame['bus_id_selected'] == 'No Route').to_numpy()):
+            depart = frame['departure_time'].iat[row]
+            journeys = self.find_journeys(origins_xy[row], dests_xy[row], depart, max_walk, max_transfers,
+                                          walks=(w1_all[row], w2_all[row]))
+            if not journeys:
+                continue
+            j = min(journeys, key=lambda j: (j['arrival'] - depart + j['legs'][0]['dist'] * 0.5, j['transfers'], j['walk']))
+            rides = [leg for leg in j['legs'] if leg['mode'] == 'bus']
+            access = j['legs'][0]['dist']
+            egress = sum(leg['dist'] for leg in j['legs'][j['legs'].index(rides[-1]) + 1:])
+            values = ['+'.join(r['line'] for r in rides), '+'.join(r['trip'] for r in rides), rides[0]['board'],
+                      round(access, 1), int(access / self.WALK_SPEED), int(depart + access / self.WALK_SPEED),
+                      int(rides[0]['depart']), rides[-1]['exit'], int(rides[-1]['arrive']), round(egress, 1),
+                      int(egress / self.WALK_SPEED), j['transfers'],
+                      ' '.join(f"{r['trip']}:{r['board']}:{r['exit']}" for r in rides)]
+            for col, value in zip(ROUTE_FIELDS, values):
+                frame.iat[row, frame.columns.get_loc(col)] = value
+        return frame
+
+    def _route_columns(self, trip_ids, departs, best):
+        """Formats best_routes output like the per-row Home_shopping/Shopping_home person info."""
+        found = best['trip'] >= 0
+        trip = np.where(found, best['trip'], 0)
+
+        def pick(values, missing):
+            return np.where(found, values, missing)
+
+        def as_int(values):
+            return pick(np.trunc(np.where(found, values, 0)), 0).astype(np.int64)
+
+        return pd.DataFrame({
+            'id': trip_ids, 'departure_time': departs,
+            'bus_line_selected': pick(np.array(self.trip_lines, dtype=object)[trip], 'No Route'),
+            'bus_id_selected': pick(np.array(self.trip_ids, dtype=object)[trip], 'No Route'),
+            'start_stop_selected': pick(np.array(self.stop_ids, dtype=object)[best['board']], 'N/A'),
+            'start_walk_distance': pick(np.round(best['w1_dist'], 1), 0),
+            'start_walk_time': as_int(best['w1_s']),
+            'person_arrival_start_stop': as_int(best['arrival_at_stop']),
+            'bus_arrival_start_stop': as_int(best['bus_depart_stop']),
+            'last_stop_selected': pick(np.array(self.stop_ids, dtype=object)[best['exit']], 'N/A'),
+            'bus_arrival_last_stop': as_int(best['bus_arrival_dest']),
+            'end_walk_distance': pick(np.round(best['w2_dist'], 1), 0),
+            'end_walk_time': as_int(best['w2_s'])
+        })
+
+    def assign_plans(self, df, max_walk=600, max_transfers=0):
+        """Assigns outbound and return legs for a whole personal_planes frame.
+
+        Returns (outbound, return, od) frames with the same columns as the Step 1 result files;
+        the return leg departs after bus arrival + end walk + shopping time, as in the row-wise loop.
+        With max_transfers > 0, legs without a direct bus are planned with transfers (find_journeys).
+        """
+        trip_ids = np.array([f"t_{idx}" for idx in df.index], dtype=object)
+        home_xy = df[['origin_x', 'origin_y']].to_numpy(dtype=float)
+        shop_xy = df[['destination_x', 'destination_y']].to_numpy(dtype=float)
+        if 'shopper agent' in df.columns:
+            shop_duration = df['shopper agent'].to_numpy()
+        elif 'shopping time' in df.columns:
+            shop_duration = df['shopping time'].to_numpy()
+        else:
+            shop_duration = np.zeros(len(df), dtype=np.int64)
+
+        # Walks to the stops: read from the catchment table by house and attraction when loaded
+        home_keys, shop_keys = plan_locations(df)
+        if home_keys is not None:
+            home_walks, shop_walks = self.catchment_walks(home_keys, home_xy, max_walk), self.catchment_walks(shop_keys, shop_xy, max_walk)
+        else:
+            home_walks, shop_walks = self.stop_walks(home_xy), self.stop_walks(shop_xy)
+
+        # 1. OUTBOUND (Home -> Shopping)
+        departs = df['home_departure_time'].to_numpy()
+        outbound = self._route_columns(trip_ids, departs, self.best_routes(home_xy, shop_xy, departs, max_walk,
+                                                                           walks=(home_walks, shop_walks)))
+        if max_transfers:
+            outbound = self._with_transfers(outbound, home_xy, shop_xy, (home_walks, shop_walks), max_walk, max_transfers)
+
+        # 2. RETURN (Shopping -> Home), only for persons who reached the shop by bus
+        has_out = (outbound['bus_id_selected'] != 'No Route').to_numpy()
+        return_depart = (outbound['bus_arrival_last_stop'].to_numpy() + outbound['end_walk_time'].to_numpy() + shop_duration)[has_out]
+        returns = self._route_columns(trip_ids[has_out], return_depart,
+                                      self.best_routes(shop_xy[has_out], home_xy[has_out], return_depart, max_walk,
+                                                       walks=(shop_walks[has_out], home_walks[has_out])))
+        if max_transfers:
+            returns = self._with_transfers(returns, shop_xy[has_out], home_xy[has_out],
+                                           (shop_walks[has_out], home_walks[has_out]), max_walk, max_transfers)
+
+        # 3. OD DATA
+        od = pd.DataFrame({
+            'id': trip_ids, 'name_origin': df['name_block'].to_numpy(),
+            'origin_x': df['origin_x'].to_numpy(), 'origin_y': df['origin_y'].to_numpy(),
+            'name_destination': df['name_destination'].to_numpy() if 'name_destination' in df.columns else trip_ids,
+            'destination_x': df['destination_x'].to_numpy(), 'destination_y': df['destination_y'].to_numpy(),
+            'shopping time': shop_duration
+        })
+        return outbound, returns, od
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Step 1: bus trip assignment of the personal plans")
+    parser.add_argument('--walk-metric', default='euclidean', choices=WALK_METRICS,
+                        help="walk distance to the stops: straight line or along the street network")
+    parser.add_argument('--max-transfers', type=int, default=0,
+                        help="plan legs without a direct bus with up to this many transfers (RAPTOR); 0 keeps direct trips only")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="assign the persons in parallel over this many processes (0: all cores)")
+    args = parser.parse_args()
+
     SCRIPT_DIR = Path(__file__).resolve().parent
     # Go up 2 levels (Step_1 -> Data -> buses_sumo) to find network files
     PROJECT_ROOT = SCRIPT_DIR.parent.parent 
     NET, STOPS, BUSES = str(PROJECT_ROOT/"network.net.xml"), str(PROJECT_ROOT/"stops.add.xml"), str(PROJECT_ROOT/"buses.rou.xml")
     
-    # Input file is in the same folder as the script (Data/Step_1)
-    INPUT_FILE = str(SCRIPT_DIR / "personal_planes_from_4_step_model.xlsx")
+    # Input file is in the same folder as the script (Data/Step_1); .parquet, falling back to the .xlsx handoff
+    INPUT_FILE = str(SCRIPT_DIR / "personal_planes_from_4_step_model.parquet")
 
-    analyzer = PTAnalyzer(NET, STOPS, BUSES)
-    df = pd.read_excel(INPUT_FILE)
-    
-    outbound_rows, return_rows, od_rows = [], [], []
-
-    for idx, row in df.iterrows():
-        trip_id = f"t_{idx}"
-        home_xy = (row['origin_x'], row['origin_y'])
-        shop_xy = (row['destination_x'], row['destination_y'])
-        shop_duration = row.get('shopper agent', row.get('shopping time', 0))
-        
-        # 1. GENERATE OUTBOUND (Home -> Shopping)
-        out_best = analyzer.find_best_route(home_xy, shop_xy, person_depart=row['home_departure_time'])
-        best_o = out_best[0] if out_best else None
-        
-        outbound_rows.append({
-            'id': trip_id, 'departure_time': row['home_departure_time'],
-            'bus_line_selected': best_o['line'] if best_o else 'No Route',
-            'bus_id_selected': best_o['bus_id'] if best_o else 'No Route',
-            'start_stop_selected': best_o['board'] if best_o else 'N/A',
-            'start_walk_distance': best_o['w1_dist'] if best_o else 0,
-            'start_walk_time': best_o['w1_s'] if best_o else 0,
-            'person_arrival_start_stop': best_o['arrival_at_stop'] if best_o else 0,
-            'bus_arrival_start_stop': best_o['bus_depart_stop'] if best_o else 0,
-            'last_stop_selected': best_o['exit'] if best_o else 'N/A',
-            'bus_arrival_last_stop': best_o['bus_arrival_dest'] if best_o else 0,
-            'end_walk_distance': best_o['w2_dist'] if best_o else 0,
-            'end_walk_time': best_o['w2_s'] if best_o else 0
-        })
-
-        # 2. GENERATE RETURN (Shopping -> Home)
-        # Logic: Start at Shopping Dest, End at Home Origin
-        # Departure = bus_arrival_last_stop + end_walk_time + shopping time
-        if best_o:
-            return_depart = best_o['bus_arrival_dest'] + best_o['w2_s'] + shop_duration
-            ret_best = analyzer.find_best_route(shop_xy, home_xy, person_depart=return_depart)
-            best_r = ret_best[0] if ret_best else None
-            
-            return_rows.append({
-                'id': trip_id, 'departure_time': return_depart,
-                'bus_line_selected': best_r['line'] if best_r else 'No Route',
-                'bus_id_selected': best_r['bus_id'] if best_r else 'No Route',
-                'start_stop_selected': best_r['board'] if best_r else 'N/A',
-                'start_walk_distance': best_r['w1_dist'] if best_r else 0,
-                'start_walk_time': best_r['w1_s'] if best_r else 0,
-                'person_arrival_start_stop': best_r['arrival_at_stop'] if best_r else 0,
-                'bus_arrival_start_stop': best_r['bus_depart_stop'] if best_r else 0,
-                'last_stop_selected': best_r['exit'] if best_r else 'N/A',
-                'bus_arrival_last_stop': best_r['bus_arrival_dest'] if best_r else 0,
-                'end_walk_distance': best_r['w2_dist'] if best_r else 0,
-                'end_walk_time': best_r['w2_s'] if best_r else 0
-            })
+    analyzer = PTAnalyzer(NET, STOPS, BUSES, walk_metric=args.walk_metric)
+    df = read_table(INPUT_FILE)
 
-        # 3. OD DATA
-        od_rows.append({
-            'id': trip_id, 'name_origin': row['name_block'],
-            'origin_x': row['origin_x'], 'origin_y': row['origin_y'],
-            'name_destination': row.get('name_destination', f"t_{idx}"),
-            'destination_x': row['destination_x'], 'destination_y': row['destination_y'],
-            'shopping time': shop_duration
-        })
+    # Stops within walking distance of every home and attraction, cached in .netcache
+    home_keys, shop_keys = plan_locations(df)
+    if home_keys is not None:
+        keys = np.concatenate([home_keys, shop_keys])
+        points = np.concatenate([df[['origin_x', 'origin_y']].to_numpy(dtype=float),
+                                 df[['destination_x', 'destination_y']].to_numpy(dtype=float)])
+        keys, first = np.unique(keys, return_index=True)
+        analyzer.load_catchments(keys, points[first])
+    
+    # Outbound and return legs for every person in one vectorized pass per leg (per chunk with --workers)
+    outbound, returns, od = assign_parallel(analyzer, df, workers=args.workers or os.cpu_count(),
+                                            max_transfers=args.max_transfers)
 
-# Save files into the 'results' subfolder
-    pd.DataFrame(outbound_rows).to_excel(SCRIPT_DIR / "results/Home_shopping_person_info.xlsx", index=False)
-    pd.DataFrame(return_rows).to_excel(SCRIPT_DIR / "results/Shopping_home_person_info.xlsx", index=False)
-    pd.DataFrame(od_rows).to_excel(SCRIPT_DIR / "results/od.xlsx", index=False)
+# Save files into the 'results' subfolder (Parquet; PIPELINE_EXPORT_EXCEL=1 adds .xlsx copies)
+    write_table(outbound, SCRIPT_DIR / "results/Home_shopping_person_info.parquet")
+    write_table(returns, SCRIPT_DIR / "results/Shopping_home_person_info.parquet")
+    write_table(od, SCRIPT_DIR / "results/od.parquet")
     
     print(f"Success! Generated 3 files in {SCRIPT_DIR}")
\ No newline at end of file
@@ -1,65 +1,84 @@
+import numpy as np
 import pandas as pd
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+import sys
 from pathlib import Path
 
-def generate_sumo_persons_separated():
-    # 1. Setup Paths
-    SCRIPT_DIR = Path(__file__).resolve().parent
-    HOME_SHOP_FILE = SCRIPT_DIR / "results_from_step_1/Home_shopping_person_info.xlsx"
-    SHOP_HOME_FILE = SCRIPT_DIR / "results_from_step_1/Shopping_home_person_info.xlsx"
-    OUTPUT_FILE = SCRIPT_DIR / "results/persons.rou.xml"
+sys.path.append(str(Path(__file__).resolve().parents[3]))
+from pipeline.route_writer import RouteFileWriter
+from pipeline.tables import read_table
 
-    # 2. Load the data
-    print("Loading Excel files...")
-    df_out = pd.read_excel(HOME_SHOP_FILE)
-    df_ret = pd.read_excel(SHOP_HOME_FILE)
+TRIP_COLS = ['departure_time', 'bus_id_selected', 'start_stop_selected', 'last_stop_selected']
+
+
+def person_trips(df_out, df_ret):
+    """
+    Both legs of every person as one table (id, leg, departure_time, bus, stops), sorted by departure.
+    Return legs are joined on the person id; 'No Route' legs are dropped.
+    """
+    df_out = df_out.assign(id=df_out['id'].astype(str))
+    df_ret = df_ret.assign(id=df_ret['id'].astype(str))
+    # Legs planned with transfers (Step 1 --max-transfers) list their bus rides
+    cols = TRIP_COLS + (['rides'] if 'rides' in df_out.columns and 'rides' in df_ret.columns else [])
+    # One keyed join instead of a lookup of the return table per outbound row
+    merged = df_out[['id'] + cols].merge(df_ret[['id'] + cols], on='id', how='left',
+                                         suffixes=('_out', '_ret'), validate='one_to_one')
+
+    legs = []
+    for leg, source in (('out', df_out), ('ret', df_ret)):
+        trips = merged[['id'] + [f"{col}_{leg}" for col in cols]]
+        trips.columns = ['id'] + cols
+        trips = trips[trips['bus_id_selected'].notna() & (trips['bus_id_selected'] != 'No Route')]
+        # Persons without a return leg turn the joined times into floats; restore the source dtype
+        trips = trips.astype({'departure_time': source['departure_time'].dtype})
+        legs.append(trips.assign(leg=leg, order=np.arange(len(trips)) * 2 + (leg == 'ret')))
+    trips = pd.concat(legs)
+    # Departure order; ties keep the person order of the outbound table (outbound before return)
+    return trips.sort_values(['departure_time', 'order'], kind='stable').drop(columns='order')
 
-    # 3. Create XML Structure
-    routes = ET.Element('routes')
-    routes.set('xmlns:xsi', 'http://www.w3.org/2001/XMLSchema-instance')
-    routes.set('xsi:noNamespaceSchemaLocation', 'http://sumo.dlr.de/xsd/routes_file.xsd')
 
-    # 4. Process each trip
-    count = 1
-    for idx, row_out in df_out.iterrows():
-        pid = str(row_out['id'])
-        
-        # --- PERSON OUTBOUND (Home -> Shop) ---
-        if row_out['bus_id_selected'] != 'No Route':
-            p_out = ET.SubElement(routes, 'person', {
-                'id': f"p_{pid}_out",
-                'depart': str(row_out['departure_time'])
-            })
-            # Start at the boarding stop
-            ET.SubElement(p_out, 'stop', {'busStop': str(row_out['start_stop_selected']), 'duration': '0.10'})
-            # Ride to the destination stop
-            ET.SubElement(p_out, 'ride', {'busStop': str(row_out['last_stop_selected']), 'lines': str(row_out['bus_id_selected'])})
-            count += 1
+def ride_stages(rides):
+    """Plan stages of a 'rides' entry ('trip:board:exit' per ride): rides, walking between stops to change."""
+    stages, at = [], None
+    for ride in rides.split():
+        bus, board, exit_stop = ride.split(':')
+        if at is not None and board != at:
+            stages.append(('walk', {'busStop': board}))
+        stages.append(('ride', {'busStop': exit_stop, 'lines': bus}))
+        at = exit_stop
+    return stages
 
-        # --- PERSON RETURN (Shop -> Home) ---
-        row_ret_match = df_ret[df_ret['id'] == pid]
-        if not row_ret_match.empty:
-            row_ret = row_ret_match.iloc[0]
-            if row_ret['bus_id_selected'] != 'No Route':
-                p_ret = ET.SubElement(routes, 'person', {
-                    'id': f"p_{pid}_ret",
-                    'depart': str(row_ret['departure_time'])
-                })
-                # Start at the shopping bus stop
-                ET.SubElement(p_ret, 'stop', {'busStop': str(row_ret['start_stop_selected']), 'duration': '0.10'})
-                # Ride back to the home bus stop
-                ET.SubElement(p_ret, 'ride', {'busStop': str(row_ret['last_stop_selected']), 'lines': str(row_ret['bus_id_selected'])})
-                count += 1
 
-    # 5. Save
-    xml_string = ET.tostring(routes, encoding='utf-8')
-    pretty_xml = minidom.parseString(xml_string).toprettyxml(indent="    ")
+def write_persons(trips, output_file):
+    """Writes one <person> per row of person_trips to output_file; returns the number written."""
+    rides = trips['rides'].fillna('').astype(str) if 'rides' in trips.columns else [''] * len(trips)
+    with RouteFileWriter(output_file) as routes:
+        for pid, leg, depart, bus, start_stop, last_stop, legs in zip(
+                trips['id'], trips['leg'], trips['departure_time'].astype(str), trips['bus_id_selected'].astype(str),
+                trips['start_stop_selected'].astype(str), trips['last_stop_selected'].astype(str), rides):
+            routes.person({'id': f"p_{pid}_{leg}", 'depart': depart}, [
+                # Start at the boarding stop (home or shopping bus stop)
+                ('stop', {'busStop': start_stop, 'duration': '0.10'}),
+                # Ride to the destination stop, changing buses on the way for legs with transfers
+            ] + (ride_stages(legs) if legs else [('ride', {'busStop': last_stop, 'lines': bus})]))
+    return routes.count
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        f.write(pretty_xml)
 
+def generate_sumo_persons_separated():
+    # 1. Setup Paths
+    SCRIPT_DIR = Path(__file__).resolve().parent
+    HOME_SHOP_FILE = SCRIPT_DIR / "results_from_step_1/Home_shopping_person_info.parquet"
+    SHOP_HOME_FILE = SCRIPT_DIR / "results_from_step_1/Shopping_home_person_info.parquet"
+    OUTPUT_FILE = SCRIPT_DIR / "results/persons.rou.xml"
+
+    # 2. Load the data
+    print("Loading Step 1 results...")
+    df_out = read_table(HOME_SHOP_FILE)
+    df_ret = read_table(SHOP_HOME_FILE)
+    trips = person_trips(df_out, df_ret)
+
+    # 3. Stream the XML, one person per leg in departure order
+    count = write_persons(trips, OUTPUT_FILE)
     print(f"Success! Generated {count} person-trips in {OUTPUT_FILE}")
 
 if __name__ == "__main__":
-    generate_sumo_persons_separated()
\ No newline at end of file
+    generate_sumo_persons_separated()
@@ -1,21 +1,25 @@
+import sys
 import pandas as pd
-import xml.etree.ElementTree as ET
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from pipeline.sumo_output import read_tripinfo
+from pipeline.tables import read_table
+
 # --- Path Configuration ---
 DATA_DIR = Path("../Data/Step_1/results")
 OUTPUT_DIR = Path(".") # Assuming running from 'output' folder
 
-FILE_HOME_SHOP = DATA_DIR / "Home_shopping_person_info.xlsx"
-FILE_SHOP_HOME = DATA_DIR / "Shopping_home_person_info.xlsx"
+FILE_HOME_SHOP = DATA_DIR / "Home_shopping_person_info.parquet"
+FILE_SHOP_HOME = DATA_DIR / "Shopping_home_person_info.parquet"
 TRIPINFO_FILE = OUTPUT_DIR / "tripinfo.xml"
 
 def get_demand_kpis():
-    """Extracts accessibility KPIs from the Person Info Excel files."""
+    """Extracts accessibility KPIs from the Step 1 person info tables."""
     try:
-        # Load the demand data from your Excel files
-        df1 = pd.read_excel(FILE_HOME_SHOP)
-        df2 = pd.read_excel(FILE_SHOP_HOME)
+        # Load the demand data (Parquet, falling back to the .xlsx files)
+        df1 = read_table(FILE_HOME_SHOP)
+        df2 = read_table(FILE_SHOP_HOME)
         df_combined = pd.concat([df1, df2])
         
         # Calculating Waiting Time based on your image columns: 
@@ -30,7 +34,7 @@ def get_demand_kpis():
         }
         return metrics
     except Exception as e:
-        print(f"Error reading Excel files: {e}")
+        print(f"Error reading person info tables: {e}")
         return None
 
 def get_sumo_output_kpis():
@@ -39,27 +43,22 @@ def get_sumo_output_kpis():
         print(f"Warning: {TRIPINFO_FILE} not found.")
         return {}
     
-    tree = ET.parse(TRIPINFO_FILE)
-    root = tree.getroot()
-    
-    # Extracting raw data from XML attributes
-    durations = [float(t.get("duration")) for t in root.findall("tripinfo")]
-    lengths = [float(t.get("routeLength")) for t in root.findall("tripinfo")]
-    delays = [float(t.get("timeLoss")) for t in root.findall("tripinfo")]
+    # Streaming, columnar read of the XML attributes we need
+    trips = read_tripinfo(TRIPINFO_FILE, columns=["duration", "routeLength", "timeLoss"])
     
     # Calculations
-    total_trips = len(durations)
+    total_trips = len(trips)
     if total_trips == 0:
         return {}
 
-    avg_travel_time_min = (sum(durations) / total_trips) / 60  # seconds to minutes
-    total_dist_km = sum(lengths) / 1000                        # meters to kilometers
+    avg_travel_time_min = trips["duration"].mean() / 60  # seconds to minutes
+    total_dist_km = trips["routeLength"].sum() / 1000    # meters to kilometers
     
     return {
         "Avg Travel Time [min]": avg_travel_time_min,
         "Total Distance [km]": total_dist_km,
-        "Avg In-Vehicle Time [s]": sum(durations) / total_trips,
-        "Avg System Delay [s]": sum(delays) / total_trips
+        "Avg In-Vehicle Time [s]": trips["duration"].mean(),
+        "Avg System Delay [s]": trips["timeLoss"].mean()
     }
 
 # --- Execution ---
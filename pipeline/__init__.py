@@ -0,0 +1,5 @@
+"""Shared helpers for the bus and ARTS (shuttle) pipeline scripts.
+
+Scripts add the repository root to sys.path (as they already do for the SUMO
+tools) and import from here, e.g. ``from pipeline.edge_snapping import EdgeSnapper``.
+"""
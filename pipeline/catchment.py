@@ -0,0 +1,98 @@
+"""Catchment table: the bus stops within walking distance of every known location.
+
+Locations are the homes (keyed by house_id) and destinations (keyed by attraction name) of the
+personal plans. For each one the stops within max_walk are stored sorted by walk distance, as
+compact CSR arrays: location i owns stop[offsets[i]:offsets[i + 1]] and walk[...]. The table is
+built once per network, stops, timetable, walk metric and location set, and cached as .npz in
+.netcache.
+"""
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+CATCHMENT_VERSION = 1
+
+
+class CatchmentTable:
+    def __init__(self, keys, xy, offsets, stop, walk, max_walk):
+        self.keys = np.asarray(keys).astype(str)
+        self.xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        self.offsets, self.stop, self.walk = offsets, stop, walk
+        self.max_walk = float(max_walk)
+        self.row = {key: i for i, key in enumerate(self.keys.tolist())}
+
+    @classmethod
+    def build(cls, keys, xy, stop_walks, max_walk=600):
+        """Table of `keys` at `xy`; stop_walks(points) gives the (n, stops) walk distances."""
+        xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        dist = stop_walks(xy) if len(xy) else np.zeros((0, 0))
+        loc, stop = np.nonzero(dist <= max_walk)
+        walk = dist[loc, stop]
+        # Per location, closest stop first (ties in stop order)
+        order = np.lexsort((stop, walk, loc))
+        offsets = np.searchsorted(loc[order], np.arange(len(xy) + 1)).astype(np.int64)
+        return cls(keys, xy, offsets, stop[order].astype(np.int32), walk[order], max_walk)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def rows(self, keys, xy):
+        """Table row of every (key, point); -1 where the key is unknown or stored at other coordinates."""
+        xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        rows = np.array([self.row.get(str(key), -1) for key in keys], dtype=np.int64)
+        known = rows >= 0
+        moved = np.zeros(len(rows), dtype=bool)
+        moved[known] = np.any(self.xy[rows[known]] != xy[known], axis=1)
+        rows[moved] = -1
+        return rows
+
+    def stops_of(self, row):
+        """(stop indices, walk distances) of one location, closest first."""
+        lo, hi = self.offsets[row], self.offsets[row + 1]
+        return self.stop[lo:hi], self.walk[lo:hi]
+
+    def dense(self, rows, n_stops):
+        """(len(rows), n_stops) walk distances, inf for stops outside the catchment (rows must be >= 0)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        unique, inverse = np.unique(rows, return_inverse=True)
+        table = np.full((len(unique), n_stops), np.inf)
+        for i, row in enumerate(unique.tolist()):
+            stop, walk = self.stops_of(row)
+            table[i, stop] = walk
+        return table[inverse]
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(f, keys=self.keys, xy=self.xy, offsets=self.offsets, stop=self.stop, walk=self.walk,
+                     max_walk=self.max_walk)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['keys'], data['xy'], data['offsets'], data['stop'], data['walk'], data['max_walk'])
+
+
+def catchment_path(cache_dir, file_hashes, walk_metric, max_walk, keys, xy):
+    """Cache file of one table: hashes of the input files, walk settings and the locations themselves."""
+    h = hashlib.sha1()
+    for part in list(file_hashes) + [walk_metric, f"{max_walk:g}"]:
+        h.update(str(part).encode() + b'\0')
+    h.update('\0'.join(map(str, keys)).encode())
+    h.update(np.ascontiguousarray(xy, dtype=float).tobytes())
+    return Path(cache_dir) / f"catchment-v{CATCHMENT_VERSION}-{h.hexdigest()}.npz"
+
+
+def load_catchments(path, keys, xy, stop_walks, max_walk=600):
+    """CatchmentTable from `path`, built with CatchmentTable.build and cached there on first use."""
+    path = Path(path)
+    if path.exists():
+        return CatchmentTable.load(path)
+    table = CatchmentTable.build(keys, xy, stop_walks, max_walk)
+    table.save(path)
+    return table
@@ -0,0 +1,309 @@
+"""Incremental runner for the whole pipeline, from the synthetic demand to the KPIs.
+
+Every stage declares the files it reads and writes. A stage only runs again when the content hash
+of one of its inputs (its script included) differs from the last successful run, or when one of its
+outputs is missing or was changed since. Stages whose upstream stages are done run concurrently,
+so the bus and shuttle branches proceed in parallel.
+
+    python pipeline/dag.py                      # bring everything up to date
+    python pipeline/dag.py shuttle_kpis         # only the shuttle KPIs and what they depend on
+    python pipeline/dag.py --dry-run            # show what would run
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pipeline.net_cache import file_hash
+from pipeline.run_scenarios import find_sumo
+from pipeline.tables import read_table, write_table
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+STATE_FILE = REPO_ROOT / ".pipeline_state.json"
+
+DEMAND = Path("synthetic_demand/Procedures")
+BUS, BUS_DATA = Path("buses_sumo"), Path("buses_sumo/Data")
+SHUTTLE, SHUTTLE_DATA = Path("shuttles_sumo "), Path("shuttles_sumo /Data")
+STEP_1_TABLES = ("Home_shopping_person_info.parquet", "Shopping_home_person_info.parquet", "od.parquet")
+
+
+class Stage:
+    """One step of the pipeline.
+
+    `action` is called with the stage once its inputs are up to date; `code` lists extra
+    identifiers (script paths, command lines) that are fingerprinted together with the inputs.
+    """
+
+    def __init__(self, name, inputs, outputs, action, code=()):
+        self.name = name
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        self.action = action
+        self.code = list(code)
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+# --- ACTIONS ---
+def script(path, cwd=None, stdout=None):
+    """Action running a Python script of the repo with `cwd` as working directory (default: its folder)."""
+    path = Path(path)
+
+    def run(stage):
+        workdir = REPO_ROOT / (cwd if cwd is not None else path.parent)
+        out = open(REPO_ROOT / stdout, "w") if stdout else None
+        try:
+            subprocess.run([sys.executable, str(REPO_ROOT / path)], cwd=workdir, stdout=out, check=True)
+        finally:
+            if out:
+                out.close()
+    return run
+
+
+def command(args, cwd):
+    """Action running an external program (e.g. sumo) in `cwd`."""
+    def run(stage):
+        subprocess.run([str(a) for a in args], cwd=REPO_ROOT / cwd, check=True)
+    return run
+
+
+def copy(stage):
+    """Action for handoff stages: copies inputs[i] to outputs[i] (results -> results_from_step_N)."""
+    for src, dst in zip(stage.inputs, stage.outputs):
+        (REPO_ROOT / dst).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(REPO_ROOT / src, REPO_ROOT / dst)
+
+
+def shuttle_person_info(stage):
+    """The shuttle Data/Home_shopping_person_info table: id and home departure of every person from Step 1."""
+    outbound = read_table(REPO_ROOT / stage.inputs[0])
+    write_table(outbound[["id", "departure_time"]], REPO_ROOT / stage.outputs[0])
+
+
+def build_stages(sumo_binary=None):
+    """The stages of the bus and shuttle pipelines, in the order the scripts are run by hand."""
+    sumo = sumo_binary or find_sumo()
+    step_4, step_5 = DEMAND / "Step_4", DEMAND / "Step_5"
+    step_1, step_2 = BUS_DATA / "Step_1", BUS_DATA / "Step_2"
+    return [
+        # Synthetic demand
+        Stage("step_4", [step_4 / "Data_From_Step_3.xlsx"],
+              [step_4 / "results/trips_local_center.parquet", step_4 / "results/trips_district_center.parquet"],
+              script(step_4 / "4_Spatial Distribution.py"), code=[step_4 / "4_Spatial Distribution.py"]),
+        Stage("step_4_to_5",
+              [step_4 / "results/trips_local_center.parquet", step_4 / "results/trips_district_center.parquet"],
+              [step_5 / "results_from_step_4/trips_local_center.parquet",
+               step_5 / "results_from_step_4/trips_district_center.parquet"], copy),
+        Stage("step_5",
+              [step_5 / "results_from_step_4/trips_local_center.parquet",
+               step_5 / "results_from_step_4/trips_district_center.parquet",
+               step_5 / "data_homes_locations.xlsx", step_5 / "Attractions_Sumo_Coordinates.xlsx"],
+              [step_5 / "results/personal_planes.parquet"],
+              script(step_5 / "5_convert_excel_trips_to_persons_plans.py"),
+              code=[step_5 / "5_convert_excel_trips_to_persons_plans.py"]),
+        Stage("step_5_to_1", [step_5 / "results/personal_planes.parquet"],
+              [step_1 / "personal_planes_from_4_step_model.parquet"], copy),
+
+        # Buses
+        Stage("bus_step_1",
+              [step_1 / "personal_planes_from_4_step_model.parquet",
+               BUS / "network.net.xml", BUS / "stops.add.xml", BUS / "buses.rou.xml"],
+              [step_1 / "results" / name for name in STEP_1_TABLES],
+              script(step_1 / "1_trip_assignment_complete_with_reverse_path.py"),
+              code=[step_1 / "1_trip_assignment_complete_with_reverse_path.py"]),
+        Stage("bus_step_1_to_2", [step_1 / "results" / name for name in STEP_1_TABLES],
+              [step_2 / "results_from_step_1" / name for name in STEP_1_TABLES], copy),
+        Stage("bus_step_2", [step_2 / "results_from_step_1" / name for name in STEP_1_TABLES[:2]],
+              [step_2 / "results/persons.rou.xml"],
+              script(step_2 / "3_Generate_perspn_xml_trips.py"), code=[step_2 / "3_Generate_perspn_xml_trips.py"]),
+        Stage("bus_demand", [step_2 / "results/persons.rou.xml"], [BUS / "persons.rou.xml"], copy),
+        Stage("bus_sumo",
+              [BUS / "sumo.sumocfg", BUS / "network.net.xml", BUS / "stops.add.xml",
+               BUS / "buses.rou.xml", BUS / "persons.rou.xml"],
+              [BUS / "output/tripinfo.xml", BUS / "output/statistics.xml"],
+              command([sumo, "-c", "sumo.sumocfg", "--no-step-log", "true"], BUS), code=["sumo -c sumo.sumocfg"]),
+        Stage("bus_kpis",
+              [BUS / "output/tripinfo.xml", step_1 / "results" / STEP_1_TABLES[0], step_1 / "results" / STEP_1_TABLES[1]],
+              [BUS / "output/midterm_consolidated_kpis.csv"],
+              script(BUS / "output/analyzing_results.py"), code=[BUS / "output/analyzing_results.py"]),
+
+        # Shuttles (same persons and ODs as Step 1)
+        Stage("shuttle_od", [step_1 / "results/od.parquet"], [SHUTTLE_DATA / "od.parquet"], copy),
+        Stage("shuttle_person_info", [step_1 / "results" / STEP_1_TABLES[0]],
+              [SHUTTLE_DATA / "Home_shopping_person_info.parquet"], shuttle_person_info,
+              code=["shuttle_person_info"]),
+        Stage("shuttle_edges",
+              [SHUTTLE / "network.net.xml", SHUTTLE_DATA / "od.parquet",
+               SHUTTLE_DATA / "Home_shopping_person_info.parquet"],
+              [SHUTTLE_DATA / "Home_shopping_person_info_updated.parquet"],
+              script(SHUTTLE_DATA / "1_Generate_trips_roundtrip.py"), code=[SHUTTLE_DATA / "1_Generate_trips_roundtrip.py"]),
+        Stage("shuttle_persons",
+              [SHUTTLE / "network.net.xml", SHUTTLE_DATA / "od.parquet",
+               SHUTTLE_DATA / "Home_shopping_person_info_updated.parquet"],
+              [SHUTTLE_DATA / "persons.rou.xml"],
+              script(SHUTTLE_DATA / "2_generate_persons_xml_roundtrip.py"),
+              code=[SHUTTLE_DATA / "2_generate_persons_xml_roundtrip.py"]),
+        Stage("shuttle_demand", [SHUTTLE_DATA / "persons.rou.xml"], [SHUTTLE / "persons.rou.xml"], copy),
+        Stage("shuttle_sumo",
+              [SHUTTLE / "sumo.sumocfg", SHUTTLE / "network.net.xml", SHUTTLE / "arts.rou.xml",
+               SHUTTLE / "persons.rou.xml"],
+              [SHUTTLE / "output/tripinfo.xml", SHUTTLE / "output/statistics.xml"],
+              command([sumo, "-c", "sumo.sumocfg", "--no-step-log", "true"], SHUTTLE), code=["sumo -c sumo.sumocfg"]),
+        Stage("shuttle_kpis", [SHUTTLE / "output/tripinfo.xml", SHUTTLE / "output/statistics.xml"],
+              [SHUTTLE / "output/kpis.txt"],
+              script(SHUTTLE / "output/analyze_results.py", stdout=SHUTTLE / "output/kpis.txt"),
+              code=[SHUTTLE / "output/analyze_results.py"]),
+    ]
+
+
+# --- RUNNER ---
+class Pipeline:
+    """Runs stages in dependency order, skipping those whose fingerprint matches the saved state."""
+
+    def __init__(self, stages, state_file=STATE_FILE):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_file = Path(state_file)
+        self.state = json.loads(self.state_file.read_text()) if self.state_file.exists() else {}
+        self.state.setdefault("stages", {})
+        self.state.setdefault("files", {})
+        self.lock = threading.Lock()
+        self.producer = {out: stage.name for stage in stages for out in stage.outputs}
+        self.upstream = {stage.name: sorted({self.producer[p] for p in stage.inputs if p in self.producer})
+                         for stage in stages}
+
+    def hash(self, path):
+        """Content hash of a repo file (None when missing), reusing the saved hash while size and mtime match."""
+        full = REPO_ROOT / path
+        if not full.exists():
+            return None
+        stat = full.stat()
+        cached = self.state["files"].get(str(path))
+        if cached and cached[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return cached[2]
+        digest = file_hash(full)
+        with self.lock:
+            self.state["files"][str(path)] = [stat.st_mtime_ns, stat.st_size, digest]
+        return digest
+
+    def fingerprint(self, stage):
+        inputs = {str(p): self.hash(p) for p in stage.inputs}
+        code = {str(c): self.hash(c) if (REPO_ROOT / str(c)).is_file() else str(c) for c in stage.code}
+        return {"inputs": inputs, "code": code}
+
+    def is_current(self, stage):
+        saved = self.state["stages"].get(stage.name)
+        if saved is None or saved["fingerprint"] != self.fingerprint(stage):
+            return False
+        return all(self.hash(p) is not None and self.hash(p) == saved["outputs"].get(str(p)) for p in stage.outputs)
+
+    def selected(self, targets=None):
+        """Stage names needed for `targets` (all stages when None)."""
+        if not targets:
+            return list(self.stages)
+        needed, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in self.stages:
+                raise KeyError(f"Unknown stage '{name}' (available: {', '.join(self.stages)})")
+            if name not in needed:
+                needed.add(name)
+                todo.extend(self.upstream[name])
+        return [name for name in self.stages if name in needed]
+
+    def run_stage(self, name, force=False, dry_run=False):
+        """Runs one stage if it is out of date; returns 'up to date', 'ran' or 'would run'."""
+        stage = self.stages[name]
+        missing = [str(p) for p in stage.inputs if self.hash(p) is None]
+        if missing and not dry_run:
+            raise FileNotFoundError(f"{name}: missing inputs {', '.join(missing)}")
+        if not force and not missing and self.is_current(stage):
+            return "up to date"
+        if dry_run:
+            return "would run (inputs missing)" if missing else "would run"
+        start = time.perf_counter()
+        stage.action(stage)
+        lost = [str(p) for p in stage.outputs if not (REPO_ROOT / p).exists()]
+        if lost:
+            raise FileNotFoundError(f"{name}: did not write {', '.join(lost)}")
+        record = {
+            "fingerprint": self.fingerprint(stage),
+            "outputs": {str(p): self.hash(p) for p in stage.outputs},
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        with self.lock:
+            self.state["stages"][name] = record
+        return "ran"
+
+    def run(self, targets=None, force=(), workers=None, dry_run=False):
+        """Runs the selected stages, each as soon as its upstream stages finished. Returns {stage: status}."""
+        names = self.selected(targets)
+        force = set(self.stages) if force is True else set(force)
+        status, running = {}, {}
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            while len(status) < len(names):
+                for name in names:
+                    if name in status or name in running:
+                        continue
+                    deps = [status.get(dep) for dep in self.upstream[name] if dep in names]
+                    if any(s is not None and s.startswith(("failed", "skipped")) for s in deps):
+                        status[name] = "skipped (upstream failed)"
+                    elif dry_run and any(s is not None and s.startswith("would run") for s in deps):
+                        status[name] = "would run (upstream changes)"
+                        print(f"{name:<22} {status[name]}")
+                    elif all(s is not None for s in deps):
+                        # A forced or re-run upstream stage only propagates if its outputs really changed
+                        running[name] = pool.submit(self.run_stage, name, name in force, dry_run)
+                if not running:
+                    continue
+                done, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+                for name, future in list(running.items()):
+                    if future in done:
+                        del running[name]
+                        try:
+                            status[name] = future.result()
+                        except Exception as e:
+                            status[name] = f"failed: {e}"
+                        print(f"{name:<22} {status[name]}")
+                if not dry_run:
+                    self.save()
+        return status
+
+    def save(self):
+        with self.lock:
+            text = json.dumps(self.state, indent=1)
+        tmp = self.state_file.with_suffix(".tmp")
+        tmp.write_text(text)
+        os.replace(tmp, self.state_file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("targets", nargs="*", help="stages to bring up to date (default: all)")
+    parser.add_argument("--force", nargs="*", default=None, help="re-run these stages (all selected when empty)")
+    parser.add_argument("--dry-run", action="store_true", help="only report which stages are out of date")
+    parser.add_argument("--list", action="store_true", help="list the stages and their upstream stages")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--sumo", default=None, help="sumo binary (default: $SUMO_BINARY, PATH or $SUMO_HOME)")
+    args = parser.parse_args(argv)
+
+    pipeline = Pipeline(build_stages(args.sumo))
+    if args.list:
+        for name, deps in pipeline.upstream.items():
+            print(f"{name:<22} <- {', '.join(deps) or '(sources)'}")
+        return
+    force = () if args.force is None else (args.force or True)
+    status = pipeline.run(args.targets, force, args.workers, args.dry_run)
+    if any(s.startswith(("failed", "skipped")) for s in status.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
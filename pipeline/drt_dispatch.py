@@ -0,0 +1,189 @@
+"""Batched cheapest-insertion dispatcher for the ARTS fleet, driven through TraCI / libsumo.
+
+SUMO hands dispatching to the client with --device.taxi.dispatch-algorithm traci. On every dispatch
+step the open reservations are collected, oldest first, and each is inserted (pickup and drop-off)
+at the cheapest position of the stop sequence of one of the drt_* taxis. Insertions must respect
+the taxi's personCapacity along the whole sequence, a maximum waiting time and a maximum detour
+of the passengers that are not yet picked up. The cost is the added driving time plus a weighted
+waiting time of the new passenger.
+
+Each dispatch step has a wall-time budget. Reservations left over when it runs out wait for the
+next step and go first there, so dispatch latency stays bounded at peak demand. Travel times
+come from simulation.findRoute and are cached per edge pair, or from a precomputed EdgeMatrix
+(pipeline/edge_matrix.py) when one is given.
+
+    python pipeline/profile_sim.py --scenario shuttles --dispatcher pipeline.drt_dispatch:dispatch --period 30
+"""
+import time
+
+import pandas as pd
+
+# Reservation.state bit flags (TraCI)
+PICKED_UP = 8
+
+
+class InsertionDispatcher:
+    """Callable dispatcher (sim, time) keeping the planned stop sequence of every taxi.
+
+    A plan is a list of (reservation id, is_pickup) in service order; it always holds the full
+    remaining sequence, as dispatchTaxi expects: picked-up reservations once (drop-off),
+    assigned ones twice.
+    """
+
+    def __init__(self, budget_s=0.2, max_wait=900., max_detour=2., detour_slack=300., wait_weight=0.5,
+                 candidates=8, fleet_prefix="drt_", vtype="arts", edge_matrix=None):
+        self.budget_s = budget_s
+        self.max_wait = max_wait
+        self.max_detour, self.detour_slack = max_detour, detour_slack
+        self.wait_weight = wait_weight
+        self.candidates = candidates
+        self.fleet_prefix, self.vtype = fleet_prefix, vtype
+        self.edge_matrix = edge_matrix
+        self.plans = {}
+        self.capacity = {}
+        self.travel_times = {}
+        self.log = []
+
+    def travel_time(self, sim, from_edge, to_edge):
+        """Driving time between two edges (0 on the same edge), cached per edge pair."""
+        if from_edge == to_edge:
+            return 0.
+        if self.edge_matrix is not None:
+            return self.edge_matrix.travel_time(from_edge, to_edge)
+        key = (from_edge, to_edge)
+        if key not in self.travel_times:
+            route = sim.simulation.findRoute(from_edge, to_edge, self.vtype)
+            self.travel_times[key] = route.travelTime if route.edges else float("inf")
+        return self.travel_times[key]
+
+    def _taxi_edge(self, sim, taxi):
+        """The edge a taxi's next leg starts from (the next route edge while on a junction)."""
+        edge = sim.vehicle.getRoadID(taxi)
+        if edge.startswith(":") or not edge:
+            route, index = sim.vehicle.getRoute(taxi), sim.vehicle.getRouteIndex(taxi)
+            edge = route[min(index + 1, len(route) - 1)]
+        return edge
+
+    def _evaluate(self, sim, plan, start_edge, load, capacity, now, reservations, wait_limits=None):
+        """(driving time, arrival time per stop) of a plan, or None when it breaks a constraint.
+
+        With `wait_limits` ({reservation id: seconds}, max_wait for ids not in it), every pickup
+        must also happen within its waiting time limit.
+        """
+        t, edge, etas = now, start_edge, []
+        pickup_eta = {}
+        for res_id, is_pickup in plan:
+            res = reservations[res_id]
+            stop_edge = res.fromEdge if is_pickup else res.toEdge
+            t += self.travel_time(sim, edge, stop_edge)
+            edge = stop_edge
+            etas.append(t)
+            if is_pickup:
+                load += len(res.persons)
+                if load > capacity:
+                    return None
+                if wait_limits is not None and t - max(now, res.depart) > wait_limits.get(res_id, self.max_wait):
+                    return None
+                pickup_eta[res_id] = t
+            else:
+                load -= len(res.persons)
+                if res_id in pickup_eta:
+                    direct = self.travel_time(sim, res.fromEdge, res.toEdge)
+                    if t - pickup_eta[res_id] > self.max_detour * direct + self.detour_slack:
+                        return None
+        return t - now, etas
+
+    def _best_insertion(self, sim, res, taxi, state, now, reservations):
+        """Cheapest (cost, plan) inserting `res` into one taxi's plan, or None if no position is feasible."""
+        plan, start_edge, load, capacity = state["plan"], state["edge"], state["load"], self.capacity[taxi]
+        base = state["cost"]
+        # No insertion may push a waiting passenger past max_wait; one already late keeps its current wait
+        waits = state.get("waits", {})
+        wait_limits = {res_id: max(self.max_wait, waits.get(res_id, 0.)) for res_id, is_pickup in plan if is_pickup}
+        best = None
+        for i in range(len(plan) + 1):
+            for j in range(i, len(plan) + 1):
+                candidate = plan[:i] + [(res.id, True)] + plan[i:j] + [(res.id, False)] + plan[j:]
+                result = self._evaluate(sim, candidate, start_edge, load, capacity, now, reservations, wait_limits)
+                if result is None:
+                    continue
+                duration, etas = result
+                wait = etas[i] - max(now, res.depart)
+                cost = duration - base + self.wait_weight * wait
+                if best is None or cost < best[0]:
+                    best = (cost, candidate, duration)
+        return best
+
+    def _sync(self, sim, now):
+        """Reservations by id, open reservations (oldest first), the drt_* taxis and their current state."""
+        reservations = {res.id: res for res in sim.person.getTaxiReservations(0)}
+
+        # Drop finished reservations and served pickups from the plans
+        for taxi, plan in self.plans.items():
+            self.plans[taxi] = [(res_id, is_pickup) for res_id, is_pickup in plan if res_id in reservations
+                                and not (is_pickup and reservations[res_id].state & PICKED_UP)]
+        planned = {res_id for plan in self.plans.values() for res_id, _ in plan}
+        pending = sorted((res for res in reservations.values() if res.id not in planned and not res.state & PICKED_UP),
+                         key=lambda res: (res.reservationTime, res.depart, res.id))
+
+        taxis = [taxi for taxi in sim.vehicle.getTaxiFleet(-1) if taxi.startswith(self.fleet_prefix)]
+        states = {}
+        for taxi in taxis:
+            if taxi not in self.capacity:
+                self.capacity[taxi] = sim.vehicle.getPersonCapacity(taxi)
+            plan = self.plans.setdefault(taxi, [])
+            state = {"plan": plan, "edge": self._taxi_edge(sim, taxi), "load": sim.vehicle.getPersonNumber(taxi)}
+            result = self._evaluate(sim, plan, state["edge"], state["load"], float("inf"), now, reservations)
+            state["cost"] = result[0] if result else 0.
+            # Current waiting time of every passenger still to be picked up
+            state["waits"] = {res_id: eta - max(now, reservations[res_id].depart)
+                              for (res_id, is_pickup), eta in zip(plan, result[1] if result else []) if is_pickup}
+            states[taxi] = state
+        return reservations, pending, taxis, states
+
+    def _nearest(self, sim, taxis, states, res):
+        """The `candidates` taxis with the shortest drive to the reservation's pickup edge."""
+        return sorted(taxis, key=lambda taxi: self.travel_time(sim, states[taxi]["edge"], res.fromEdge))[:self.candidates]
+
+    def _dispatch(self, sim, now, states, changed):
+        """Sends the new plans of the changed taxis; a rejected plan is dropped and retried next step."""
+        for taxi in changed:
+            try:
+                sim.vehicle.dispatchTaxi(taxi, [res_id for res_id, _ in states[taxi]["plan"]])
+                self.plans[taxi] = states[taxi]["plan"]
+            except Exception as e:  # TraCIException / libsumo error: keep the old plan, retry next step
+                print(f"[{now:g}] dispatchTaxi({taxi}) failed: {e}")
+
+    def __call__(self, sim, now):
+        deadline = time.perf_counter() + self.budget_s
+        start = time.perf_counter()
+        reservations, pending, taxis, states = self._sync(sim, now)
+
+        changed, assigned = set(), 0
+        for n, res in enumerate(pending):
+            # Always place the oldest reservation; stop at the budget otherwise
+            if n and time.perf_counter() > deadline:
+                break
+            best = None
+            for taxi in self._nearest(sim, taxis, states, res):
+                insertion = self._best_insertion(sim, res, taxi, states[taxi], now, reservations)
+                if insertion is not None and (best is None or insertion[0] < best[0]):
+                    best = (insertion[0], taxi, insertion[1], insertion[2])
+            if best is None:
+                continue
+            _, taxi, plan, duration = best
+            states[taxi]["plan"], states[taxi]["cost"] = plan, duration
+            changed.add(taxi)
+            assigned += 1
+
+        self._dispatch(sim, now, states, changed)
+        self.log.append({"time": now, "open": len(pending), "assigned": assigned, "taxis_changed": len(changed),
+                         "compute_s": time.perf_counter() - start, "budget_hit": time.perf_counter() > deadline})
+
+    def stats(self):
+        """One row per dispatch step: open and assigned reservations, compute time, budget overruns."""
+        return pd.DataFrame(self.log, columns=["time", "open", "assigned", "taxis_changed", "compute_s", "budget_hit"])
+
+
+# Default instance for profile_sim.py --dispatcher pipeline.drt_dispatch:dispatch
+dispatch = InsertionDispatcher()
@@ -0,0 +1,223 @@
+"""All-pairs shortest paths between network edges, cached as memory-mapped matrices.
+
+Every entry is the network distance [m] or travel time [s] from the midpoint of one edge to the
+midpoint of another, for one mode:
+
+- vehicle: along the edge connections of net.xml on edges permitting the vehicle class. Distance
+  is the shortest route, time the fastest route at the lane speed limits.
+- pedestrian: on edges permitting pedestrians, walkable in both directions, crossing junctions
+  in a straight line between edge ends. Time is the distance at walking speed.
+
+Unreachable pairs are inf. The matrices are saved as float32 .npy files in the .netcache directory
+next to the network, keyed by the network's content hash, and opened with mmap. A lookup is then
+an index into the mapped array.
+
+    python pipeline/edge_matrix.py "shuttles_sumo /network.net.xml" --modes vehicle pedestrian
+"""
+import argparse
+import heapq
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pipeline.net_cache import CACHE_DIR_NAME, file_hash, load_network
+
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+except ImportError:  # SciPy is optional; fall back to a heap-based Dijkstra per source
+    csr_matrix = dijkstra = None
+
+MATRIX_VERSION = 2
+MODES = {"vehicle": "taxi", "pedestrian": "pedestrian"}  # mode -> default vClass
+WALK_SPEED = 1.1
+
+
+def _all_pairs(n, tails, heads, weights, sources=None):
+    """Shortest path costs between all nodes of a directed graph given as arcs (n x n, inf when unreachable).
+
+    With `sources`, only the rows of those nodes are computed (len(sources) x n).
+    """
+    if dijkstra is not None:
+        # Parallel arcs keep their minimum: sort descending so the smallest one is written last
+        order = np.argsort(-weights, kind='stable')
+        dense = {}
+        for t, h, w in zip(tails[order].tolist(), heads[order].tolist(), weights[order].tolist()):
+            dense[(t, h)] = w
+        keys = np.array(list(dense), dtype=np.int64).reshape(-1, 2)
+        # Zero-weight arcs would vanish from a sparse matrix; nudge them to a tiny positive cost
+        values = np.maximum(np.array(list(dense.values()), dtype=float), 1e-9)
+        graph = csr_matrix((values, (keys[:, 0], keys[:, 1])), shape=(n, n))
+        return dijkstra(graph, directed=True, indices=sources)
+
+    adjacency = [[] for _ in range(n)]
+    for t, h, w in zip(tails.tolist(), heads.tolist(), weights.tolist()):
+        adjacency[t].append((h, w))
+    sources = range(n) if sources is None else sources
+    result = np.full((len(sources), n), np.inf)
+    for row, source in enumerate(sources):
+        dist = result[row]
+        dist[source] = 0.
+        heap = [(0., source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for v, w in adjacency[u]:
+                if d + w < dist[v]:
+                    dist[v] = d + w
+                    heapq.heappush(heap, (d + w, v))
+    return result
+
+
+def vehicle_matrix(net, weights, vclass="taxi"):
+    """Midpoint-to-midpoint costs along connections, with `weights` the cost of driving each whole edge.
+
+    Dijkstra runs on the edge graph (arc i -> j costs weights[j]), giving end-of-i to end-of-j;
+    shifting by half of both edges turns that into midpoint to midpoint.
+    """
+    allowed = net.edge_allows(vclass)
+    keep = allowed[net.conn_from] & allowed[net.conn_to]
+    tails, heads = net.conn_from[keep], net.conn_to[keep]
+    ends = _all_pairs(len(net.edge_id), tails, heads, weights[heads])
+    matrix = ends + (weights[:, None] - weights[None, :]) / 2
+    matrix[~allowed, :] = np.inf
+    matrix[:, ~allowed] = np.inf
+    np.fill_diagonal(matrix, np.where(allowed, 0., np.inf))
+    return matrix
+
+
+def walk_graph(net, walkable):
+    """Undirected walking graph with a node at both ends of every edge (2e: start, 2e + 1: end).
+
+    Arcs run along the walkable edges and, inside each junction, straight between the ends of the
+    walkable edges meeting there. Returns (n_nodes, tails, heads, weights).
+    """
+    edges = np.flatnonzero(walkable)
+    start = np.array([net.edge_shape_xy(e)[0] for e in edges]).reshape(-1, 2)
+    end = np.array([net.edge_shape_xy(e)[-1] for e in edges]).reshape(-1, 2)
+    tails, heads, weights = [2 * edges], [2 * edges + 1], [net.edge_length[edges]]
+
+    # Edge ends grouped by junction: the start of an edge lies at its from-junction, the end at its to-junction
+    node = np.concatenate([2 * edges, 2 * edges + 1])
+    xy = np.concatenate([start, end])
+    junction = np.concatenate([net.edge_from[edges], net.edge_to[edges]])
+    order = np.argsort(junction, kind='stable')
+    bounds = np.flatnonzero(np.r_[True, junction[order][1:] != junction[order][:-1], True])
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        members = order[lo:hi]
+        a, b = np.triu_indices(len(members), k=1)
+        tails.append(node[members[a]])
+        heads.append(node[members[b]])
+        weights.append(np.hypot(*(xy[members[a]] - xy[members[b]]).T))
+
+    tails, heads, weights = np.concatenate(tails), np.concatenate(heads), np.concatenate(weights)
+    return 2 * len(net.edge_id), np.concatenate([tails, heads]), np.concatenate([heads, tails]), np.concatenate([weights, weights])
+
+
+def pedestrian_matrix(net, vclass="pedestrian"):
+    """Midpoint-to-midpoint walking distances over walk_graph (both directions, crossing junctions)."""
+    allowed = np.flatnonzero(net.edge_allows(vclass))
+    length = net.edge_length
+    n_nodes, tails, heads, weights = walk_graph(net, net.edge_allows(vclass))
+    ends = np.column_stack([2 * allowed, 2 * allowed + 1])
+    between = _all_pairs(n_nodes, tails, heads, weights, sources=ends.ravel()).reshape(len(allowed), 2, n_nodes)
+
+    # Best of the four end combinations, plus half of both edges
+    best = np.minimum.reduce([between[:, a][:, ends[:, b]] for a in (0, 1) for b in (0, 1)])
+    matrix = np.full((len(net.edge_id), len(net.edge_id)), np.inf)
+    matrix[np.ix_(allowed, allowed)] = best + (length[allowed, None] + length[None, allowed]) / 2
+    matrix[allowed, allowed] = 0.
+    return matrix
+
+
+class EdgeMatrix:
+    """Distance and travel-time matrices of one mode with O(1) lookups by edge id."""
+
+    def __init__(self, edge_ids, distance, travel_time, mode):
+        self.edge_ids = np.asarray(edge_ids)
+        self.index = {eid: i for i, eid in enumerate(self.edge_ids.tolist())}
+        self.distance_matrix, self.time_matrix, self.mode = distance, travel_time, mode
+
+    def distance(self, from_edge, to_edge):
+        return float(self.distance_matrix[self.index[from_edge], self.index[to_edge]])
+
+    def travel_time(self, from_edge, to_edge):
+        return float(self.time_matrix[self.index[from_edge], self.index[to_edge]])
+
+    def indices(self, edge_ids):
+        """Matrix indices of many edge ids (-1 for edges not in the network)."""
+        return np.array([self.index.get(eid, -1) for eid in edge_ids], dtype=np.int64)
+
+    def distances(self, from_edges, to_edges):
+        """Vectorized distance() for two equally long sequences of edge ids (NaN for unknown edges)."""
+        return self._lookup(self.distance_matrix, from_edges, to_edges)
+
+    def travel_times(self, from_edges, to_edges):
+        return self._lookup(self.time_matrix, from_edges, to_edges)
+
+    def _lookup(self, matrix, from_edges, to_edges):
+        i, j = self.indices(from_edges), self.indices(to_edges)
+        values = np.asarray(matrix[i.clip(min=0), j.clip(min=0)], dtype=float)
+        values[(i < 0) | (j < 0)] = np.nan
+        return values
+
+
+def matrix_paths(net_file, mode, vclass, walk_speed=WALK_SPEED, cache_dir=None):
+    """(distance, time) .npy cache files of one network, mode and vClass."""
+    cache_dir = Path(cache_dir) if cache_dir else Path(net_file).resolve().parent / CACHE_DIR_NAME
+    key = f"edges-v{MATRIX_VERSION}-{file_hash(net_file)}-{mode}-{vclass}"
+    if mode == "pedestrian":
+        key += f"-{walk_speed:g}"
+    return cache_dir / f"{key}-distance.npy", cache_dir / f"{key}-time.npy"
+
+
+def _save(path, matrix):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp, 'wb') as f:
+        np.save(f, matrix.astype(np.float32))
+    os.replace(tmp, path)
+
+
+def load_edge_matrix(net_file, mode="vehicle", vclass=None, walk_speed=WALK_SPEED, cache_dir=None):
+    """EdgeMatrix of a network, memory-mapped from the cache; computed and cached on first use."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}' (expected one of {', '.join(MODES)})")
+    vclass = vclass or MODES[mode]
+    net = load_network(net_file, cache_dir=cache_dir)
+    distance_path, time_path = matrix_paths(net_file, mode, vclass, walk_speed, cache_dir)
+    if not (distance_path.exists() and time_path.exists()):
+        if mode == "vehicle":
+            distance = vehicle_matrix(net, net.edge_length, vclass)
+            travel_time = vehicle_matrix(net, net.edge_length / net.edge_speed, vclass)
+        else:
+            distance = pedestrian_matrix(net, vclass)
+            travel_time = distance / walk_speed
+        _save(distance_path, distance)
+        _save(time_path, travel_time)
+    return EdgeMatrix(net.edge_id, np.load(distance_path, mmap_mode='r'), np.load(time_path, mmap_mode='r'), mode)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("net_files", nargs="+", help="network.net.xml files")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--walk-speed", type=float, default=WALK_SPEED, help="pedestrian speed [m/s]")
+    args = parser.parse_args(argv)
+
+    for net_file in args.net_files:
+        for mode in args.modes:
+            start = time.perf_counter()
+            matrix = load_edge_matrix(net_file, mode, walk_speed=args.walk_speed)
+            reachable = np.isfinite(matrix.distance_matrix)
+            print(f"{net_file} [{mode}]: {len(matrix.edge_ids)} edges, {reachable.mean():.1%} of pairs reachable, "
+                  f"{time.perf_counter() - start:.2f} s -> {matrix_paths(net_file, mode, MODES[mode], args.walk_speed)[0].parent}")
+
+
+if __name__ == "__main__":
+    main()
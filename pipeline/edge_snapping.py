@@ -0,0 +1,68 @@
+import numpy as np
+
+from .net_cache import load_network
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # SciPy is optional; fall back to a chunked brute-force search
+    cKDTree = None
+
+
+def angle_diff(a, b):
+    """Absolute difference between two angles (radians), wrapped to [0, pi]."""
+    return np.abs(np.arctan2(np.sin(a - b), np.cos(a - b)))
+
+
+class EdgeSnapper:
+    """Snaps coordinates to network edges using their lane-shape midpoints.
+
+    Every edge is represented the way the demand scripts always did it: the middle
+    vertex of its first lane's shape and the angle from the first to the last vertex.
+    Queries take whole coordinate arrays of shape (n, 2).
+    """
+
+    CHUNK = 4096
+
+    def __init__(self, edge_ids, xy, angles):
+        self.edge_ids = np.asarray(edge_ids, dtype=object)
+        self.xy = np.asarray(xy, dtype=float)
+        self.angles = np.asarray(angles, dtype=float)
+        self.tree = cKDTree(self.xy) if cKDTree is not None else None
+
+    @classmethod
+    def from_net(cls, net_file):
+        net = load_network(net_file)
+        return cls(net.edge_id, net.edge_mid, net.edge_angle)
+
+    def nearest(self, points_xy, k=5):
+        """Returns (distances, edge indices) of the k closest edges per point, closest first."""
+        points_xy = np.atleast_2d(np.asarray(points_xy, dtype=float))
+        k = min(k, len(self.edge_ids))
+        if self.tree is not None:
+            dist, idx = self.tree.query(points_xy, k=k)
+            return dist.reshape(len(points_xy), k), idx.reshape(len(points_xy), k)
+
+        dist, idx = np.empty((len(points_xy), k)), np.empty((len(points_xy), k), dtype=np.int64)
+        for lo in range(0, len(points_xy), self.CHUNK):
+            chunk = points_xy[lo:lo + self.CHUNK]
+            d = np.sqrt((chunk[:, 0, None] - self.xy[:, 0])**2 + (chunk[:, 1, None] - self.xy[:, 1])**2)
+            part = np.argpartition(d, k - 1, axis=1)[:, :k] if k < d.shape[1] else np.tile(np.arange(k), (len(d), 1))
+            part_d = np.take_along_axis(d, part, axis=1)
+            order = np.lexsort((part, part_d))
+            idx[lo:lo + len(chunk)] = np.take_along_axis(part, order, axis=1)
+            dist[lo:lo + len(chunk)] = np.take_along_axis(part_d, order, axis=1)
+        return dist, idx
+
+    def snap(self, points_xy):
+        """Id of the closest edge for every point."""
+        _, idx = self.nearest(points_xy, k=1)
+        return self.edge_ids[idx[:, 0]]
+
+    def snap_directional(self, origins_xy, dests_xy, k=5):
+        """Among the k edges closest to each origin, the one best aligned with the origin -> destination direction."""
+        origins_xy = np.atleast_2d(np.asarray(origins_xy, dtype=float))
+        dests_xy = np.atleast_2d(np.asarray(dests_xy, dtype=float))
+        trip_angle = np.arctan2(dests_xy[:, 1] - origins_xy[:, 1], dests_xy[:, 0] - origins_xy[:, 0])
+        _, idx = self.nearest(origins_xy, k=k)
+        best = np.argmin(angle_diff(self.angles[idx], trip_angle[:, None]), axis=1)
+        return self.edge_ids[idx[np.arange(len(idx)), best]]
@@ -0,0 +1,318 @@
+"""Searches the smallest ARTS fleet that meets an average waiting-time target.
+
+For every (vehicle capacity, depot distribution) the fleet size is found by a parallel k-section
+search: each round evaluates up to `workers` sizes between the largest failing and the smallest
+passing size at once (k = 1 is plain bisection). Fleets are written as arts.rou.xml variants and
+simulated through TraCI; a run is aborted as soon as the waiting time riders have already
+accumulated proves that the average over all rides of the demand exceeds the target.
+
+    python pipeline/fleet_sweep.py --target 120 --capacities 4 8 12 --depots shipped demand \\
+        --max-size 40 --workers 32
+"""
+import argparse
+import math
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+if 'SUMO_HOME' in os.environ:
+    sys.path.append(os.path.join(os.environ['SUMO_HOME'], 'tools'))
+else:
+    sys.path.append('/usr/local/share/sumo/tools')
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import traci
+import traci.constants as tc
+from pipeline.net_cache import load_network
+from pipeline.route_writer import RouteFileWriter
+from pipeline.run_scenarios import DEFAULT_DEMAND, OUTPUTS, REPO_ROOT, SCENARIOS, find_sumo, sumo_command
+from pipeline.sumo_output import iter_records, read_person_stages
+from pipeline.tables import write_table
+
+SHUTTLE_DIR = SCENARIOS["shuttles"]
+SHIPPED_FLEET = SHUTTLE_DIR / "arts.rou.xml"
+DEPOT_STRATEGIES = ("shipped", "uniform", "demand")
+# The shipped fleet parks vehicles in 5 m slots every 6 m along a depot lane (0-5, 6-11, 12-17)
+SLOT_LENGTH, SLOT_SPACING = 5., 6.
+# Only tripinfo and statistics are read; every other output of sumo.sumocfg is discarded so
+# parallel runs never write into the shared (tracked) output/ directory
+SWEEP_OUTPUTS = {**{option: os.devnull for option in OUTPUTS},
+                 "tripinfo-output": "tripinfo.xml", "statistic-output": "statistics.xml"}
+
+
+# --- FLEET VARIANTS ---
+def read_fleet(path=SHIPPED_FLEET):
+    """(vType attributes, vType <param> attributes, depot stops as (lane, startPos, endPos)) of a fleet file."""
+    root = ET.parse(path).getroot()
+    vtype = root.find('vType')
+    depots = [(stop.get('lane'), float(stop.get('startPos')), float(stop.get('endPos')))
+              for stop in root.iter('stop')]
+    return dict(vtype.attrib), [dict(p.attrib) for p in vtype.findall('param')], depots
+
+
+def taxi_lanes(net):
+    """The first lane of every edge that taxis may use, in network order."""
+    lanes, seen = [], set()
+    for lane in np.argsort(net.lane_index, kind='stable'):
+        allow, disallow = net.lane_allow[lane].split(), net.lane_disallow[lane].split()
+        edge = net.lane_edge[lane]
+        if edge in seen or (allow and 'taxi' not in allow) or 'taxi' in disallow:
+            continue
+        seen.add(edge)
+        lanes.append(lane)
+    return sorted(lanes, key=lambda lane: net.lane_edge[lane])
+
+
+def spread_order(points):
+    """Farthest-point ordering: every next point is the one farthest from all points chosen before."""
+    order = [0]
+    dist = np.hypot(*(points - points[0]).T)
+    for _ in range(len(points) - 1):
+        nxt = int(np.argmax(dist))
+        order.append(nxt)
+        dist = np.minimum(dist, np.hypot(*(points - points[nxt]).T))
+    return order
+
+
+def pickup_counts(demand_file):
+    """Number of taxi rides starting on each edge of a persons route file."""
+    counts = Counter()
+    for person in iter_records(demand_file, 'person'):
+        counts.update(ride.get('from') for ride in person.iter('ride'))
+    return counts
+
+
+def depot_lanes(net, strategy, demand_file=None, shipped_depots=()):
+    """Lane ids in the order depots are filled for a strategy.
+
+    shipped: the lanes of arts.rou.xml first; uniform: spread evenly over the network;
+    demand: lanes with the most pickups first. Remaining lanes follow in uniform order.
+    """
+    lanes = taxi_lanes(net)
+    uniform = [str(net.lane_id[lanes[i]]) for i in spread_order(net.edge_mid[net.lane_edge[lanes]])]
+    if strategy == 'uniform':
+        first = []
+    elif strategy == 'shipped':
+        first = list(dict.fromkeys(lane for lane, _, _ in shipped_depots))
+    elif strategy == 'demand':
+        counts = pickup_counts(demand_file)
+        lane_count = {lane: counts[net.edge_id[net.lane_edge[net.lane_lookup[lane]]]] for lane in uniform}
+        first = sorted((lane for lane in uniform if lane_count[lane] > 0), key=lambda lane: -lane_count[lane])
+    else:
+        raise ValueError(f"Unknown depot strategy '{strategy}' (expected one of {', '.join(DEPOT_STRATEGIES)})")
+    chosen = set(first)
+    return first + [lane for lane in uniform if lane not in chosen]
+
+
+def place_depots(size, lanes, lane_length, fixed=()):
+    """Depot stops for `size` vehicles: the `fixed` stops first, then one slot per lane round-robin."""
+    depots = list(fixed[:size])
+    used = Counter(lane for lane, _, _ in depots)
+    while len(depots) < size:
+        placed = False
+        for lane in lanes:
+            start = used[lane] * SLOT_SPACING
+            if len(depots) == size or start + SLOT_LENGTH > lane_length[lane]:
+                continue
+            depots.append((lane, start, start + SLOT_LENGTH))
+            used[lane] += 1
+            placed = True
+        if not placed:
+            raise ValueError(f"Not enough lane space for {size} depot slots")
+    return depots
+
+
+def write_fleet(path, depots, capacity, vtype, params):
+    """Writes an arts.rou.xml variant: the shipped vType with `capacity` and one trip per depot stop."""
+    with RouteFileWriter(path) as routes:
+        routes.write('vType', {**vtype, 'personCapacity': str(capacity)}, [('param', p) for p in params])
+        for i, (lane, start, end) in enumerate(depots):
+            routes.write('trip', {'id': f'drt_{i}', 'type': vtype['id'], 'depart': '0'}, [
+                ('stop', {'lane': lane, 'startPos': f'{start:g}', 'endPos': f'{end:g}', 'triggered': 'person'})
+            ])
+    return path
+
+
+# --- SIMULATION WITH EARLY ABORT ---
+def count_rides(demand_file):
+    return sum(len(person.findall('ride')) for person in iter_records(demand_file, 'person'))
+
+
+def simulate(run, run_dir, sumo_binary, target, expected_rides, check_every=300.):
+    """Runs a fleet through TraCI, checking every `check_every` simulated seconds.
+
+    Waiting times only grow and the average is taken over all `expected_rides`, so the waiting
+    already accumulated / expected_rides is a lower bound of the final average; the run is
+    aborted once that bound exceeds the target. Returns (waiting lower bound, aborted, end time).
+    """
+    waited = {}
+    with open(run_dir / 'sumo.log', 'w') as log:
+        traci.start(sumo_command(run, run_dir, sumo_binary, outputs=SWEEP_OUTPUTS), stdout=log)
+        try:
+            while traci.simulation.getMinExpectedNumber() > 0:
+                traci.simulationStep(traci.simulation.getTime() + check_every)
+                for person in traci.person.getIDList():
+                    # Waiting for a ride: in a driving stage but not yet in a vehicle
+                    if traci.person.getVehicle(person) or traci.person.getStage(person).type != tc.STAGE_DRIVING:
+                        continue
+                    waited[person, traci.person.getRemainingStages(person)] = traci.person.getWaitingTime(person)
+                if sum(waited.values()) / expected_rides > target:
+                    return sum(waited.values()) / expected_rides, True, traci.simulation.getTime()
+            return sum(waited.values()) / expected_rides, False, traci.simulation.getTime()
+        finally:
+            traci.close()
+
+
+def evaluate(spec):
+    """Simulates one (fleet size, capacity, depots, seed) and returns its row; top-level for the process pool."""
+    run_dir = Path(spec['out']) / f"n{spec['size']}_c{spec['capacity']}_{spec['depots']}_s{spec['seed']}"
+    run_dir.mkdir(parents=True, exist_ok=True)
+    fleet = write_fleet(run_dir / 'arts.rou.xml', spec['depot_stops'], spec['capacity'], spec['vtype'], spec['params'])
+    run = {'scenario': 'shuttles', 'seed': spec['seed'], 'algorithm': spec['algorithm'],
+           'period': spec['period'], 'demand': spec['demand'], 'fleet': str(fleet)}
+    row = {k: spec[k] for k in ('size', 'capacity', 'depots', 'seed')}
+    start = time.perf_counter()
+    try:
+        bound, aborted, end_time = simulate(run, run_dir, spec['sumo'], spec['target'], spec['expected_rides'],
+                                            spec['check_every'])
+        row.update(aborted=aborted, end_time=end_time, avg_waiting=bound, served=None, error=None)
+        if not aborted:
+            rides = read_person_stages(run_dir / SWEEP_OUTPUTS['tripinfo-output'], 'ride', columns=['waitingTime'])
+            row.update(served=len(rides), avg_waiting=rides['waitingTime'].mean() if len(rides) else math.inf)
+    except Exception as e:
+        row.update(aborted=False, end_time=None, avg_waiting=math.inf, served=None, error=str(e))
+    # Unserved rides do not show up in tripinfo, so a fleet only passes when it serves every ride
+    row['passes'] = (row['error'] is None and not row['aborted'] and row['served'] == spec['expected_rides']
+                     and row['avg_waiting'] <= spec['target'])
+    row['wall_time_s'] = round(time.perf_counter() - start, 3)
+    return row
+
+
+# --- SEARCH ---
+class FleetSearch:
+    """k-section search for the smallest passing fleet size of one (capacity, depots) configuration."""
+
+    def __init__(self, capacity, depots, min_size, max_size):
+        self.capacity, self.depots = capacity, depots
+        self.min_size, self.max_size = min_size, max_size
+        self.results = {}
+
+    @property
+    def best(self):
+        """Smallest passing size so far (None while no size passed)."""
+        passing = [size for size, ok in self.results.items() if ok]
+        return min(passing) if passing else None
+
+    @property
+    def lower(self):
+        """Largest failing size below the best one (min_size - 1 while none failed)."""
+        best = self.best if self.best is not None else self.max_size + 1
+        failing = [size for size, ok in self.results.items() if not ok and size < best]
+        return max(failing, default=self.min_size - 1)
+
+    @property
+    def done(self):
+        if self.best is None:
+            return self.results.get(self.max_size) is False
+        return self.best - self.lower <= 1
+
+    def candidates(self, k):
+        """Up to k sizes splitting the open interval evenly; max_size is always tried in the first round."""
+        if self.done:
+            return []
+        lower = self.lower
+        upper = self.best if self.best is not None else self.max_size + 1
+        n = min(k, upper - lower - 1)
+        sizes = {lower + round((upper - lower) * (i + 1) / (n + 1)) for i in range(n)}
+        if self.best is None and self.max_size not in self.results:
+            sizes.discard(max(sizes))
+            sizes.add(self.max_size)
+        return sorted(size for size in sizes if lower < size < upper)
+
+    def update(self, size, passes):
+        self.results[size] = passes
+
+
+def sweep(target, capacities=(12,), depot_strategies=('shipped',), seeds=(42,), min_size=1, max_size=40,
+          algorithm=None, period=None, demand=None, workers=None, out_root=None, sumo_binary=None,
+          check_every=300.):
+    """Runs all fleet searches, sharing one process pool; returns (per-run rows, per-configuration summary).
+
+    A fleet size passes when it meets the target for every seed.
+    """
+    workers = workers or os.cpu_count()
+    out_root = Path(out_root or REPO_ROOT / 'runs' / 'fleet_sweep')
+    demand = str(Path(demand).resolve()) if demand else str(SHUTTLE_DIR / DEFAULT_DEMAND)
+    net = load_network(SHUTTLE_DIR / 'network.net.xml')
+    lane_length = dict(zip(net.lane_id.tolist(), net.lane_length.tolist()))
+    vtype, params, shipped = read_fleet()
+    lanes = {strategy: depot_lanes(net, strategy, demand, shipped) for strategy in depot_strategies}
+    base = {'target': target, 'algorithm': algorithm, 'period': period, 'demand': demand,
+            'expected_rides': count_rides(demand), 'vtype': vtype, 'params': params,
+            'out': str(out_root), 'sumo': sumo_binary or find_sumo(), 'check_every': check_every}
+
+    searches = [FleetSearch(capacity, strategy, min_size, max_size)
+                for capacity in capacities for strategy in depot_strategies]
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while active := [s for s in searches if not s.done]:
+            k = max(1, workers // (len(active) * len(seeds)))
+            futures = {}
+            for search in active:
+                for size in search.candidates(k):
+                    fixed = shipped if search.depots == 'shipped' else ()
+                    depot_stops = place_depots(size, lanes[search.depots], lane_length, fixed)
+                    for seed in seeds:
+                        spec = {**base, 'size': size, 'capacity': search.capacity, 'depots': search.depots,
+                                'seed': seed, 'depot_stops': depot_stops}
+                        futures[pool.submit(evaluate, spec)] = (search, size)
+            verdicts = {}
+            for future in as_completed(futures):
+                search, size = futures[future]
+                row = future.result()
+                rows.append(row)
+                verdicts[search, size] = verdicts.get((search, size), True) and row['passes']
+                status = row['error'] or ('aborted' if row['aborted'] else f"avg waiting {row['avg_waiting']:.1f} s")
+                print(f"fleet {size:>3} x cap {search.capacity} ({search.depots}, seed {row['seed']}): {status}")
+            for (search, size), passes in verdicts.items():
+                search.update(size, passes)
+
+    summary = pd.DataFrame([{'capacity': s.capacity, 'depots': s.depots, 'min_fleet': s.best,
+                             'runs': len(s.results) * len(seeds)} for s in searches])
+    return pd.DataFrame(rows), summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', type=float, required=True, help='average waiting-time target in seconds')
+    parser.add_argument('--capacities', nargs='+', type=int, default=[12])
+    parser.add_argument('--depots', nargs='+', default=['shipped'], choices=DEPOT_STRATEGIES)
+    parser.add_argument('--seeds', nargs='+', type=int, default=[42])
+    parser.add_argument('--min-size', type=int, default=1)
+    parser.add_argument('--max-size', type=int, default=40)
+    parser.add_argument('--algorithm', default=None, help='taxi dispatch algorithm (default: sumo.sumocfg)')
+    parser.add_argument('--period', type=float, default=None, help='taxi dispatch period in seconds')
+    parser.add_argument('--demand', default=None, help='person route file (default: shuttles persons.rou.xml)')
+    parser.add_argument('--check-every', type=float, default=300., help='simulated seconds between abort checks')
+    parser.add_argument('--workers', type=int, default=None, help='concurrent sumo processes (default: all cores)')
+    parser.add_argument('--out', default=str(REPO_ROOT / 'runs' / 'fleet_sweep'))
+    parser.add_argument('--sumo', default=None, help='sumo binary (default: $SUMO_BINARY, PATH or $SUMO_HOME)')
+    args = parser.parse_args(argv)
+
+    runs, summary = sweep(args.target, args.capacities, args.depots, args.seeds, args.min_size, args.max_size,
+                          args.algorithm, args.period, args.demand, args.workers, args.out, args.sumo,
+                          args.check_every)
+    write_table(runs, Path(args.out) / 'fleet_sweep_runs.parquet')
+    write_table(summary, Path(args.out) / 'fleet_sweep.parquet')
+    print("\n" + summary.to_string(index=False))
+    return summary
+
+
+if __name__ == '__main__':
+    main()
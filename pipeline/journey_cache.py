@@ -0,0 +1,59 @@
+"""Bounded LRU memo for journey planning queries, bucketed by departure time.
+
+Persons of the same house and destination walk to the same stops and often leave within minutes of
+each other. A planner keys its work by (origin stops, destination stops, departure bucket) and
+stores an answer that is valid for the whole bucket, typically every option from the start of the
+bucket onwards. On a hit the caller still filters that answer by its exact departure time, so a
+cached result is never stale.
+"""
+import math
+from collections import OrderedDict
+
+
+class JourneyCache:
+    """LRU mapping of (origin key, destination key, departure bucket) to a stored answer, with counters."""
+
+    def __init__(self, maxsize=4096, bucket_s=900):
+        self.maxsize, self.bucket_s = maxsize, bucket_s
+        self.entries = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def bucket(self, depart):
+        """Index of the bucket containing `depart` [s]."""
+        return math.floor(depart / self.bucket_s)
+
+    def bucket_start(self, depart):
+        """Earliest departure of the bucket containing `depart`; a stored answer must cover it onwards."""
+        return self.bucket(depart) * self.bucket_s
+
+    def key(self, origin, destination, depart):
+        return origin, destination, self.bucket(depart)
+
+    def get(self, key):
+        """The stored answer (marked most recently used), or None."""
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.}
@@ -0,0 +1,177 @@
+"""Rolling-horizon MILP dispatcher for the ARTS fleet (PuLP + CBC), with an insertion fallback.
+
+Every dispatch step builds candidate trips per taxi: bundles of up to `max_bundle` open reservations,
+each inserted into the taxi's current stop sequence with the checks of drt_dispatch (capacity,
+waiting time, detour). A small MILP then picks at most one bundle per taxi and at most one per
+reservation, minimising the added driving time, weighted waiting and a penalty per reservation left
+open.
+
+Only bundles whose first new pickup falls inside the commit horizon are dispatched. The others stay
+tentative and are solved again on the next step, starting from that tentative plan (CBC warm start).
+A greedy pick over the same bundles is the fallback when PuLP is missing, the solve fails or finds no
+solution, or it overruns its wall-time limit, so a step never waits for the solver.
+
+    python pipeline/profile_sim.py --scenario shuttles --dispatcher pipeline.milp_dispatch:dispatch --period 30
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pipeline.drt_dispatch import InsertionDispatcher
+
+try:
+    import pulp
+except ImportError:  # PuLP is optional; every step then uses the greedy plan
+    pulp = None
+
+
+class RollingHorizonDispatcher(InsertionDispatcher):
+    """InsertionDispatcher whose per-step assignment is a bundle MILP over all open reservations."""
+
+    def __init__(self, time_limit=1., commit_horizon=300., max_bundle=2, max_bundles=40,
+                 unassigned_penalty=3600., budget_s=2., **kwargs):
+        super().__init__(budget_s=budget_s, **kwargs)
+        self.time_limit = time_limit
+        self.commit_horizon = commit_horizon
+        self.max_bundle, self.max_bundles = max_bundle, max_bundles
+        self.unassigned_penalty = unassigned_penalty
+        self.tentative = {}  # taxi -> reservation ids planned on the previous step but not dispatched
+
+    def _bundles(self, sim, taxi, state, candidates, now, reservations, deadline):
+        """{frozenset of reservation ids: (cost, plan, duration, first pickup eta)} for one taxi."""
+        bundles, level = {}, {frozenset(): (0., state["plan"], state["cost"], None)}
+        for _ in range(self.max_bundle):
+            next_level = {}
+            for key, (cost, plan, duration, first) in level.items():
+                base = {**state, "plan": plan, "cost": duration}
+                for res in candidates:
+                    if res.id in key or time.perf_counter() > deadline:
+                        continue
+                    insertion = self._best_insertion(sim, res, taxi, base, now, reservations)
+                    if insertion is None:
+                        continue
+                    added, new_plan, new_duration = insertion
+                    bundle = key | {res.id}
+                    pickup = self._pickup_eta(sim, new_plan, state, now, reservations, res.id)
+                    entry = (cost + added, new_plan, new_duration, pickup if first is None else min(first, pickup))
+                    if bundle not in next_level or entry[0] < next_level[bundle][0]:
+                        next_level[bundle] = entry
+            # Keep the cheapest bundles per request count to bound the MILP size
+            level = dict(sorted(next_level.items(), key=lambda item: item[1][0])[:self.max_bundles])
+            bundles.update(level)
+            if not level:
+                break
+        return bundles
+
+    def _pickup_eta(self, sim, plan, state, now, reservations, res_id):
+        """Arrival time of the taxi at the pickup of `res_id` along `plan`."""
+        _, etas = self._evaluate(sim, plan, state["edge"], state["load"], float("inf"), now, reservations)
+        return etas[plan.index((res_id, True))]
+
+    def _greedy(self, options):
+        """Cheapest-first disjoint choice of (taxi, bundle): the warm start and the fallback plan."""
+        chosen, used_taxis, used_res = {}, set(), set()
+        ranked = sorted(options.items(), key=lambda item: item[1][0] - self.unassigned_penalty * len(item[0][1]))
+        for (taxi, bundle), _ in ranked:
+            if taxi in used_taxis or used_res & bundle:
+                continue
+            chosen[taxi] = bundle
+            used_taxis.add(taxi)
+            used_res |= bundle
+        return chosen
+
+    def _solve(self, options, pending, warm):
+        """Optimal (taxi -> bundle) within the time limit, or None when no solution comes back in time."""
+        problem = pulp.LpProblem("drt", pulp.LpMinimize)
+        x = {key: pulp.LpVariable(f"x_{n}", cat="Binary") for n, key in enumerate(options)}
+        unassigned = {res.id: pulp.LpVariable(f"u_{n}", lowBound=0) for n, res in enumerate(pending)}
+        problem += (pulp.lpSum(options[key][0] * var for key, var in x.items())
+                    + self.unassigned_penalty * pulp.lpSum(unassigned.values()))
+        by_taxi, by_res = {}, {res_id: [] for res_id in unassigned}
+        for (taxi, bundle), var in x.items():
+            by_taxi.setdefault(taxi, []).append(var)
+            for res_id in bundle:
+                by_res[res_id].append(var)
+        for variables in by_taxi.values():
+            problem += pulp.lpSum(variables) <= 1
+        for res_id, variables in by_res.items():
+            problem += pulp.lpSum(variables) + unassigned[res_id] == 1
+
+        for (taxi, bundle), var in x.items():
+            var.setInitialValue(1 if warm.get(taxi) == bundle else 0)
+        for res_id, var in unassigned.items():
+            var.setInitialValue(0 if any(res_id in bundle for bundle in warm.values()) else 1)
+
+        start = time.perf_counter()
+        try:
+            problem.solve(pulp.PULP_CBC_CMD(msg=False, timeLimit=self.time_limit, warmStart=True))
+        except pulp.PulpSolverError:
+            # CBC missing or crashed; the greedy pick takes over
+            return None
+        if time.perf_counter() - start > self.time_limit * 1.5 or problem.sol_status not in (
+                pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible):
+            return None
+        return {taxi: bundle for (taxi, bundle), var in x.items() if (var.value() or 0) > 0.5}
+
+    def __call__(self, sim, now):
+        deadline = time.perf_counter() + self.budget_s
+        start = time.perf_counter()
+        reservations, pending, taxis, states = self._sync(sim, now)
+
+        # Candidate reservations per taxi: those it is among the nearest taxis for
+        candidates = {taxi: [] for taxi in taxis}
+        for res in pending:
+            for taxi in self._nearest(sim, taxis, states, res):
+                candidates[taxi].append(res)
+        options = {}
+        for taxi in taxis:
+            for bundle, entry in self._bundles(sim, taxi, states[taxi], candidates[taxi], now, reservations,
+                                               deadline).items():
+                options[(taxi, bundle)] = entry
+
+        # Warm start: last step's tentative bundles where they are still candidates, greedy elsewhere
+        greedy = self._greedy(options)
+        warm = {taxi: frozenset(ids) for taxi, ids in self.tentative.items() if (taxi, frozenset(ids)) in options}
+        taken = {res_id for bundle in warm.values() for res_id in bundle}
+        for taxi, bundle in greedy.items():
+            if taxi not in warm and not bundle & taken:
+                warm[taxi] = bundle
+                taken |= bundle
+
+        solve_start = time.perf_counter()
+        chosen, status = None, "greedy"
+        if pulp is not None and options:
+            chosen = self._solve(options, pending, warm)
+            status = "milp" if chosen is not None else "fallback"
+        if chosen is None:
+            chosen = greedy
+        solve_s = time.perf_counter() - solve_start
+
+        # Commit bundles with a pickup inside the horizon, keep the rest for the next step
+        changed, committed, self.tentative = set(), 0, {}
+        for taxi, bundle in chosen.items():
+            cost, plan, duration, first_pickup = options[(taxi, bundle)]
+            if first_pickup - now <= self.commit_horizon:
+                states[taxi]["plan"], states[taxi]["cost"] = plan, duration
+                changed.add(taxi)
+                committed += len(bundle)
+            else:
+                self.tentative[taxi] = set(bundle)
+
+        self._dispatch(sim, now, states, changed)
+        self.log.append({"time": now, "open": len(pending), "assigned": committed, "taxis_changed": len(changed),
+                         "compute_s": time.perf_counter() - start, "budget_hit": time.perf_counter() > deadline,
+                         "tentative": sum(len(ids) for ids in self.tentative.values()), "options": len(options),
+                         "solver": status, "solve_s": solve_s})
+
+    def stats(self):
+        """Per dispatch step, as InsertionDispatcher.stats plus tentative reservations, MILP size and solver outcome."""
+        df = super().stats()
+        for column in ("tentative", "options", "solver", "solve_s"):
+            df[column] = [row.get(column) for row in self.log]
+        return df
+
+
+# Default instance for profile_sim.py --dispatcher pipeline.milp_dispatch:dispatch
+dispatch = RollingHorizonDispatcher()
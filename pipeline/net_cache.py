@@ -0,0 +1,202 @@
+import hashlib
+import math
+import os
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import numpy as np
+
+CACHE_VERSION = 2
+CACHE_DIR_NAME = ".netcache"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-1 of a file's content, used as cache key."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def parse_shape(shape):
+    return [tuple(map(float, p.split(','))) for p in shape.split(' ')]
+
+
+def position_at_offset(shape, offset):
+    """Point at `offset` metres along a polyline (same rules as sumolib.geomhelper.positionAtShapeOffset)."""
+    seen = 0.
+    for p1, p2 in zip(shape[:-1], shape[1:]):
+        dist = math.sqrt((p1[0] - p2[0])**2 + (p1[1] - p2[1])**2)
+        if seen + dist > offset:
+            rest = offset - seen
+            if math.isclose(rest, 0.):
+                return p1
+            if math.isclose(dist, rest):
+                return p2
+            return (p1[0] + (p2[0] - p1[0]) * (rest / dist), p1[1] + (p2[1] - p1[1]) * (rest / dist))
+        seen += dist
+    return shape[-1]
+
+
+class Network:
+    """Parsed network.net.xml held as flat NumPy arrays.
+
+    Edges (non-internal, file order): edge_id, edge_from, edge_to, edge_length, edge_speed
+    (first lane), edge_mid (middle vertex of the first lane shape), edge_angle (first -> last
+    vertex), edge_start_angle / edge_end_angle (first / last shape segment) and edge_lanes
+    (offsets into the lane arrays). Lanes: lane_id, lane_edge, lane_index, lane_length,
+    lane_speed, lane_allow, lane_disallow and lane_shape (offsets into shape_xy).
+    Connections between edges (unique edge pairs, internal ones left out): conn_from, conn_to
+    (edge indices).
+    Bus stops, when loaded with a stops file: stop_id, stop_lane, stop_start, stop_end, stop_xy.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        for name, values in arrays.items():
+            setattr(self, name, values)
+        self.edge_index = {eid: i for i, eid in enumerate(self.edge_id)}
+        self.lane_lookup = {lid: i for i, lid in enumerate(self.lane_id)}
+
+    def edge_allows(self, vclass):
+        """Boolean mask of the edges where at least one lane permits `vclass`."""
+        lane_ok = np.array([lane_allows(allow, disallow, vclass)
+                            for allow, disallow in zip(self.lane_allow.tolist(), self.lane_disallow.tolist())], dtype=bool)
+        if not len(lane_ok):
+            return np.zeros(len(self.edge_id), dtype=bool)
+        return np.logical_or.reduceat(lane_ok, self.edge_lanes[:-1]) & (np.diff(self.edge_lanes) > 0)
+
+    def lane_shape_xy(self, lane):
+        """(n, 2) polyline of a lane given by index."""
+        return self.shape_xy[self.lane_shape[lane]:self.lane_shape[lane + 1]]
+
+    def edge_shape_xy(self, edge):
+        """(n, 2) polyline of an edge's first lane given by edge index."""
+        return self.lane_shape_xy(self.edge_lanes[edge])
+
+
+def lane_allows(allow, disallow, vclass):
+    """SUMO lane permissions: `allow` (when set) lists the permitted classes, else `disallow` the forbidden ones."""
+    if allow:
+        classes = allow.split()
+        return vclass in classes or 'all' in classes
+    classes = disallow.split()
+    return not (vclass in classes or 'all' in classes)
+
+
+def _heading(p1, p2):
+    return math.atan2(p2[1] - p1[1], p2[0] - p1[0])
+
+
+def _parse_net(net_file):
+    edges = {k: [] for k in ('id', 'from', 'to', 'length', 'speed', 'mid', 'angle', 'start_angle', 'end_angle')}
+    lanes = {k: [] for k in ('id', 'edge', 'index', 'length', 'speed', 'allow', 'disallow')}
+    edge_lanes, lane_shape, shape_xy = [0], [0], []
+    connections, edge_index = {}, {}
+
+    # Only top-level elements are inspected; each is dropped once handled so memory stays bounded
+    depth, root = 0, None
+    for event, elem in ET.iterparse(net_file, events=('start', 'end')):
+        if event == 'start':
+            root = elem if root is None else root
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        if elem.tag == 'connection':
+            # Edges come before connections in a .net.xml, so both ends are known here
+            key = (edge_index.get(elem.get('from')), edge_index.get(elem.get('to')))
+            if None not in key:
+                connections[key] = None
+            root.clear()
+            continue
+        eid = elem.get('id')
+        lane_elems = elem.findall('lane') if elem.tag == 'edge' else []
+        if eid and not eid.startswith(':') and lane_elems:
+            for lane in lane_elems:
+                coords = parse_shape(lane.get('shape'))
+                lanes['id'].append(lane.get('id'))
+                lanes['edge'].append(len(edges['id']))
+                lanes['index'].append(int(lane.get('index')))
+                lanes['length'].append(float(lane.get('length')))
+                lanes['speed'].append(float(lane.get('speed')))
+                lanes['allow'].append(lane.get('allow', ''))
+                lanes['disallow'].append(lane.get('disallow', ''))
+                shape_xy.extend(coords)
+                lane_shape.append(len(shape_xy))
+
+            first = parse_shape(lane_elems[0].get('shape'))
+            edge_index[eid] = len(edges['id'])
+            edges['id'].append(eid)
+            edges['from'].append(elem.get('from'))
+            edges['to'].append(elem.get('to'))
+            edges['length'].append(float(lane_elems[0].get('length')))
+            edges['speed'].append(float(lane_elems[0].get('speed')))
+            edges['mid'].append(first[len(first) // 2])
+            edges['angle'].append(_heading(first[0], first[-1]))
+            edges['start_angle'].append(_heading(first[0], first[1]))
+            edges['end_angle'].append(_heading(first[-2], first[-1]))
+            edge_lanes.append(len(lanes['id']))
+        root.clear()
+
+    arrays = {f'edge_{k}': np.array(v, dtype=float if k not in ('id', 'from', 'to') else str)
+              for k, v in edges.items()}
+    arrays['edge_mid'] = arrays['edge_mid'].reshape(-1, 2)
+    arrays['edge_lanes'] = np.array(edge_lanes, dtype=np.int64)
+    for k, v in lanes.items():
+        dtype = str if k in ('id', 'allow', 'disallow') else (np.int64 if k in ('edge', 'index') else float)
+        arrays[f'lane_{k}'] = np.array(v, dtype=dtype)
+    arrays['lane_shape'] = np.array(lane_shape, dtype=np.int64)
+    arrays['shape_xy'] = np.array(shape_xy, dtype=float).reshape(-1, 2)
+    conn = np.array(list(connections), dtype=np.int64).reshape(-1, 2)
+    arrays['conn_from'], arrays['conn_to'] = conn[:, 0], conn[:, 1]
+    return arrays
+
+
+def _parse_stops(stops_file, net):
+    ids, lanes, starts, ends, xy = [], [], [], [], []
+    for _, elem in ET.iterparse(stops_file, events=('end',)):
+        if elem.tag == 'busStop':
+            lane = net.lane_lookup[elem.get('lane')]
+            start, end = float(elem.get('startPos')), float(elem.get('endPos'))
+            shape = [tuple(p) for p in net.lane_shape_xy(lane).tolist()]
+            ids.append(elem.get('id'))
+            lanes.append(lane)
+            starts.append(start)
+            ends.append(end)
+            xy.append(position_at_offset(shape, (start + end) / 2))
+            elem.clear()
+    return {
+        'stop_id': np.array(ids, dtype=str), 'stop_lane': np.array(lanes, dtype=np.int64),
+        'stop_start': np.array(starts), 'stop_end': np.array(ends),
+        'stop_xy': np.array(xy, dtype=float).reshape(-1, 2),
+    }
+
+
+def cache_path(net_file, stops_file=None, cache_dir=None):
+    key = file_hash(net_file)
+    if stops_file is not None:
+        key += '-' + file_hash(stops_file)[:16]
+    cache_dir = Path(cache_dir) if cache_dir else Path(net_file).resolve().parent / CACHE_DIR_NAME
+    return cache_dir / f"net-v{CACHE_VERSION}-{key}.npz"
+
+
+def load_network(net_file, stops_file=None, cache_dir=None):
+    """Loads a Network from the .npz cache, parsing (and caching) the XML only when its content changed."""
+    path = cache_path(net_file, stops_file, cache_dir)
+    if path.exists():
+        with np.load(path) as data:
+            return Network({name: data[name] for name in data.files})
+
+    net = Network(_parse_net(net_file))
+    arrays = dict(net.arrays)
+    if stops_file is not None:
+        arrays.update(_parse_stops(stops_file, net))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+    return Network(arrays)
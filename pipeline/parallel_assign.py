@@ -0,0 +1,84 @@
+"""Parallel Step 1 trip assignment over a process pool, with the timetable in shared memory.
+
+Persons are independent apart from the return leg following their own outbound leg, so the
+personal plans are split into contiguous chunks and each worker runs PTAnalyzer.assign_plans on
+whole persons. The parent parses buses.rou.xml and the network once. Its timetable arrays (and
+the catchment table, when loaded) are copied into multiprocessing.shared_memory blocks, which the
+workers map without copying. Worker analyzers are rebuilt around those arrays and never touch
+sumolib. Chunk results are concatenated in input order, so the output equals the serial
+assign_plans.
+
+    python 1_trip_assignment_complete_with_reverse_path.py --workers 32
+"""
+import importlib.util
+import inspect
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+_worker = {}
+
+
+def share_arrays(arrays):
+    """Copies numpy arrays into new shared memory blocks; returns (blocks, spec) with spec = {name: (block, shape, dtype)}."""
+    blocks, spec = [], {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        spec[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, spec
+
+
+def attach_arrays(spec):
+    """Maps the blocks of a share_arrays spec; returns (blocks, arrays). Keep the blocks open while the arrays are used."""
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
+
+
+def _init_worker(script, spec, state):
+    # The Step 1 script is not an importable module name; load it from its file
+    module_spec = importlib.util.spec_from_file_location("bus_step_1_worker", script)
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+    blocks, arrays = attach_arrays(spec)
+    _worker['blocks'] = blocks
+    _worker['analyzer'] = module.PTAnalyzer.from_shared(arrays, state)
+
+
+def _assign_chunk(chunk, max_walk, max_transfers):
+    return _worker['analyzer'].assign_plans(chunk, max_walk, max_transfers)
+
+
+def assign_parallel(analyzer, df, workers=None, chunk_size=None, max_walk=600, max_transfers=0):
+    """analyzer.assign_plans(df, ...) split over `workers` processes; same (outbound, return, od) frames."""
+    workers = workers or os.cpu_count()
+    if workers <= 1 or len(df) < 2:
+        return analyzer.assign_plans(df, max_walk, max_transfers)
+    if max_transfers and analyzer.raptor is None:
+        analyzer._compile_raptor()
+    # A few chunks per worker evens out chunks of slow (e.g. transfer) legs
+    chunk_size = chunk_size or math.ceil(len(df) / (workers * 4))
+    chunks = [df.iloc[lo:lo + chunk_size] for lo in range(0, len(df), chunk_size)]
+
+    script = inspect.getfile(type(analyzer).assign_plans)  # the Step 1 script, however it was loaded
+    arrays, state = analyzer.shared_state()
+    blocks, spec = share_arrays(arrays)
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_worker,
+                                 initargs=(script, spec, state)) as pool:
+            results = list(pool.map(_assign_chunk, chunks, [max_walk] * len(chunks), [max_transfers] * len(chunks)))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return tuple(pd.concat([result[i] for result in results], ignore_index=True) for i in range(3))
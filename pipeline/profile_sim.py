@@ -0,0 +1,206 @@
+"""Runs a scenario in-process through libsumo (or TraCI) and records where the wall time goes.
+
+Every simulation step gets its wall time, the number of vehicles and persons, the idle taxis
+(shuttles) and whether the taxi dispatcher fired in that step. The series is saved as
+profile.parquet next to the SUMO outputs, optionally also as a Chrome trace (chrome://tracing or
+https://ui.perfetto.dev).
+
+SUMO's built-in dispatchers run inside simulationStep, so their cost is estimated as the extra
+wall time of dispatch steps over the neighbouring non-dispatch steps (this needs a dispatch period
+above 1 s). A Python dispatcher passed with --dispatcher runs between steps and is timed directly.
+
+    python pipeline/profile_sim.py --scenario shuttles --algorithm greedyShared --period 1 --trace
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+if 'SUMO_HOME' in os.environ:
+    sys.path.append(os.path.join(os.environ['SUMO_HOME'], 'tools'))
+else:
+    sys.path.append('/usr/local/share/sumo/tools')
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pipeline.run_scenarios import DEFAULT_DEMAND, OUTPUTS, REPO_ROOT, SCENARIOS, find_sumo, sumo_command
+from pipeline.tables import write_table
+
+# Only tripinfo and statistics are kept; every other output of sumo.sumocfg is discarded so a
+# profiling run leaves the tracked output/ directory alone and writes no per-step emissions to disk
+PROFILE_OUTPUTS = {**{option: os.devnull for option in OUTPUTS},
+                   "tripinfo-output": "tripinfo.xml", "statistic-output": "statistics.xml"}
+DEFAULT_DISPATCH_PERIOD = 60.  # SUMO's default for --device.taxi.dispatch-period
+
+
+def load_backend(name="auto"):
+    """The libsumo module when available (or requested), else traci; both expose the same API."""
+    if name in ("auto", "libsumo"):
+        try:
+            import libsumo
+            return libsumo
+        except ImportError:
+            if name == "libsumo":
+                raise
+    import traci
+    return traci
+
+
+def load_dispatcher(spec):
+    """Resolves a 'module:function' dispatcher, called as function(sim, time) on dispatch steps."""
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def profile(run, run_dir, backend="auto", sumo_binary=None, dispatcher=None, dispatch_period=None, end=None):
+    """Steps one run to the end and returns the per-step profile as a DataFrame.
+
+    `dispatcher` (optional) is called with the simulation module and time on every dispatch step,
+    i.e. every `dispatch_period` simulated seconds, and its wall time is recorded as dispatch_s.
+    """
+    sim = load_backend(backend)
+    run_dir = Path(run_dir)
+    run_dir.mkdir(parents=True, exist_ok=True)
+    cmd = sumo_command(run, run_dir, sumo_binary or find_sumo(), outputs=PROFILE_OUTPUTS)
+    if end is not None:
+        cmd += ["--end", str(end)]
+    has_taxis = run["scenario"] == "shuttles"
+    period = dispatch_period or DEFAULT_DISPATCH_PERIOD
+
+    cols = {name: [] for name in ("time", "start_s", "step_s", "dispatch_s", "vehicles", "persons", "taxis_idle")}
+    with open(run_dir / "sumo.log", "w") as log:
+        if sim.__name__ == "traci":
+            sim.start(cmd, stdout=log)
+        else:
+            sim.start(cmd)
+        t0 = time.perf_counter()
+        try:
+            while sim.simulation.getMinExpectedNumber() > 0:
+                start = time.perf_counter()
+                sim.simulationStep()
+                step_s = time.perf_counter() - start
+                now = sim.simulation.getTime()
+                dispatch_s = 0.
+                if dispatcher is not None and now % period == 0:
+                    d0 = time.perf_counter()
+                    dispatcher(sim, now)
+                    dispatch_s = time.perf_counter() - d0
+                cols["time"].append(now)
+                cols["start_s"].append(start - t0)
+                cols["step_s"].append(step_s)
+                cols["dispatch_s"].append(dispatch_s)
+                cols["vehicles"].append(sim.vehicle.getIDCount())
+                cols["persons"].append(sim.person.getIDCount())
+                cols["taxis_idle"].append(len(sim.vehicle.getTaxiFleet(0)) if has_taxis else -1)
+                if end is not None and now >= end:
+                    break
+        finally:
+            sim.close()
+
+    df = pd.DataFrame({
+        "time": np.array(cols["time"], dtype=np.float64),
+        "start_s": np.array(cols["start_s"], dtype=np.float64),
+        "step_s": np.array(cols["step_s"], dtype=np.float32),
+        "dispatch_s": np.array(cols["dispatch_s"], dtype=np.float32),
+        "vehicles": np.array(cols["vehicles"], dtype=np.int32),
+        "persons": np.array(cols["persons"], dtype=np.int32),
+        "taxis_idle": np.array(cols["taxis_idle"], dtype=np.int32),
+    })
+    df["dispatch_step"] = has_taxis & (df["time"] % period == 0)
+    df["dispatch_est_s"] = estimate_dispatch(df)
+    return df
+
+
+def estimate_dispatch(df, window=60):
+    """Extra wall time of each dispatch step over the rolling median of the non-dispatch steps before it.
+
+    NaN where there is no non-dispatch baseline (e.g. dispatch period 1 s) and 0 on other steps.
+    """
+    baseline = df["step_s"].where(~df["dispatch_step"]).rolling(window, min_periods=1).median().ffill()
+    extra = (df["step_s"] - baseline).clip(lower=0)
+    return extra.where(df["dispatch_step"], 0.).astype(np.float32)
+
+
+def hourly_summary(df):
+    """Per simulated hour: steps, wall time, step time mean / p95 and the share of (estimated) dispatch time."""
+    hour = (df["time"] // 3600).astype(int).rename("hour")
+    grouped = df.groupby(hour)
+    summary = pd.DataFrame({
+        "steps": grouped.size(),
+        "wall_s": grouped["step_s"].sum() + grouped["dispatch_s"].sum(),
+        "step_ms_mean": grouped["step_s"].mean() * 1000,
+        "step_ms_p95": grouped["step_s"].quantile(0.95) * 1000,
+        "dispatch_s": grouped["dispatch_s"].sum() + grouped["dispatch_est_s"].sum(),
+        "vehicles_mean": grouped["vehicles"].mean(),
+        "persons_mean": grouped["persons"].mean(),
+    })
+    summary["dispatch_share"] = summary["dispatch_s"] / summary["wall_s"]
+    return summary.reset_index()
+
+
+def write_chrome_trace(df, path):
+    """Chrome trace: one span per step and per Python dispatch, plus vehicle/person counter tracks."""
+    us = (df["start_s"].to_numpy() * 1e6).round(1)
+    step_us = (df["step_s"].to_numpy(dtype=np.float64) * 1e6).round(1)
+    dispatch_us = (df["dispatch_s"].to_numpy(dtype=np.float64) * 1e6).round(1)
+    events = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "sumo"}},
+              {"name": "thread_name", "ph": "M", "pid": 1, "tid": 1, "args": {"name": "simulationStep"}},
+              {"name": "thread_name", "ph": "M", "pid": 1, "tid": 2, "args": {"name": "dispatch"}}]
+    dispatch_step = df["dispatch_step"].to_numpy()
+    for i, (t, vehicles, persons) in enumerate(zip(df["time"].tolist(), df["vehicles"].tolist(),
+                                                   df["persons"].tolist())):
+        events.append({"name": "dispatch step" if dispatch_step[i] else "step", "ph": "X", "pid": 1, "tid": 1,
+                       "ts": us[i], "dur": step_us[i], "args": {"time": t}})
+        if dispatch_us[i] > 0:
+            events.append({"name": "dispatcher", "ph": "X", "pid": 1, "tid": 2,
+                           "ts": us[i] + step_us[i], "dur": dispatch_us[i], "args": {"time": t}})
+        events.append({"name": "active", "ph": "C", "pid": 1, "ts": us[i],
+                       "args": {"vehicles": vehicles, "persons": persons}})
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, separators=(",", ":"))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", default="shuttles", choices=list(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--algorithm", default=None, help="taxi dispatch algorithm (default: sumo.sumocfg)")
+    parser.add_argument("--period", type=float, default=None, help="taxi dispatch period in seconds")
+    parser.add_argument("--demand", default=None, help="person route file (default: persons.rou.xml)")
+    parser.add_argument("--fleet", default=None, help="fleet route file (default: buses.rou.xml / arts.rou.xml)")
+    parser.add_argument("--dispatcher", default=None,
+                        help="Python dispatcher 'module:function' (implies --algorithm traci)")
+    parser.add_argument("--backend", default="auto", choices=["auto", "libsumo", "traci"])
+    parser.add_argument("--end", type=float, default=None, help="stop after this simulation time")
+    parser.add_argument("--trace", action="store_true", help="also write a Chrome trace (profile.trace.json)")
+    parser.add_argument("--out", default=None, help="output directory (default: runs/profile/<scenario>)")
+    parser.add_argument("--sumo", default=None, help="sumo binary (default: $SUMO_BINARY, PATH or $SUMO_HOME)")
+    args = parser.parse_args(argv)
+
+    dispatcher = load_dispatcher(args.dispatcher) if args.dispatcher else None
+    algorithm = "traci" if dispatcher else args.algorithm
+    run = {"scenario": args.scenario, "seed": args.seed, "algorithm": algorithm, "period": args.period,
+           "demand": str(Path(args.demand).resolve()) if args.demand else DEFAULT_DEMAND,
+           "fleet": str(Path(args.fleet).resolve()) if args.fleet else None}
+    out = Path(args.out or REPO_ROOT / "runs" / "profile" / args.scenario)
+
+    df = profile(run, out, args.backend, args.sumo, dispatcher, args.period, args.end)
+    path = write_table(df, out / "profile.parquet")
+    summary = hourly_summary(df)
+    write_table(summary, out / "profile_hourly.parquet")
+    if args.trace:
+        write_chrome_trace(df, out / "profile.trace.json")
+    if hasattr(dispatcher, "stats"):
+        write_table(dispatcher.stats(), out / "dispatch.parquet")
+
+    print(summary.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    print(f"\n{len(df):,} steps, {df['step_s'].sum() + df['dispatch_s'].sum():.1f} s wall time. Profile saved to: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Round-based public transit router (RAPTOR) over the bus timetable, with transfers.
+
+Trips with the same stop sequence form a route; a route keeps its trips as rows of (trips x stops)
+arrival and departure arrays, ordered so that no trip overtakes an earlier one (routes whose trips
+overtake are split). Round k scans every route serving a stop improved in round k - 1, which yields
+all journeys with k rides; footpaths between nearby stops are relaxed after each round.
+
+Every stop keeps a bag of Pareto labels on (arrival time, walk distance) per round (McRAPTOR), so
+a query returns the Pareto set of journeys over arrival time x transfers x total walk distance.
+Access and egress walks are given per query as {stop id: walk distance}, e.g. all stops within
+max_walk of a home, so the router stays independent of how walks are measured.
+
+    router = Raptor(stop_ids, trips, footpaths)
+    router.query({'bs_3': 120.}, {'bs_40': 80.}, depart=28800, max_transfers=2)
+"""
+import bisect
+
+import numpy as np
+
+WALK_SPEED = 1.1
+
+
+class Route:
+    """Trips sharing one stop sequence: rows of (arrival, departure) per stop, no overtaking."""
+
+    def __init__(self, stops, trips, lines, arrive, depart):
+        self.stops = np.asarray(stops, dtype=np.int64)
+        self.trips, self.lines = trips, lines
+        self.arrive, self.depart = np.asarray(arrive, dtype=float), np.asarray(depart, dtype=float)
+        # Per stop position, the times of all trips as plain lists (scanned one value at a time)
+        self.arrive_at, self.depart_at = self.arrive.T.tolist(), self.depart.T.tolist()
+
+    def __len__(self):
+        return len(self.trips)
+
+
+class Raptor:
+    def __init__(self, stop_ids, trips, footpaths=None, walk_speed=WALK_SPEED):
+        """trips: (trip id, line, [(stop id, arrival, departure), ...]) in stop order.
+
+        footpaths: {stop id: [(other stop id, walk distance [m]), ...]} for transfers on foot.
+        """
+        self.stop_ids = list(stop_ids)
+        self.stop_index = {s: i for i, s in enumerate(self.stop_ids)}
+        self.walk_speed = walk_speed
+        self.routes = self._routes(trips)
+        # Stop -> [(route, position)] of every route serving it
+        self.serving = [[] for _ in self.stop_ids]
+        for r, route in enumerate(self.routes):
+            for pos, s in enumerate(route.stops.tolist()):
+                self.serving[s].append((r, pos))
+        self.footpaths = [[] for _ in self.stop_ids]
+        for s_id, paths in (footpaths or {}).items():
+            self.footpaths[self.stop_index[s_id]] = [(self.stop_index[t_id], float(dist)) for t_id, dist in paths
+                                                     if t_id != s_id]
+
+    def _routes(self, trips):
+        by_sequence = {}
+        for trip_id, line, stops in trips:
+            sequence = tuple(self.stop_index[s] for s, _, _ in stops)
+            if len(sequence) > 1:
+                by_sequence.setdefault(sequence, []).append(
+                    (trip_id, line, [a for _, a, _ in stops], [d for _, _, d in stops]))
+        routes = []
+        for sequence, members in by_sequence.items():
+            # Earliest first; a trip overtaking the last trip of every open route starts a new route
+            members.sort(key=lambda m: (m[3][0], m[2][-1]))
+            groups = []
+            for member in members:
+                for group in groups:
+                    last = group[-1]
+                    if all(a >= b for a, b in zip(member[2], last[2])) and all(a >= b for a, b in zip(member[3], last[3])):
+                        group.append(member)
+                        break
+                else:
+                    groups.append([member])
+            for group in groups:
+                routes.append(Route(sequence, [m[0] for m in group], [m[1] for m in group],
+                                    [m[2] for m in group], [m[3] for m in group]))
+        return routes
+
+    @staticmethod
+    def _dominated(bag, arrival, walk):
+        return any(a <= arrival and w <= walk for a, w, _ in bag)
+
+    @staticmethod
+    def _insert(bag, label):
+        """Adds a label to a Pareto bag on (arrival, walk), dropping the labels it dominates."""
+        arrival, walk, _ = label
+        bag[:] = [old for old in bag if not (arrival <= old[0] and walk <= old[1])]
+        bag.append(label)
+
+    def query(self, access, egress, depart, max_transfers=2):
+        """Pareto-optimal journeys (arrival, transfers, walk) from the access to the egress stops.
+
+        access / egress: {stop id: walk distance [m]} between the origin / destination and the stops.
+        Each journey is a dict with its arrival time, transfers, total walk and legs, earliest first.
+        """
+        # Pareto labels reached by bus in any round so far, for pruning. Access walks stay out of it: a
+        # journey needs at least one ride, so walking to a stop must not hide a bus arrival there
+        best = [[] for _ in self.stop_ids]
+        marked = {}
+        for s_id, dist in access.items():
+            label = (depart + dist / self.walk_speed, float(dist), (('access', s_id, float(dist)),))
+            self._insert(marked.setdefault(self.stop_index[s_id], []), label)
+
+        # Journeys found in earlier rounds; a label they dominate cannot lead to a better one
+        found, target = [], []
+        for _ in range(max_transfers + 1):
+            if not marked:
+                break
+            # Routes to scan, from the first marked stop along each
+            scan = {}
+            for s in marked:
+                for r, pos in self.serving[s]:
+                    scan[r] = min(pos, scan.get(r, pos))
+
+            improved = {}
+            for r, start in scan.items():
+                route = self.routes[r]
+                riding = []  # (trip row, walk, legs, board position), Pareto on (row, walk)
+                for pos in range(start, len(route.stops)):
+                    s = int(route.stops[pos])
+                    arrive_at = route.arrive_at[pos]
+                    for row, walk, legs, board_pos in riding:
+                        arrival = arrive_at[row]
+                        if self._dominated(best[s], arrival, walk) or self._dominated(target, arrival, walk):
+                            continue
+                        label = (arrival, walk, legs + (('bus', r, row, board_pos, pos),))
+                        self._insert(best[s], label)
+                        self._insert(improved.setdefault(s, []), label)
+                    for arrival, walk, legs in marked.get(s, ()):
+                        row = bisect.bisect_left(route.depart_at[pos], arrival)
+                        if row >= len(route) or any(r_ <= row and w <= walk for r_, w, _, _ in riding):
+                            continue
+                        riding = [entry for entry in riding if not (row <= entry[0] and walk <= entry[1])]
+                        riding.append((row, walk, legs, pos))
+
+            # Transfers on foot from the stops reached by bus in this round. Walked arrivals only board in
+            # the next round: journeys end with a bus ride and the egress walk, as the access walk starts them
+            walked = {}
+            for s, labels in improved.items():
+                for t, dist in self.footpaths[s]:
+                    for arrival, walk, legs in labels:
+                        arrival, walk = arrival + dist / self.walk_speed, walk + dist
+                        if (self._dominated(best[t], arrival, walk) or self._dominated(walked.get(t, ()), arrival, walk)
+                                or self._dominated(target, arrival, walk)):
+                            continue
+                        self._insert(walked.setdefault(t, []), (arrival, walk, legs + (('walk', s, t, dist),)))
+
+            for s_id, dist in egress.items():
+                for arrival, walk, legs in improved.get(self.stop_index[s_id], ()):
+                    found.append((arrival + dist / self.walk_speed, walk + dist, legs, s_id, float(dist)))
+            target = [(arrival, walk, None) for arrival, walk, *_ in found]
+            marked = {s: improved.get(s, []) + walked.get(s, []) for s in improved.keys() | walked.keys()}
+
+        # Pareto filter over all rounds: arrival, transfers, walk
+        found = sorted(((arrival, sum(leg[0] == 'bus' for leg in legs) - 1, walk, legs, s_id, dist)
+                        for arrival, walk, legs, s_id, dist in found), key=lambda j: j[:3])
+        journeys = []
+        for arrival, transfers, walk, legs, s_id, dist in found:
+            if not any(j['arrival'] <= arrival and j['transfers'] <= transfers and j['walk'] <= walk for j in journeys):
+                journeys.append({'depart': depart, 'arrival': arrival, 'transfers': transfers, 'walk': walk,
+                                 'legs': self._legs(legs, s_id, dist)})
+        return journeys
+
+    def _legs(self, legs, egress_stop, egress_dist):
+        """Leg dicts of a label: walk (access, transfer, egress) and bus legs with their trip and times."""
+        result = []
+        for leg in legs:
+            if leg[0] == 'access':
+                result.append({'mode': 'walk', 'to': leg[1], 'dist': leg[2]})
+            elif leg[0] == 'walk':
+                result.append({'mode': 'walk', 'from': self.stop_ids[leg[1]], 'to': self.stop_ids[leg[2]], 'dist': leg[3]})
+            else:
+                _, r, row, board_pos, pos = leg
+                route = self.routes[r]
+                result.append({'mode': 'bus', 'trip': route.trips[row], 'line': route.lines[row],
+                               'board': self.stop_ids[route.stops[board_pos]], 'exit': self.stop_ids[route.stops[pos]],
+                               'depart': route.depart_at[board_pos][row], 'arrive': route.arrive_at[pos][row]})
+        result.append({'mode': 'walk', 'from': egress_stop, 'dist': egress_dist})
+        return result
@@ -0,0 +1,74 @@
+import gzip
+import re
+
+ROUTES_SCHEMA = {
+    "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
+    "xsi:noNamespaceSchemaLocation": "http://sumo.dlr.de/xsd/routes_file.xsd",
+}
+
+
+_NEEDS_ESCAPE = re.compile('[&<>"]').search
+
+
+def _escape(value):
+    value = str(value)
+    if not _NEEDS_ESCAPE(value):
+        return value
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace('"', "&quot;").replace(">", "&gt;")
+
+
+def _tag(tag, attrs, close):
+    attributes = "".join(f' {name}="{_escape(value)}"' for name, value in attrs.items())
+    return f"<{tag}{attributes}{'/' if close else ''}>"
+
+
+class RouteFileWriter:
+    """Writes a SUMO route file element by element, in the layout minidom's toprettyxml produced.
+
+    Only the current element is held in memory. Paths ending in .gz (or compress=True)
+    are written gzip-compressed.
+
+        with RouteFileWriter("persons.rou.xml") as out:
+            out.person({"id": "p_0", "depart": "3600"}, [("ride", {...}), ("stop", {...})])
+    """
+
+    def __init__(self, path, root="routes", root_attrs=ROUTES_SCHEMA, indent="    ",
+                 compress=None, buffer_size=1 << 20):
+        compress = str(path).endswith(".gz") if compress is None else compress
+        if compress:
+            self.file = gzip.open(path, "wt", encoding="utf-8")
+        else:
+            self.file = open(path, "w", encoding="utf-8", buffering=buffer_size)
+        self.root, self.root_attrs, self.indent = root, dict(root_attrs or {}), indent
+        self.count = 0
+        self.file.write('<?xml version="1.0" ?>\n')
+
+    def write(self, tag, attrs, children=()):
+        """Writes one top-level element with optional (tag, attrs) children."""
+        if self.count == 0:
+            self.file.write(_tag(self.root, self.root_attrs, close=False) + "\n")
+        if children:
+            lines = [self.indent + _tag(tag, attrs, close=False)]
+            lines += [self.indent * 2 + _tag(child, child_attrs, close=True) for child, child_attrs in children]
+            lines.append(f"{self.indent}</{tag}>")
+            self.file.write("\n".join(lines) + "\n")
+        else:
+            self.file.write(self.indent + _tag(tag, attrs, close=True) + "\n")
+        self.count += 1
+
+    def person(self, attrs, stages):
+        """Writes a <person> with its plan, e.g. [("ride", {...}), ("stop", {...})]."""
+        self.write("person", attrs, stages)
+
+    def close(self):
+        if self.count == 0:
+            self.file.write(_tag(self.root, self.root_attrs, close=True) + "\n")
+        else:
+            self.file.write(f"</{self.root}>\n")
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
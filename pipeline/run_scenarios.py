@@ -0,0 +1,185 @@
+"""Runs a matrix of headless SUMO scenarios in a bounded process pool.
+
+Every run gets its own output directory (all outputs of sumo.sumocfg are redirected there),
+and statistics.xml plus the tripinfo KPIs of all runs are collected into one results table.
+
+    python pipeline/run_scenarios.py --scenarios buses shuttles --seeds 1 2 3 \\
+        --algorithms greedy greedyShared --periods 1 30 --workers 32
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pipeline.sumo_output import read_person_stages, read_statistics, read_tripinfo
+from pipeline.tables import write_table
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+SCENARIOS = {"buses": REPO_ROOT / "buses_sumo", "shuttles": REPO_ROOT / "shuttles_sumo "}
+# Route files that stay fixed per scenario; the demand (persons) file is the one being varied
+FLEET_FILES = {"buses": "buses.rou.xml", "shuttles": "arts.rou.xml"}
+DEFAULT_DEMAND = "persons.rou.xml"
+# sumo.sumocfg output options, redirected into the run directory
+OUTPUTS = {
+    "tripinfo-output": "tripinfo.xml",
+    "summary-output": "summary.xml",
+    "statistic-output": "statistics.xml",
+    "emission-output": "emissions.xml",
+    "vehroute-output": "vehroutes.xml",
+}
+
+
+def find_sumo():
+    """The headless sumo binary: $SUMO_BINARY, sumo on PATH, or $SUMO_HOME/bin/sumo."""
+    binary = os.environ.get("SUMO_BINARY") or shutil.which("sumo")
+    if binary:
+        return binary
+    return os.path.join(os.environ.get("SUMO_HOME", "/usr/local/share/sumo"), "bin", "sumo")
+
+
+def build_matrix(scenarios, seeds, algorithms=(None,), periods=(None,), demands=(None,)):
+    """All run specs of the matrix. Dispatch algorithm and period only vary for the shuttle scenario."""
+    runs = []
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{scenario}' (expected one of {', '.join(SCENARIOS)})")
+        dispatch = itertools.product(algorithms, periods) if scenario == "shuttles" else [(None, None)]
+        for (algorithm, period), demand, seed in itertools.product(list(dispatch), demands, seeds):
+            parts = [scenario, algorithm, f"p{period:g}" if period is not None else None,
+                     Path(demand).stem if demand else None, f"s{seed}"]
+            runs.append({
+                "run_id": "_".join(str(p) for p in parts if p is not None),
+                "scenario": scenario, "seed": seed, "algorithm": algorithm, "period": period,
+                "demand": str(Path(demand).resolve()) if demand else DEFAULT_DEMAND,
+            })
+    return runs
+
+
+def sumo_command(run, run_dir, sumo_binary, outputs=OUTPUTS):
+    """Command line for one run; paths on the command line are absolute so runs are independent of cwd.
+
+    A run may carry its own "fleet" route file in place of the scenario's FLEET_FILES entry.
+    """
+    scenario_dir = SCENARIOS[run["scenario"]]
+    demand = Path(run["demand"])
+    demand = demand if demand.is_absolute() else scenario_dir / demand
+    fleet = run.get("fleet") or scenario_dir / FLEET_FILES[run["scenario"]]
+    cmd = [sumo_binary, "-c", str(scenario_dir / "sumo.sumocfg"),
+           "--seed", str(run["seed"]),
+           "--route-files", f"{fleet},{demand}",
+           "--no-step-log", "true"]
+    for option, name in outputs.items():
+        cmd += [f"--{option}", str(run_dir / name)]
+    if run["algorithm"] is not None:
+        cmd += ["--device.taxi.dispatch-algorithm", run["algorithm"]]
+    if run["period"] is not None:
+        cmd += ["--device.taxi.dispatch-period", f"{run['period']:g}"]
+    return cmd
+
+
+def collect_kpis(run_dir):
+    """statistics.xml (as 'section.attribute') plus person and vehicle KPIs from tripinfo.xml."""
+    kpis = {}
+    stats_file, tripinfo_file = run_dir / OUTPUTS["statistic-output"], run_dir / OUTPUTS["tripinfo-output"]
+    if stats_file.exists():
+        for section, values in read_statistics(stats_file).items():
+            kpis.update({f"{section}.{name}": value for name, value in values.items()})
+    if tripinfo_file.exists():
+        rides = read_person_stages(tripinfo_file, "ride", columns=["waitingTime", "duration", "routeLength"])
+        walks = read_person_stages(tripinfo_file, "walk", columns=["duration", "routeLength"])
+        vehicles = read_tripinfo(tripinfo_file, columns=["duration", "routeLength", "timeLoss"])
+        kpis.update({
+            "rides": len(rides),
+            "avg_ride_waiting_s": rides["waitingTime"].mean(),
+            "avg_in_vehicle_s": rides["duration"].mean(),
+            "avg_ride_travel_min": (rides["waitingTime"] + rides["duration"]).mean() / 60,
+            "passenger_km": rides["routeLength"].sum() / 1000,
+            "avg_walk_time_s": walks["duration"].mean(),
+            "avg_walk_distance_m": walks["routeLength"].mean(),
+            "vehicle_km": vehicles["routeLength"].sum() / 1000,
+            "avg_vehicle_time_loss_s": vehicles["timeLoss"].mean(),
+        })
+    return kpis
+
+
+def run_one(run, out_root, sumo_binary, timeout=None, resume=False):
+    """Runs one scenario in out_root/<run_id> and returns its results row (also saved as result.json)."""
+    run_dir = Path(out_root) / run["run_id"]
+    result_file = run_dir / "result.json"
+    if resume and result_file.exists():
+        with open(result_file) as f:
+            return json.load(f)
+
+    run_dir.mkdir(parents=True, exist_ok=True)
+    cmd = sumo_command(run, run_dir, sumo_binary)
+    start = time.perf_counter()
+    with open(run_dir / "sumo.log", "w") as log:
+        log.write(" ".join(cmd) + "\n")
+        log.flush()
+        try:
+            returncode, error = subprocess.run(cmd, cwd=run_dir, stdout=log, stderr=subprocess.STDOUT,
+                                               timeout=timeout).returncode, None
+        except subprocess.TimeoutExpired:
+            returncode, error = None, f"timeout after {timeout}s"
+    row = {**run, "returncode": returncode, "error": error, "wall_time_s": round(time.perf_counter() - start, 3)}
+    if returncode == 0:
+        row.update(collect_kpis(run_dir))
+        with open(result_file, "w") as f:
+            json.dump(row, f, indent=1)
+    return row
+
+
+def run_matrix(runs, out_root, workers=None, sumo_binary=None, timeout=None, resume=False):
+    """Runs all specs with at most `workers` concurrent sumo processes; rows come back in matrix order."""
+    sumo_binary = sumo_binary or find_sumo()
+    rows = [None] * len(runs)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(run_one, run, out_root, sumo_binary, timeout, resume): i
+                   for i, run in enumerate(runs)}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            try:
+                rows[i] = future.result()
+            except Exception as e:
+                rows[i] = {**runs[i], "returncode": None, "error": str(e)}
+            status = rows[i]["error"] or f"returncode {rows[i]['returncode']}"
+            print(f"[{done}/{len(runs)}] {runs[i]['run_id']}: {status}")
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--seeds", nargs="+", type=int, default=[42])
+    parser.add_argument("--algorithms", nargs="+", default=[None],
+                        help="taxi dispatch algorithms, e.g. greedy greedyShared (shuttles only; default: sumo.sumocfg)")
+    parser.add_argument("--periods", nargs="+", type=float, default=[None],
+                        help="taxi dispatch periods in seconds (shuttles only; default: sumo.sumocfg)")
+    parser.add_argument("--demand", nargs="+", default=[None],
+                        help="person route files replacing persons.rou.xml")
+    parser.add_argument("--out", default=str(REPO_ROOT / "runs"), help="root of the per-run output directories")
+    parser.add_argument("--workers", type=int, default=None, help="concurrent sumo processes (default: all cores)")
+    parser.add_argument("--sumo", default=None, help="sumo binary (default: $SUMO_BINARY, PATH or $SUMO_HOME)")
+    parser.add_argument("--timeout", type=float, default=None, help="per-run time limit in seconds")
+    parser.add_argument("--resume", action="store_true", help="reuse result.json of runs that already finished")
+    args = parser.parse_args(argv)
+
+    runs = build_matrix(args.scenarios, args.seeds, args.algorithms, args.periods, args.demand)
+    print(f"Running {len(runs)} scenarios into {args.out}")
+    results = run_matrix(runs, args.out, args.workers, args.sumo, args.timeout, args.resume)
+    path = write_table(results, Path(args.out) / "results.parquet")
+    print(f"Results of {len(results)} runs saved to: {path}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Scales the synthetic demand k times for stress tests, as bus and / or shuttle person route files.
+
+The personal plans (Step 5 output / the bus Step 1 input) are replicated: copy 0 is the original
+demand, copies r >= 1 get '_r{r}' appended to their ids and seeded jitter on departure time and home
+location. A fractional factor adds a random subset of one more copy. Persons can be capped to a
+departure time window. The person ids (t_<plan index>) are the same in both formats.
+
+    python pipeline/scale_demand.py --factor 5 --window 3600 10800 --formats buses shuttles
+    python pipeline/run_scenarios.py --demand runs/demand/shuttles_persons_x5.rou.xml --scenarios shuttles
+"""
+import argparse
+import importlib.util
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pipeline.edge_snapping import EdgeSnapper
+from pipeline.route_writer import RouteFileWriter
+from pipeline.run_scenarios import REPO_ROOT, SCENARIOS
+from pipeline.tables import read_table, write_table
+
+DEFAULT_PLANS = REPO_ROOT / "buses_sumo/Data/Step_1/personal_planes_from_4_step_model.parquet"
+FORMATS = ("buses", "shuttles")
+
+
+def _load_script(path, name):
+    """Imports one of the numbered pipeline scripts (file names are not valid module names)."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def scale_plans(plans, factor, seed=42, depart_jitter=300., origin_jitter=25., window=None):
+    """`factor` x the personal plans, indexed by person key ('12', '12_r1', ...).
+
+    Replicas (r >= 1) get a uniform departure shift of up to +-depart_jitter seconds and a normal
+    home offset with sd origin_jitter metres; the original copy is kept as is. `window` = (start, end)
+    keeps only persons leaving home in [start, end).
+    """
+    if factor <= 0:
+        raise ValueError(f"factor must be positive, got {factor}")
+    rng = np.random.default_rng(seed)
+    plans = plans.reset_index(drop=True)
+    keys = plans.index.astype(str)
+    copies = []
+    for r in range(math.ceil(factor)):
+        copy = plans.copy()
+        copy.index = keys if r == 0 else keys + f"_r{r}"
+        if r >= 1:
+            copy['home_departure_time'] = (copy['home_departure_time'].to_numpy(dtype=float)
+                                           + rng.uniform(-depart_jitter, depart_jitter, len(copy))).round().clip(min=0).astype(np.int64)
+            copy[['origin_x', 'origin_y']] = (copy[['origin_x', 'origin_y']].to_numpy(dtype=float)
+                                              + rng.normal(0., origin_jitter, (len(copy), 2)))
+        if r + 1 > factor:
+            # Last, partial copy: a random share of (factor - r) of the persons
+            copy = copy[rng.random(len(copy)) < factor - r]
+        copies.append(copy)
+    scaled = pd.concat(copies)
+
+    if window is not None:
+        start, end = window
+        depart = scaled['home_departure_time']
+        scaled = scaled[(depart >= start) & (depart < end)]
+    return scaled
+
+
+def write_bus_persons(plans, output_file):
+    """Bus persons (stop + ride per leg) through the Step 1 trip assignment and the Step 2 writer."""
+    bus_dir = SCENARIOS["buses"]
+    step_1 = _load_script(bus_dir / "Data/Step_1/1_trip_assignment_complete_with_reverse_path.py", "bus_step_1")
+    step_2 = _load_script(bus_dir / "Data/Step_2/3_Generate_perspn_xml_trips.py", "bus_step_2")
+    analyzer = step_1.PTAnalyzer(str(bus_dir / "network.net.xml"), str(bus_dir / "stops.add.xml"),
+                                 str(bus_dir / "buses.rou.xml"))
+    outbound, returns, _ = analyzer.assign_plans(plans)
+    no_route = (outbound['bus_id_selected'] == 'No Route').sum()
+    if no_route:
+        print(f"  {no_route} persons without a bus route are left out")
+    return step_2.write_persons(step_2.person_trips(outbound, returns), output_file)
+
+
+def write_shuttle_persons(plans, output_file):
+    """Shuttle round trips (taxi ride, shopping stop, taxi ride) in the format of Data/2_generate_persons_xml_roundtrip.py."""
+    snapper = EdgeSnapper.from_net(str(SCENARIOS["shuttles"] / "network.net.xml"))
+    home = plans[['origin_x', 'origin_y']].to_numpy(dtype=float)
+    shop = plans[['destination_x', 'destination_y']].to_numpy(dtype=float)
+    # Directional pickup edges (Data/1_Generate_trips_roundtrip.py) and the closest edge at the shop
+    edge_home_to_shop = snapper.snap_directional(home, shop, k=5)
+    edge_shop_to_home = snapper.snap_directional(shop, home, k=5)
+    shop_arrival_edge = snapper.snap(shop)
+    shop_time = plans['shopping time'] if 'shopping time' in plans.columns else pd.Series(0, index=plans.index)
+
+    order = np.argsort(plans['home_departure_time'].to_numpy(), kind='stable')
+    with RouteFileWriter(output_file, root_attrs=None) as routes:
+        for i in order:
+            routes.person({"id": f"t_{plans.index[i]}", "depart": str(round(plans['home_departure_time'].iat[i], 2)),
+                           "departPos": "0.0"}, [
+                ("ride", {"from": str(edge_home_to_shop[i]), "to": str(shop_arrival_edge[i]), "lines": "taxi"}),
+                ("stop", {"lane": f"{shop_arrival_edge[i]}_0", "duration": str(shop_time.iat[i])}),
+                ("ride", {"from": str(edge_shop_to_home[i]), "to": str(edge_home_to_shop[i]), "lines": "taxi"}),
+            ])
+    return routes.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plans", default=str(DEFAULT_PLANS),
+                        help="personal plans (.parquet/.xlsx), e.g. Step_5/results/personal_planes.parquet")
+    parser.add_argument("--factor", type=float, default=2., help="demand multiplier, may be fractional")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--depart-jitter", type=float, default=300., help="max departure shift of replicas [s]")
+    parser.add_argument("--origin-jitter", type=float, default=25., help="sd of the home offset of replicas [m]")
+    parser.add_argument("--window", nargs=2, type=float, metavar=("START", "END"), default=None,
+                        help="keep persons departing in [START, END) seconds")
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=FORMATS)
+    parser.add_argument("--out", default=str(REPO_ROOT / "runs" / "demand"), help="output directory")
+    args = parser.parse_args(argv)
+
+    plans = read_table(args.plans)
+    scaled = scale_plans(plans, args.factor, args.seed, args.depart_jitter, args.origin_jitter, args.window)
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    tag = f"x{args.factor:g}"
+    write_table(scaled.rename_axis('key').reset_index(), out / f"personal_planes_{tag}.parquet")
+    print(f"{len(scaled)} persons ({args.factor:g} x {len(plans)}) saved to: {out / f'personal_planes_{tag}.parquet'}")
+
+    writers = {"buses": write_bus_persons, "shuttles": write_shuttle_persons}
+    for fmt in args.formats:
+        path = out / f"{fmt}_persons_{tag}.rou.xml"
+        count = writers[fmt](scaled, path)
+        print(f"{fmt}: {count} persons saved to: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import gzip
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+
+def open_output(path):
+    """Opens a SUMO output file for reading, transparently handling gzip (.gz) files."""
+    path = str(path)
+    with open(path, 'rb') as f:
+        is_gzip = f.read(2) == b'\x1f\x8b'
+    return gzip.open(path, 'rb') if is_gzip else open(path, 'rb')
+
+
+def iter_records(path, tag):
+    """Yields each top-level <tag> element of a SUMO output file, freeing it once consumed."""
+    depth, root = 0, None
+    with open_output(path) as f:
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                root = elem if root is None else root
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                if elem.tag == tag:
+                    yield elem
+                root.clear()
+
+
+def _to_frame(records, columns=None):
+    """Collects attribute dicts column by column, then converts every column that fully parses as numbers."""
+    data = {name: [] for name in columns} if columns else {}
+    n = 0
+    for attrib in records:
+        if not columns:
+            for name in attrib:
+                if name not in data:
+                    data[name] = [None] * n
+        for name, values in data.items():
+            values.append(attrib.get(name))
+        n += 1
+
+    frame = {}
+    for name, values in data.items():
+        try:
+            frame[name] = np.array(values, dtype=float)
+        except (TypeError, ValueError):
+            frame[name] = np.array(values, dtype=object)
+    return pd.DataFrame(frame, columns=list(data))
+
+
+def read_tripinfo(path, columns=None):
+    """One row per vehicle <tripinfo>; only the given attribute columns are kept (all when None)."""
+    return _to_frame((elem.attrib for elem in iter_records(path, 'tripinfo')), columns)
+
+
+def read_person_stages(path, stage='ride', columns=None):
+    """One row per <stage> (ride, walk, stop, ...) of every <personinfo>, with the person id as 'person'."""
+    def records():
+        for person in iter_records(path, 'personinfo'):
+            for elem in person.iter(stage):
+                yield {'person': person.get('id'), **elem.attrib}
+    return _to_frame(records(), ['person'] + list(columns) if columns else None)
+
+
+def read_statistics(path):
+    """statistics.xml as {section: {attribute: value}}, numbers converted to float."""
+    stats = {}
+    with open_output(path) as f:
+        root = ET.parse(f).getroot()
+    for section in root:
+        values = {}
+        for name, value in section.attrib.items():
+            try:
+                values[name] = float(value)
+            except ValueError:
+                values[name] = value
+        stats[section.tag] = values
+    return stats
@@ -0,0 +1,58 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+
+# Set PIPELINE_EXPORT_EXCEL=1 to also write an .xlsx copy of every intermediate table (for reporting)
+EXPORT_EXCEL = os.environ.get("PIPELINE_EXPORT_EXCEL", "0") not in ("", "0")
+
+# Looked up in this order when the requested file does not exist (the repo ships .xlsx handoffs)
+FALLBACK_SUFFIXES = (".parquet", ".xlsx", ".csv")
+
+
+def resolve_table(path):
+    """The file read_table would load for `path`: the path itself, else the same stem as .parquet/.xlsx/.csv."""
+    path = Path(path)
+    if path.exists():
+        return path
+    for suffix in FALLBACK_SUFFIXES:
+        candidate = path.with_suffix(suffix)
+        if candidate.exists():
+            return candidate
+    raise FileNotFoundError(f"No table found for {path} (tried {', '.join(FALLBACK_SUFFIXES)})")
+
+
+def table_exists(path):
+    """os.path.exists for pipeline tables: True when read_table(path) would find a file."""
+    try:
+        resolve_table(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def read_table(path, **kwargs):
+    """Reads a pipeline table from Parquet, Excel or CSV, chosen by the resolved file suffix."""
+    path = resolve_table(path)
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path, **kwargs)
+    if path.suffix in (".xlsx", ".xls"):
+        return pd.read_excel(path, **kwargs)
+    return pd.read_csv(path, **kwargs)
+
+
+def write_table(df, path, excel=None):
+    """Writes a pipeline table as Parquet (or by suffix), plus an .xlsx export when requested."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".parquet":
+        # Parquet needs string column names (Step 4 headers come out of Excel as datetime.time)
+        df = df.rename(columns=str)
+        df.to_parquet(path, index=False)
+    elif path.suffix in (".xlsx", ".xls"):
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    if (EXPORT_EXCEL if excel is None else excel) and path.suffix != ".xlsx":
+        df.to_excel(path.with_suffix(".xlsx"), index=False)
+    return path
@@ -0,0 +1,177 @@
+"""Walking distances over the street network from any point to bus stops and edge midpoints.
+
+Points (homes, shops) are snapped once onto the nearest walkable edge shape, giving the straight
+walk to the snapped position and its offset along the edge. Shortest walks from every target (each
+bus stop and each edge midpoint, e.g. an ARTS pickup edge) to both ends of every edge come from one
+Dijkstra per target, seeded at the target's position on its edge. They are cached in .netcache next
+to the network. A point-to-target walk is then the cheaper way off the snapped edge:
+
+    lateral + min(offset + D[target, start], length - offset + D[target, end])
+
+(or the direct walk along the edge when the target lies on it), evaluated as array lookups for all
+points and targets at once.
+
+Edges are walkable in both directions and junctions are crossed in a straight line between edge
+ends (edge_matrix.walk_graph). By default every street can be walked. vclass="pedestrian"
+limits walking to edges that permit pedestrians in net.xml.
+"""
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pipeline.edge_matrix import _all_pairs, walk_graph
+from pipeline.net_cache import CACHE_DIR_NAME, file_hash, load_network
+
+WALK_VERSION = 1
+
+
+class SnappedPoints:
+    """Points snapped to the walk network: edge index, offset along it [m] and straight walk to it [m]."""
+
+    def __init__(self, edge, offset, lateral):
+        self.edge, self.offset, self.lateral = edge, offset, lateral
+
+    def __len__(self):
+        return len(self.edge)
+
+
+class WalkNetwork:
+    """Cached edge-end distances of all targets (bus stops first, then all edge midpoints)."""
+
+    CHUNK = 2048
+
+    def __init__(self, net, node_from, node_to, walkable, target_edge, target_offset, target_dist):
+        self.net = net
+        self.node_from, self.node_to = node_from, node_to
+        self.walkable = walkable
+        self.target_edge, self.target_offset, self.target_dist = target_edge, target_offset, target_dist
+        self.n_stops = len(getattr(net, 'stop_id', []))
+        self.stop_index = {sid: i for i, sid in enumerate(getattr(net, 'stop_id', np.array([])).tolist())}
+        self._segments()
+
+    @classmethod
+    def from_net(cls, net_file, stops_file=None, vclass=None, cache_dir=None):
+        """Loads the walk network, running the per-target Dijkstra only when the network changed."""
+        net = load_network(net_file, stops_file, cache_dir)
+        node_from = 2 * np.arange(len(net.edge_id))
+        node_to = node_from + 1
+        walkable = net.edge_allows(vclass) if vclass else np.ones(len(net.edge_id), dtype=bool)
+
+        # Targets: bus stops (middle of the stop on its lane), then every edge midpoint
+        stop_edge = net.lane_edge[net.stop_lane] if hasattr(net, 'stop_lane') else np.zeros(0, dtype=np.int64)
+        stop_offset = ((net.stop_start + net.stop_end) / 2) if hasattr(net, 'stop_lane') else np.zeros(0)
+        target_edge = np.concatenate([stop_edge, np.arange(len(net.edge_id))])
+        target_offset = np.concatenate([stop_offset, net.edge_length / 2]).clip(0, net.edge_length[target_edge])
+
+        key = file_hash(net_file) + (f"-{file_hash(stops_file)[:16]}" if stops_file else "") + f"-{vclass or 'all'}"
+        cache_dir = Path(cache_dir) if cache_dir else Path(net_file).resolve().parent / CACHE_DIR_NAME
+        path = cache_dir / f"walk-v{WALK_VERSION}-{key}.npy"
+        if path.exists():
+            target_dist = np.load(path, mmap_mode='r')
+        else:
+            target_dist = cls._target_distances(net, walkable, target_edge, target_offset)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp, 'wb') as f:
+                np.save(f, target_dist.astype(np.float32))
+            os.replace(tmp, path)
+            target_dist = np.load(path, mmap_mode='r')
+        return cls(net, node_from, node_to, walkable, target_edge, target_offset, target_dist)
+
+    @staticmethod
+    def _target_distances(net, walkable, target_edge, target_offset):
+        """(targets x edge ends) shortest walks; each target is a virtual source tied to both ends of its edge."""
+        n_nodes, tails, heads, weights = walk_graph(net, walkable)
+        length = net.edge_length
+        targets = np.flatnonzero(walkable[target_edge])
+        virtual = n_nodes + np.arange(len(targets))
+        edge, offset = target_edge[targets], target_offset[targets]
+        tails = np.concatenate([tails, virtual, virtual])
+        heads = np.concatenate([heads, 2 * edge, 2 * edge + 1])
+        weights = np.concatenate([weights, offset, length[edge] - offset])
+        dist = np.full((len(target_edge), n_nodes), np.inf)
+        if len(targets):
+            dist[targets] = _all_pairs(n_nodes + len(targets), tails, heads, weights, sources=virtual)[:, :n_nodes]
+        return dist
+
+    def _segments(self):
+        """Shape segments of the walkable edges (first lane), with their offset along the edge."""
+        net, starts, ends, edge, offset = self.net, [], [], [], []
+        for e in np.flatnonzero(self.walkable):
+            shape = net.edge_shape_xy(e)
+            seg_len = np.hypot(*(shape[1:] - shape[:-1]).T)
+            # Offsets along the shape, scaled to the edge length
+            scale = net.edge_length[e] / seg_len.sum() if seg_len.sum() > 0 else 0.
+            starts.append(shape[:-1])
+            ends.append(shape[1:])
+            edge.append(np.full(len(seg_len), e))
+            offset.append(np.r_[0., np.cumsum(seg_len)[:-1]] * scale)
+        self.seg_start = np.concatenate(starts) if starts else np.zeros((0, 2))
+        self.seg_end = np.concatenate(ends) if ends else np.zeros((0, 2))
+        self.seg_edge = np.concatenate(edge) if edge else np.zeros(0, dtype=np.int64)
+        self.seg_offset = np.concatenate(offset) if offset else np.zeros(0)
+        seg_vec = self.seg_end - self.seg_start
+        self.seg_len2 = (seg_vec ** 2).sum(axis=1)
+        length = net.edge_length[self.seg_edge]
+        shape_len = np.bincount(self.seg_edge, weights=np.sqrt(self.seg_len2), minlength=len(net.edge_id))
+        self.seg_scale = np.divide(length, shape_len[self.seg_edge], out=np.zeros(len(length)),
+                                   where=shape_len[self.seg_edge] > 0)
+
+    def snap(self, points_xy):
+        """Projects (n, 2) points onto the closest walkable edge shape."""
+        points_xy = np.atleast_2d(np.asarray(points_xy, dtype=float))
+        edge = np.full(len(points_xy), -1, dtype=np.int64)
+        offset, lateral = np.zeros(len(points_xy)), np.full(len(points_xy), np.inf)
+        if not len(self.seg_edge):
+            return SnappedPoints(edge, offset, lateral)
+        seg_vec = self.seg_end - self.seg_start
+        for lo in range(0, len(points_xy), self.CHUNK):
+            p = points_xy[lo:lo + self.CHUNK]
+            rel = p[:, None, :] - self.seg_start[None, :, :]
+            t = np.divide((rel * seg_vec).sum(axis=2), self.seg_len2, out=np.zeros((len(p), len(seg_vec))),
+                          where=self.seg_len2 > 0).clip(0, 1)
+            d = np.hypot(*(rel - t[:, :, None] * seg_vec).transpose(2, 0, 1))
+            best = d.argmin(axis=1)
+            rows = np.arange(len(p))
+            edge[lo:lo + len(p)] = self.seg_edge[best]
+            lateral[lo:lo + len(p)] = d[rows, best]
+            offset[lo:lo + len(p)] = (self.seg_offset[best]
+                                      + t[rows, best] * np.sqrt(self.seg_len2[best]) * self.seg_scale[best])
+        return SnappedPoints(edge, offset, lateral)
+
+    def _walk(self, snapped, targets, pairwise):
+        """Walk lengths from snapped points to target indices: (n, len(targets)), or (n,) when pairwise."""
+        if not isinstance(snapped, SnappedPoints):
+            snapped = self.snap(snapped)
+        targets = np.asarray(targets, dtype=np.int64)
+        e = snapped.edge.clip(min=0)
+        if pairwise:
+            pe, po, pl = e, snapped.offset, snapped.lateral
+            t = targets
+        else:
+            pe, po, pl = e[:, None], snapped.offset[:, None], snapped.lateral[:, None]
+            t = targets[None, :]
+        length = self.net.edge_length[pe]
+        via_from = po + self.target_dist[t, self.node_from[pe]]
+        via_to = length - po + self.target_dist[t, self.node_to[pe]]
+        walk = np.minimum(via_from, via_to)
+        same_edge = self.target_edge[t] == pe
+        walk = np.where(same_edge, np.minimum(walk, np.abs(po - self.target_offset[t])), walk) + pl
+        return np.where((snapped.edge < 0)[:, None] if not pairwise else snapped.edge < 0, np.inf, walk)
+
+    def stop_distances(self, points, stop_ids=None):
+        """(n, stops) walks from points (or SnappedPoints) to bus stops, in net.stop_id order or `stop_ids`."""
+        targets = np.arange(self.n_stops) if stop_ids is None else [self.stop_index[s] for s in stop_ids]
+        return self._walk(points, targets, pairwise=False)
+
+    def edge_distances(self, points, edge_ids, pairwise=False):
+        """Walks from points to edge midpoints: (n, len(edge_ids)), or (n,) point i to edge_ids[i] when pairwise.
+
+        Unknown edges give NaN.
+        """
+        index = np.array([self.net.edge_index.get(eid, -1) for eid in edge_ids], dtype=np.int64)
+        walk = self._walk(points, self.n_stops + index.clip(min=0), pairwise)
+        return np.where(index < 0, np.nan, walk)
@@ -1,16 +1,18 @@
-import sumolib
 import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from pipeline.net_cache import load_network
 
 def calculate_clean_average_distance(net_file):
     print(f"Loading network: {net_file}...")
-    net = sumolib.net.readNet(net_file)
+    net = load_network(net_file)
     
     lengths = []
     seen_base_ids = set()
 
-    for edge in net.getEdges():
-        edge_id = edge.getID()
-        length = edge.getLength()
+    for edge_id, length in zip(net.edge_id.tolist(), net.edge_length.tolist()):
         
         # 1. Strip direction markers to find the "base" road ID
         # Many SUMO networks use '-ID' or 'ID#0' for directions/segments
@@ -1,105 +1,135 @@
+import argparse
 import pandas as pd
-import xml.etree.ElementTree as ET
 import numpy as np
 import os
+import sys
+from pathlib import Path
 
-def calculate_walking_metrics(xml_file, net_file, od_file, walk_speed=1.1):
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pipeline.net_cache import load_network
+from pipeline.sumo_output import iter_records
+from pipeline.tables import read_table, table_exists, write_table
+from pipeline.walk_network import WalkNetwork
+
+def read_ride_edges(xml_file):
+    """Streams persons.rou.xml: person ids with the from/to edges of their first two rides (round trips only)."""
+    ids, edges = [], []
+    for person in iter_records(xml_file, 'person'):
+        rides = person.findall('ride')
+        # We need at least 2 rides (Round Trip) to calculate 4 walk segments
+        if len(rides) < 2:
+            continue
+        ids.append(person.get('id'))
+        edges.append((rides[0].get('from'), rides[0].get('to'), rides[1].get('from'), rides[1].get('to')))
+    return ids, edges
+
+
+def calculate_walking_metrics(xml_file, net_file, od_file, walk_speed=1.1, output_file=None, walk_metric='euclidean'):
+    """
+    Walk distances of every round trip: Home -> pickup, drop-off -> Shop, Shop -> pickup and
+    drop-off -> Home, each measured to the edge midpoint, in a straight line ('euclidean') or along
+    the streets ('network', pipeline/walk_network.py). Returns (per-person DataFrame, summary dict).
+    """
     # Check if files exist before starting
     for f in [xml_file, net_file, od_file]:
-        if not os.path.exists(f):
+        if not (table_exists(f) if f == od_file else os.path.exists(f)):
             print(f"Error: File not found -> {f}")
             return
 
     print("Loading data and parsing files...")
-    # 1. Load OD Coordinates
-    od_df = pd.read_excel(od_file)
+    # 1. Load OD Coordinates, indexed once by person id
+    od_df = read_table(od_file)
     od_df.columns = od_df.columns.str.strip()
-    
-    # 2. Parse Network to get Edge Midpoints
-    tree_net = ET.parse(net_file)
-    root_net = tree_net.getroot()
-    edge_coords = {}
-    for edge in root_net.findall('edge'):
-        eid = edge.get('id')
-        lane = edge.find('lane')
-        if lane is not None and lane.get('shape'):
-            shape = lane.get('shape').split(' ')
-            # Use midpoint of the shape for coordinate mapping
-            mid = shape[len(shape)//2].split(',')
-            edge_coords[eid] = (float(mid[0]), float(mid[1]))
-
-    # 3. Parse persons.rou.xml
-    tree_xml = ET.parse(xml_file)
-    root_xml = tree_xml.getroot()
-    
-    total_walk_dist = 0
-    total_people_processed = 0
-
-    print("Calculating distances...")
-    for person in root_xml.findall('person'):
-        pid = person.get('id')
-        rides = person.findall('ride')
-        
-        # We need at least 2 rides (Round Trip) to calculate 4 walk segments
-        if len(rides) < 2:
-            continue
+    od_df = od_df.drop_duplicates('id').set_index('id')
 
-        # Get coordinates from OD file for this person
-        row = od_df[od_df['id'] == pid]
-        if row.empty:
-            continue
-        
-        orig_xy = (row.iloc[0]['origin_x'], row.iloc[0]['origin_y'])
-        dest_xy = (row.iloc[0]['destination_x'], row.iloc[0]['destination_y'])
+    # 2. Edge Midpoints (middle vertex of the first lane shape) from the network cache
+    net = load_network(net_file)
 
-        # Stage 1: Home -> First Pickup Edge (Origin -> Start Edge)
-        e1 = rides[0].get('from')
-        # Stage 2: First Drop-off Edge -> Shop (End Edge -> Destination)
-        e2 = rides[0].get('to')
-  
+    # 3. Stream persons.rou.xml and join with the OD table
+    ids, edges = read_ride_edges(xml_file)
+    od = od_df.reindex(ids)
+    home = od[['origin_x', 'origin_y']].to_numpy(dtype=float)
+    shop = od[['destination_x', 'destination_y']].to_numpy(dtype=float)
 
-        person_dist = 0
-        valid_segments = 0
+    print("Calculating distances...")
+    # Segment k walks between start[k] and the midpoint of edge column k
+    edge_idx = np.array([[net.edge_index.get(e, -1) for e in row] for row in edges], dtype=np.int64).reshape(-1, 4)
+    if walk_metric == 'network':
+        # Homes and shops are snapped once; every segment is then a lookup in the cached walk distances
+        walk = WalkNetwork.from_net(net_file)
+        snapped = {'home': walk.snap(home), 'shop': walk.snap(shop)}
+        edge_ids = np.array(edges, dtype=object).reshape(-1, 4)
+        dist = np.column_stack([walk.edge_distances(snapped[start], edge_ids[:, k], pairwise=True)
+                                for k, start in enumerate(['home', 'shop', 'shop', 'home'])])
+        dist[~np.isfinite(dist)] = np.nan
+    else:
+        points = np.stack([home, shop, shop, home], axis=1)  # persons x 4 x 2
+        mids = net.edge_mid[edge_idx.clip(min=0)]
+        dist = np.hypot(*(points - mids).transpose(2, 0, 1))
+    dist[edge_idx < 0] = np.nan
 
-        for start_coord, edge_id in [(orig_xy, e1), (dest_xy, e2)]:
-            if edge_id in edge_coords:
-                dist = np.sqrt((start_coord[0] - edge_coords[edge_id][0])**2 + 
-                               (start_coord[1] - edge_coords[edge_id][1])**2)
-                person_dist += dist
-                valid_segments += 1
-        
-        if valid_segments > 0:
-            total_walk_dist += person_dist
-            total_people_processed += 1
+    valid_segments = np.isfinite(dist).sum(axis=1)
+    per_person = pd.DataFrame({
+        'id': ids,
+        'walk_home_to_pickup': dist[:, 0], 'walk_dropoff_to_shop': dist[:, 1],
+        'walk_shop_to_pickup': dist[:, 2], 'walk_dropoff_to_home': dist[:, 3],
+        'valid_segments': valid_segments,
+        'walk_dist': np.nansum(dist, axis=1),
+    })
+    per_person['walk_time'] = per_person['walk_dist'] / walk_speed
+    per_person = per_person[valid_segments > 0].reset_index(drop=True)
 
     # 4. Final Calculations
+    total_people_processed = len(per_person)
     if total_people_processed == 0:
         print("No valid person trips found to analyze.")
-        return
-
-    # Average distance a person walks in their ENTIRE day (all 4 segments)
-    avg_total_dist_per_person = total_walk_dist / total_people_processed
-    avg_total_time_per_person = avg_total_dist_per_person / walk_speed
+        return per_person, {}
 
-    # Average per single walk segment (distance to/from one taxi)
-    avg_dist_per_segment = total_walk_dist / (total_people_processed * 4)
-    avg_time_per_segment = avg_dist_per_segment / walk_speed
+    total_walk_dist = per_person['walk_dist'].sum()
+    total_segments = per_person['valid_segments'].sum()
+    summary = {
+        'persons': total_people_processed,
+        # Average distance a person walks in their ENTIRE day (all 4 segments)
+        'avg_total_walk_dist': total_walk_dist / total_people_processed,
+        'avg_total_walk_time': total_walk_dist / total_people_processed / walk_speed,
+        # Per trip (2 segments: to and from the taxi), comparable to the bus walk KPIs
+        'avg_trip_walk_dist': 2 * total_walk_dist / total_segments,
+        'avg_trip_walk_time': 2 * total_walk_dist / total_segments / walk_speed,
+        # Average per single walk segment (distance to/from one taxi)
+        'avg_segment_walk_dist': total_walk_dist / total_segments,
+        'avg_segment_walk_time': total_walk_dist / total_segments / walk_speed,
+    }
 
     print("\n" + "="*40)
     print("       WALKING ANALYSIS RESULTS")
     print("="*40)
-    print(f"Total Persons Analyzed    : {total_people_processed}")
+    print(f"Total Persons Analyzed    : {summary['persons']}")
+    print("-" * 40)
+    print(f"Avg Total Walk Dist [m]   : {summary['avg_total_walk_dist']:.2f}")
+    print(f"Avg Total Walk Time [s]   : {summary['avg_total_walk_time']:.2f}")
     print("-" * 40)
-    print(f"Avg Total Walk Dist [m]   : {avg_total_dist_per_person:.2f}")
-    print(f"Avg Total Walk Time [s]   : {avg_total_time_per_person:.2f}")
+    print(f"Avg per Trip Dist [m]     : {summary['avg_trip_walk_dist']:.2f}")
+    print(f"Avg per Trip Time [s]     : {summary['avg_trip_walk_time']:.2f}")
     print("-" * 40)
-    print(f"Avg per Segment Dist [m]  : {avg_dist_per_segment:.2f}")
-    print(f"Avg per Segment Time [s]  : {avg_time_per_segment:.2f}")
+    print(f"Avg per Segment Dist [m]  : {summary['avg_segment_walk_dist']:.2f}")
+    print(f"Avg per Segment Time [s]  : {summary['avg_segment_walk_time']:.2f}")
     print("="*40 + "\n")
 
-# RUN COMMAND: Ensure you are in the Arts_in_sumo folder
-calculate_walking_metrics(
-    xml_file='persons.rou.xml', 
-    net_file='network.net.xml', 
-    od_file='Data/od.xlsx'
-)
\ No newline at end of file
+    if output_file:
+        print(f"Per-person walks saved to: {write_table(per_person, output_file)}")
+    return per_person, summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Walk distances of the ARTS round trips")
+    parser.add_argument('--walk-metric', default='euclidean', choices=['euclidean', 'network'],
+                        help="straight line to the edge midpoint or along the street network")
+    args = parser.parse_args()
+
+    # RUN COMMAND: Ensure you are in the Arts_in_sumo folder
+    calculate_walking_metrics(
+        xml_file='persons.rou.xml',
+        net_file='network.net.xml',
+        od_file='Data/od.parquet',
+        output_file='output/walks.parquet',
+        walk_metric=args.walk_metric
+    )
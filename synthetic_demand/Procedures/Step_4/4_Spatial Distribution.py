@@ -1,23 +1,55 @@
-import pandas as pd
 import numpy as np
 import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[3]))
+from pipeline.tables import read_table, write_table
+
+# Attraction weight of each destination: the ground area of its buildings | Gravity approch
+DEFAULT_DESTINATIONS = [
+    ("local", 7825.4),       # the ground area for building exist in local center
+    ("district", 22925.227), # the ground area for 4 building in district center
+]
+
+
+def hamilton_round(totals, weights):
+    """
+    Distributes integer totals across bins defined by weights using the Largest
+    Remainder Method (Hamilton method), vectorized over all leading axes.
+    `weights` (..., bins) broadcasts against `totals` (...); rows whose weights
+    sum to 0 get all zeros.
+    """
+    weights = np.nan_to_num(np.asarray(weights, dtype=float))
+    totals = np.rint(np.nan_to_num(np.asarray(totals, dtype=float)))[..., None]
+    weight_sum = weights.sum(axis=-1, keepdims=True)
+
+    # 1. Scale weights to sum to the total, 2. floor to get the initial allocation
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scaled = np.where(weight_sum > 0, (weights / weight_sum) * totals, 0.)
+    ints = np.floor(scaled).astype(np.int64)
+
+    # 3. Missing remainder per row (0 where the weights sum to 0)
+    remainder = np.where(weight_sum[..., 0] > 0, totals[..., 0] - ints.sum(axis=-1), 0).astype(np.int64)
+
+    # 4. Add 1 to the `remainder` bins with the highest fractional parts
+    # (row-wise argsort with the default kind, so equal fractions break ties as the per-row loop did)
+    order = np.argsort(scaled - ints, axis=-1)[..., ::-1]
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.broadcast_to(np.arange(order.shape[-1]), order.shape), axis=-1)
+    return ints + (rank < remainder[..., None])
+
 
 class TripDistributor:
-    def __init__(self, input_file="Data_From_Step_3.xlsx"):
-        # Load the data
-        if input_file.endswith('.xlsx'):
-            self.df = pd.read_excel(input_file)
-        else:
-            self.df = pd.read_csv(input_file)
-        
-        # Define proportions
-        area_local = 7825.4 # the ground area for building exist in local center | Gravity approch 
-        area_district = 22925.227 # the ground area for 4 building in district center | Gravity approch 
-        total_area = area_local + area_district
-        
-        self.prop_local = area_local / total_area
-        self.prop_district = area_district / total_area
-        
+    def __init__(self, input_file="Data_From_Step_3.xlsx", destinations=DEFAULT_DESTINATIONS):
+        # Load the data (.parquet, .xlsx or .csv)
+        self.df = read_table(input_file)
+
+        # Define proportions from the attraction weights
+        self.destinations = [name for name, _ in destinations]
+        weights = np.array([weight for _, weight in destinations], dtype=float)
+        self.proportions = weights / weights.sum()
+
         # Column definitions
         self.name_col = self.df.columns[0]
         self.total_col = self.df.columns[1]  # The 'agents' column
@@ -25,94 +57,42 @@ class TripDistributor:
 
     def distribute_integers(self, target_total, weights):
         """
-        Distributes a target integer total across bins defined by weights 
+        Distributes a target integer total across bins defined by weights
         using the Largest Remainder Method (Hamilton method).
         """
-        target_total = int(round(target_total))
-        
-        # Handle edge case where total is 0
-        if target_total == 0:
-            return np.zeros(len(weights), dtype=int)
-            
-        weights = weights.astype(float)
-        weight_sum = weights.sum()
-        
-        # If weights are all 0 but we have a total to distribute, 
-        # we can't distribute proportionally. Return zeros (or handle as error).
-        if weight_sum == 0:
-            return np.zeros(len(weights), dtype=int)
-            
-        # 1. Scale weights to sum to the target_total
-        scaled = (weights / weight_sum) * target_total
-        
-        # 2. Floor to get initial integer allocation
-        ints = np.floor(scaled).astype(int)
-        
-        # 3. Calculate the missing remainder
-        remainder = target_total - ints.sum()
-        
-        # 4. Distribute remainder to the bins with the highest fractional parts
-        if remainder > 0:
-            fractions = scaled - ints
-            # Get indices sorted by fraction descending
-            order = np.argsort(fractions)[::-1]
-            # Add 1 to the top 'remainder' bins
-            ints[order[:remainder]] += 1
-            
-        return ints
-
-    def process_and_save(self):
-        # Create copies for output
-        local_df = self.df.copy()
-        district_df = self.df.copy()
-        
-        # Iterate over every row to calculate splits based on the row's Total
-        for index, row in self.df.iterrows():
-            # Get the total agents for this block (e.g., 59)
-            original_total = row[self.total_col]
-            if pd.isna(original_total):
-                original_total = 0
-            
-            # Round original total to nearest integer to define our "pie"
-            N = int(round(original_total))
-            
-            # Calculate how many go to Local vs District
-            # e.g., 59 * 0.12 = 7.3 -> 7
-            n_local = int(round(N * self.prop_local))
-            # District gets the rest to ensure Sum = N
-            n_district = N - n_local
-            
-            # Get the hourly weights (the shape of the traffic)
-            weights = row[self.hour_cols].values
-            # Handle NaNs in weights
-            weights = np.nan_to_num(weights)
-            
-            # Distribute the calculated totals across the hours
-            local_hourly_trips = self.distribute_integers(n_local, weights)
-            district_hourly_trips = self.distribute_integers(n_district, weights)
-            
-            # Assign back to the dataframes
-            local_df.loc[index, self.hour_cols] = local_hourly_trips
-            district_df.loc[index, self.hour_cols] = district_hourly_trips
-            
-            # Update the total column to match the new sum of hours
-            local_df.loc[index, self.total_col] = n_local
-            district_df.loc[index, self.total_col] = n_district
-
-        # Define output paths
-        output_dir = "results"
+        return hamilton_round(target_total, weights)
+
+    def distribute(self):
+        """
+        Splits every zone's agents over the destinations and then over the
+        hours, for the whole zone x hour matrix at once. Returns {destination: DataFrame}.
+        """
+        # Round each zone's total to the nearest integer to define our "pie"
+        totals = np.rint(np.nan_to_num(self.df[self.total_col].to_numpy(dtype=float)))
+
+        # How many go to each destination (zones x destinations), e.g. 59 -> 7 local + 52 district
+        per_destination = hamilton_round(totals, self.proportions)
+
+        # The hourly weights (the shape of the traffic), distributed per destination
+        hourly = np.nan_to_num(self.df[self.hour_cols].to_numpy(dtype=float))
+        trips = hamilton_round(per_destination, hourly[:, None, :])  # zones x destinations x hours
+
+        results = {}
+        for d, name in enumerate(self.destinations):
+            out = self.df.copy()
+            out[self.total_col] = per_destination[:, d]
+            out[list(self.hour_cols)] = trips[:, d, :]
+            results[name] = out
+        return results
+
+    def process_and_save(self, output_dir="results"):
         os.makedirs(output_dir, exist_ok=True)
-        
-        local_path = os.path.join(output_dir, "trips_local_center.xlsx")
-        district_path = os.path.join(output_dir, "trips_district_center.xlsx")
-
-        # Save to Excel
-        local_df.to_excel(local_path, index=False)
-        district_df.to_excel(district_path, index=False)
-        
-        print(f"Distribution complete.")
-        print(f"- Local Center saved to: {local_path}")
-        print(f"- District Center saved to: {district_path}")
+
+        # Save as Parquet (set PIPELINE_EXPORT_EXCEL=1 for an .xlsx copy)
+        for name, df in self.distribute().items():
+            path = write_table(df, os.path.join(output_dir, f"trips_{name}_center.parquet"))
+            print(f"- {name.capitalize()} Center saved to: {path}")
+        print("Distribution complete.")
 
 if __name__ == "__main__":
     distributor = TripDistributor("Data_From_Step_3.xlsx")
@@ -1,96 +1,118 @@
+import argparse
+import numpy as np
 import pandas as pd
-import random
-
-# 1. Load the home locations data
-try:
-    homes_df = pd.read_excel('data_homes_locations.xlsx')
-except Exception:
-    homes_df = pd.read_csv('data_homes_locations.xlsx - Sheet1.csv')
-
-# Clean the coordinate column
-coord_col = [col for col in homes_df.columns if 'x,y' in col][0]
-homes_df[['x', 'y']] = homes_df[coord_col].str.split(',', expand=True).astype(float)
-
-# Clean block names (strip spaces) to ensure matching works
-homes_df['name_block'] = homes_df['name_block'].astype(str).str.strip()
-houses_by_block = {name: group.to_dict('records') for name, group in homes_df.groupby('name_block')}
-
-# 2. Load Attractions Data (New Step)
-# We read the destination coordinates from this file instead of the trips file
-attractions_df = pd.read_excel('Attractions_Sumo_Coordinates.xlsx')
-
-# Create a dictionary for easy lookup: {'local': {'x': 210, 'y': -125}, ...}
-# We normalize the name to lowercase just in case
-attractions_map = {}
-for _, row in attractions_df.iterrows():
-    name_key = str(row['name']).lower().strip()
-    attractions_map[name_key] = (row['x'], row['y'])
-
-def process_trips(df, dest_name, dest_key, houses_dict, attr_map):
-    records = []
-    
-    # Get the X, Y for this destination from our attractions map
-    # dest_key should be 'local' or 'district' to match your file
-    dest_x, dest_y = attr_map.get(dest_key, (0, 0))
-    
-    # Fix: Matches Excel time format "07:00:00" instead of "7:00"
-    time_cols = [f"{h:02d}:00:00" for h in range(7, 22)]
-    
-    for _, row in df.iterrows():
-        block_name = str(row['name']).strip()
-        available_houses = houses_dict.get(block_name, [])
-        
-        if not available_houses:
-            continue
-            
-        for col in time_cols:
-            # Safety check if column exists
-            if col not in df.columns:
-                continue
-                
-            count = int(row[col])
-            if count > 0:
-                hour = int(col.split(':')[0])
-                for _ in range(count):
-                    selected_house = random.choice(available_houses)
-                    random_sec = random.randint(0, 3599)
-                    departure_time = (hour - 6) * 3600 + random_sec
-                    
-                    record = {
-                        'name_block': block_name,
-                        'house_id': selected_house['house_id'],
-                        'origin_x': selected_house['x'],
-                        'origin_y': selected_house['y'],
-                        'home_departure_time': departure_time,
-                        'name_destination': dest_name,
-                        'destination_x': dest_x, # Uses coordinates from attractions file
-                        'destination_y': dest_y, # Uses coordinates from attractions file
-                        'shopping time': 1140
-                    }
-                    records.append(record)
-    return records
-
-# 3. Load trip data
-# Correctly pointing to results_from_step_4
-df_local = pd.read_excel('results_from_step_4/trips_local_center.xlsx')
-df_district = pd.read_excel('results_from_step_4/trips_district_center.xlsx')
-
-# Fix: Ensure columns are strings so we can find "07:00:00"
-df_local.columns = df_local.columns.astype(str)
-df_district.columns = df_district.columns.astype(str)
-
-# 4. Process both datasets
-# We pass 'local' and 'district' as keys to find coordinates in the attractions_map
-all_records = process_trips(df_local, "Local Center", "local", houses_by_block, attractions_map) + \
-              process_trips(df_district, "District Center", "district", houses_by_block, attractions_map)
-
-# 5. Create Final DataFrame and add person_id
-final_df = pd.DataFrame(all_records)
-if not final_df.empty:
-    final_df.insert(0, 'person_id', range(1, len(final_df) + 1))
-    print(f"Success! Generated {len(final_df)} plans.")
-else:
-    print("Warning: No plans generated. Check if block names match between files.")
-
-# 6. Save to Excel
-final_df.to_excel('results/personal_planes.xlsx', index=False)
\ No newline at end of file
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[3]))
+from pipeline.tables import read_table, write_table
+
+# Fix: Matches Excel time format "07:00:00" instead of "7:00"
+TIME_COLS = [f"{h:02d}:00:00" for h in range(7, 22)]
+SHOPPING_TIME = 1140
+
+# Trips of each Step 4 table, with its destination name and key in the attractions file
+TRIP_TABLES = [
+    ('results_from_step_4/trips_local_center.parquet', "Local Center", "local"),
+    ('results_from_step_4/trips_district_center.parquet', "District Center", "district"),
+]
+
+
+def load_homes():
+    """Home locations with parsed x, y and stripped block names, grouped by block (file order within a block)."""
+    try:
+        homes_df = read_table('data_homes_locations.xlsx')
+    except Exception:
+        homes_df = pd.read_csv('data_homes_locations.xlsx - Sheet1.csv')
+
+    # Clean the coordinate column
+    coord_col = [col for col in homes_df.columns if 'x,y' in col][0]
+    homes_df[['x', 'y']] = homes_df[coord_col].str.split(',', expand=True).astype(float)
+
+    # Clean block names (strip spaces) to ensure matching works
+    homes_df['name_block'] = homes_df['name_block'].astype(str).str.strip()
+    return homes_df.sort_values('name_block', kind='stable').reset_index(drop=True)
+
+
+def load_attractions():
+    """{'local': (210, -125), ...}: destination coordinates keyed by the lowercase attraction name."""
+    attractions_df = read_table('Attractions_Sumo_Coordinates.xlsx')
+    names = attractions_df['name'].astype(str).str.lower().str.strip()
+    return dict(zip(names, zip(attractions_df['x'], attractions_df['y'])))
+
+
+def expand_trips(df, homes_df):
+    """
+    One entry per trip of a zone x hour table, in row -> hour -> trip order:
+    (zone block names, departure hours, first home row of the block, homes in the block).
+    Zones without homes are skipped.
+    """
+    # Fix: Ensure columns are strings so we can find "07:00:00"
+    df = df.rename(columns=str)
+    time_cols = [col for col in TIME_COLS if col in df.columns]
+    # Step 4 tables end with a total row without a name; it matches no block
+    blocks = df['name'].fillna('').astype(str).str.strip().to_numpy()
+
+    block_names, block_start, block_size = np.unique(homes_df['name_block'].to_numpy(), return_index=True,
+                                                     return_counts=True)
+    pos = np.searchsorted(block_names, blocks).clip(max=len(block_names) - 1)
+    has_homes = block_names[pos] == blocks if len(block_names) else np.zeros(len(blocks), dtype=bool)
+
+    counts = np.nan_to_num(df[time_cols].to_numpy(dtype=float)).astype(np.int64).clip(min=0)
+    counts[~has_homes] = 0
+    hours = np.array([int(col.split(':')[0]) for col in time_cols])
+
+    zone = np.repeat(np.arange(len(df)), counts.sum(axis=1))
+    hour = np.repeat(np.tile(hours, len(df)), counts.ravel())
+    return blocks[zone], hour, block_start[pos[zone]], block_size[pos[zone]]
+
+
+def generate_plans(trip_tables, homes_df, attractions, rng):
+    """Personal plans of all trip tables: homes and departure seconds drawn in bulk from `rng`."""
+    frames = []
+    for df, dest_name, dest_key in trip_tables:
+        blocks, hour, start, size = expand_trips(df, homes_df)
+        house = start + rng.integers(0, size)
+        random_sec = rng.integers(0, 3600, size=len(hour))
+        dest_x, dest_y = attractions.get(dest_key, (0, 0))
+        frames.append(pd.DataFrame({
+            'name_block': blocks,
+            'house_id': homes_df['house_id'].to_numpy()[house],
+            'origin_x': homes_df['x'].to_numpy()[house],
+            'origin_y': homes_df['y'].to_numpy()[house],
+            'home_departure_time': (hour - 6) * 3600 + random_sec,
+            'name_destination': dest_name,
+            'destination_x': dest_x, # Uses coordinates from attractions file
+            'destination_y': dest_y, # Uses coordinates from attractions file
+            'shopping time': SHOPPING_TIME,
+        }))
+    final_df = pd.concat(frames, ignore_index=True)
+    final_df.insert(0, 'person_id', np.arange(1, len(final_df) + 1))
+    return final_df
+
+
+def generate_samples(n_samples=1, seed=42):
+    """`n_samples` independent demand samples, each from its own child of SeedSequence(seed)."""
+    homes_df = load_homes()
+    attractions = load_attractions()
+    trip_tables = [(read_table(path), dest_name, dest_key) for path, dest_name, dest_key in TRIP_TABLES]
+    return [generate_plans(trip_tables, homes_df, attractions, np.random.default_rng(child))
+            for child in np.random.SeedSequence(seed).spawn(n_samples)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Step 5: convert the Step 4 trip tables to personal plans")
+    parser.add_argument('--seed', type=int, default=42, help="seed of the demand samples")
+    parser.add_argument('--samples', type=int, default=1,
+                        help="number of independent samples (saved as personal_planes_<k>.parquet when > 1)")
+    args = parser.parse_args()
+
+    for k, final_df in enumerate(generate_samples(args.samples, args.seed)):
+        if final_df.empty:
+            print("Warning: No plans generated. Check if block names match between files.")
+        else:
+            print(f"Success! Generated {len(final_df)} plans.")
+
+        # Save as Parquet (set PIPELINE_EXPORT_EXCEL=1 for an .xlsx copy)
+        name = 'personal_planes' if args.samples == 1 else f'personal_planes_{k}'
+        write_table(final_df, f'results/{name}.parquet')